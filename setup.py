@@ -137,6 +137,7 @@ setup(
     [turbogears.visit.manager]
     sqlobject = turbogears.visit.sovisit:SqlObjectVisitManager
     sqlalchemy = turbogears.visit.savisit:SqlAlchemyVisitManager
+    shared = turbogears.visit.sharedvisit:SharedVisitManager
 
     [turbogears.toolboxcommand]
     widgets = turbogears.toolbox.base:WidgetBrowser
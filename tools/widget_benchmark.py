@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Compare the rendering paths of widgets.
+
+Renders a TableForm, a DataGrid and a SingleSelectField to a string, once
+by serializing the element tree returned by display() (which is what render()
+did before) and once with the direct serialization done by render(). Then the
+widgets are embedded in a Kid page template, once as the element tree
+returned by display() and once as the recorded output of a cacheable widget.
+
+Usage: widget_benchmark.py [fields [rows [options [repetitions]]]]
+
+"""
+
+import sys
+import time
+
+import kid
+
+from turbogears import view, widgets
+from turbogears.widgets.base import PlainHTML, Fragment
+
+
+class Row(object):
+
+    def __init__(self, number):
+        self.number = number
+        self.name = "Row <%d>" % number
+        self.price = number * 1.5
+
+
+def best_time(func, repetitions):
+    """Return the best time of several runs of func in milliseconds."""
+    best = None
+    for n in range(repetitions):
+        start = time.time()
+        func()
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best * 1000
+
+
+def main(fields=60, rows=1000, options=500, repetitions=10):
+    if 'kid' not in view.engines:
+        view.load_engines()
+    form = widgets.TableForm(fields=[widgets.TextField("field%d" % n,
+        label="Field %d" % n) for n in range(fields)])
+    grid = widgets.DataGrid(fields=[("Number", "number"), ("Name", "name"),
+        ("Price", "price")])
+    page = kid.load_template("""<html xmlns:py="http://purl.org/kid/ns#">
+        <body>${widget}</body></html>""", name='widget_benchmark_page')
+    select = widgets.SingleSelectField("select",
+        options=[(n, "Option %d" % n) for n in range(options)])
+    cases = [("TableForm (%d fields)" % fields, form, None),
+        ("DataGrid (%d rows)" % rows, grid, [Row(n) for n in range(rows)]),
+        ("Select (%d options)" % options, select, 1)]
+    print "%-24s %12s %12s %12s %12s" % ("widget",
+        "tree", "render", "embed", "embed cached")
+    for title, widget, value in cases:
+        timings = [
+            best_time(lambda: PlainHTML(elements=widget.display(value)
+                ).serialize(output='html', fragment=True), repetitions),
+            best_time(lambda: widget.render(value), repetitions),
+            best_time(lambda: page.Template(widget=widget.display(value)
+                ).serialize(output='html'), repetitions)]
+        if isinstance(widget.display(value, cacheable=True), Fragment):
+            timings.append("%9.1f ms" % best_time(lambda: page.Template(
+                widget=widget.display(value, cacheable=True)
+                ).serialize(output='html'), repetitions))
+        else:
+            # the widget gets parameters which cannot be cached
+            timings.append("not cacheable")
+        print "%-24s %9.1f ms %9.1f ms %9.1f ms %12s" % tuple(
+            [title] + timings)
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
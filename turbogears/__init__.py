@@ -16,6 +16,7 @@ from turbogears.widgets import mochikit
 from turbogears.widgets import jsi18nwidget
 from turbogears.config import update_config
 from turbogears.paginate import paginate
+from turbogears.cache import cache_page
 
 from turbogears.startup import start_server
 
@@ -0,0 +1,190 @@
+"""Caching of complete responses for exposed controller methods.
+
+The cache_page decorator stores the final output of an exposed method, i.e.
+the rendered template or JSON string, and serves it again without calling
+the controller method or the template engine as long as it is fresh::
+
+    class Root(controllers.RootController):
+
+        [turbogears.cache_page(ttl=300)]
+        [turbogears.expose("myapp.templates.dashboard")]
+        def dashboard(self):
+            ...
+
+The decorator must be placed above the expose decorator(s). Every cached page
+is delivered with a strong ETag, and a matching If-None-Match request header
+is answered with "304 Not Modified" before the controller method is called.
+
+"""
+
+import logging
+import md5
+import threading
+
+import cherrypy
+
+from turbogears import config
+from turbogears.decorator import weak_signature_decorator
+from turbogears.i18n.utils import get_locale
+from turbogears.util import load_class, simplify_http_accept_header, \
+    LRUCache
+
+log = logging.getLogger("turbogears.cache")
+
+__all__ = ["cache_page", "MemoryPageCache", "get_page_cache"]
+
+
+class MemoryPageCache(LRUCache):
+    """A simple page cache backend keeping the pages in process memory.
+
+    A page cache backend must provide the methods get(key) and
+    set(key, value, ttl). Keys and cached values are plain strings or
+    (nested) tuples of strings, so that backends can easily be implemented
+    on top of external caches like memcached. This backend keeps at most
+    size pages, discarding the least recently used ones.
+
+    """
+
+    def __init__(self, size=None):
+        if size is None:
+            size = config.get("cache_page.size", 1000)
+        LRUCache.__init__(self, size)
+
+    def delete(self, key):
+        """Remove the value cached for the key."""
+        self.remove(key)
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+def get_page_cache():
+    """Return the page cache backend configured with cache_page.backend.
+
+    The setting is the dotted path of the backend class, which is
+    instantiated without arguments when the first page is cached.
+
+    """
+    global _page_cache
+    if _page_cache is None:
+        _page_cache_lock.acquire()
+        try:
+            if _page_cache is None:
+                backend = config.get("cache_page.backend")
+                if backend:
+                    cls = load_class(backend)
+                    if cls is None:
+                        raise ValueError(
+                            "Page cache backend %s not found" % backend)
+                else:
+                    cls = MemoryPageCache
+                _page_cache = cls()
+        finally:
+            _page_cache_lock.release()
+    return _page_cache
+
+
+def page_key(vary=None):
+    """Compute the cache key for the page requested by the current request.
+
+    The key is made of the path, the request parameters (including tg_format),
+    the accepted content type and the locale. With vary set to "user" or
+    "groups", the user name or the groups of the current identity are
+    included as well.
+
+    """
+    request = cherrypy.request
+    params = request.params.items()
+    params.sort()
+    key = [request.path, repr(params), simplify_http_accept_header(
+        request.headers.get("Accept", "").lower()), str(get_locale())]
+    if vary:
+        from turbogears import identity
+        try:
+            current = identity.current
+            if vary == "user":
+                key.append(repr(current.user_name))
+            else:
+                groups = list(current.groups)
+                groups.sort()
+                key.append(repr(groups))
+        except identity.IdentityException:
+            pass
+    return "page:%s" % md5.new("\n".join(key)).hexdigest()
+
+
+# response headers which are not stored with a cached page
+_uncached_headers = ("Content-Length", "Date", "Etag", "Set-Cookie")
+
+def etag_matches(header, etag):
+    """Check whether the If-None-Match header matches the given ETag."""
+    if not header:
+        return False
+    header = header.strip()
+    if header == "*":
+        return True
+    return etag in [tag.strip() for tag in header.split(",")]
+
+
+def cache_page(ttl=None, vary=None, backend=None):
+    """Cache the output of an exposed method.
+
+    @param ttl: number of seconds a page stays in the cache
+        (default: the cache_page.ttl setting or 60)
+    @param vary: None to share cached pages among all users, "user" to cache
+        pages per user or "groups" to cache pages per set of groups
+    @param backend: the page cache backend to use
+        (default: the one configured with cache_page.backend)
+
+    Only successful GET and HEAD requests with string output are cached.
+    The cached page is served with the response headers of the original
+    response, except for Content-Length, Date, ETag and Set-Cookie. Pages
+    setting cookies or requested with a pending flash message are passed
+    through unchanged. Note that decorators below cache_page, such as
+    identity.require, are not run when a cached page is served, so pages
+    restricted to certain users should be cached with vary set accordingly.
+
+    """
+    if vary not in (None, "user", "groups"):
+        raise ValueError("vary must be None, 'user' or 'groups'")
+
+    def entangle(func):
+        def decorated(func, *args, **kw):
+            request, response = cherrypy.request, cherrypy.response
+            if request.method not in ("GET", "HEAD") or \
+                    "tg_flash" in request.simple_cookie:
+                return func(*args, **kw)
+            cache = backend
+            if cache is None:
+                cache = get_page_cache()
+            key = page_key(vary)
+            page = cache.get(key)
+            if page is None:
+                cookies = response.simple_cookie.output()
+                output = func(*args, **kw)
+                if not isinstance(output, str) \
+                        or response.simple_cookie.output() != cookies \
+                        or str(response.status or 200)[:3] != "200":
+                    return output
+                headers = [(str(name), str(value))
+                    for name, value in response.headers.iteritems()
+                    if str(name).title() not in _uncached_headers]
+                headers.sort()
+                page = (output, tuple(headers),
+                    '"%s"' % md5.new(output).hexdigest())
+                if ttl is None:
+                    cache.set(key, page, config.get("cache_page.ttl", 60))
+                else:
+                    cache.set(key, page, ttl)
+            else:
+                log.debug("Serving %s from the page cache", request.path)
+            body, headers, etag = page
+            for name, value in headers:
+                response.headers[name] = value
+            response.headers["ETag"] = etag
+            if etag_matches(request.headers.get("If-None-Match"), etag):
+                response.status = 304
+                return ""
+            return body
+        return decorated
+    return weak_signature_decorator(entangle)
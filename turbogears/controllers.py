@@ -29,8 +29,98 @@ if config.get("session_filter.on", None):
     # support for mysql/sqlite/etc here
 
 
+_include_widgets_cache = None
+
+
+def _has_static_resources(widget):
+    """Check whether the JS/CSS resources of a widget never change.
+
+    This is the case if the widget uses the stock implementations of
+    retrieve_javascript and retrieve_css which only collect the resources
+    declared at the widget and its member widgets.
+
+    """
+    from turbogears.widgets import Widget, CompoundWidget, set_with_self
+    static_retrievers = (set_with_self,
+        Widget.retrieve_javascript.im_func, Widget.retrieve_css.im_func,
+        CompoundWidget.retrieve_javascript.im_func,
+        CompoundWidget.retrieve_css.im_func)
+    for retrieve in 'retrieve_javascript', 'retrieve_css':
+        retrieve = getattr(widget.__class__, retrieve, None)
+        if getattr(retrieve, 'im_func', retrieve) not in static_retrievers:
+            return False
+    iter_member_widgets = getattr(widget, 'iter_member_widgets', None)
+    if iter_member_widgets:
+        for member in iter_member_widgets():
+            if not _has_static_resources(member):
+                return False
+    return True
+
+
+def _add_resources(widget, css, js):
+    """Add the JS/CSS resources of a widget to the given collections."""
+    from turbogears.widgets import js_location
+    retrieve = getattr(widget, "retrieve_css", None)
+    if callable(retrieve):
+        css.add_all(retrieve())
+    retrieve = getattr(widget, "retrieve_javascript", None)
+    if callable(retrieve):
+        for script in retrieve():
+            if hasattr(script, "location"):
+                js[script.location].add(script)
+            else:
+                js[js_location.head].add(script)
+
+
+def _get_include_widgets():
+    """Get the widgets included everywhere via tg.include_widgets.
+
+    Returns a tuple (include_widgets, css, js, dynamic) with the dict of
+    widgets to be added to the output, the collected static CSS and JS
+    resources of these widgets and a list of the widgets with dynamic
+    resources which must be collected on every request. In order to keep
+    the order of the resources, all widgets following the first widget
+    with dynamic resources are put in that list as well.
+
+    The result is cached and computed again only when the configuration
+    of the included widgets has been changed.
+
+    """
+    global _include_widgets_cache
+    include_widgets_lst = config.get("tg.include_widgets", [])
+    mochikit_all = config.get("tg.mochikit_all", False)
+    key = (tuple(include_widgets_lst), bool(mochikit_all))
+    cache = _include_widgets_cache
+    if cache is not None and cache[0] == key:
+        return cache[1]
+
+    from turbogears.widgets import js_location
+
+    include_widgets_lst = list(include_widgets_lst)
+    if mochikit_all:
+        include_widgets_lst.insert(0, 'turbogears.mochikit')
+
+    css = tg_util.setlike()
+    js = dict(izip(js_location, iter(tg_util.setlike, None)))
+    include_widgets = {}
+    dynamic = []
+    for i in include_widgets_lst:
+        widget = tg_util.load_class(i)
+        if isclass(widget):
+            widget = widget()
+        include_widgets["tg_%s" % i.split(".")[-1]] = widget
+        if not dynamic and _has_static_resources(widget):
+            _add_resources(widget, css, js)
+        else:
+            dynamic.append(widget)
+
+    result = include_widgets, css, js, dynamic
+    _include_widgets_cache = key, result
+    return result
+
+
 def _process_output(output, template, format, content_type,
-        mapping, fragment=False):
+        mapping, fragment=False, stream=False):
     """Produce final output form from data returned from a controller method.
 
     See the expose() arguments for more info since they are the same.
@@ -39,39 +129,16 @@ def _process_output(output, template, format, content_type,
     if isinstance(output, dict):
         from turbogears.widgets import js_location
 
-        css = tg_util.setlike()
-        js = dict(izip(js_location, iter(tg_util.setlike, None)))
-        include_widgets = {}
-        include_widgets_lst = config.get("tg.include_widgets", [])
-
-        if config.get("tg.mochikit_all", False):
-            include_widgets_lst.insert(0, 'turbogears.mochikit')
-
-        for i in include_widgets_lst:
-            widget = tg_util.load_class(i)
-            if isclass(widget):
-                widget = widget()
-            include_widgets["tg_%s" % i.split(".")[-1]] = widget
-            for script in widget.retrieve_javascript():
-                if hasattr(script, "location"):
-                    js[script.location].add(script)
-                else:
-                    js[js_location.head].add(script)
-            css.add_all(widget.retrieve_css())
+        include_widgets, static_css, static_js, dynamic = \
+            _get_include_widgets()
+        css = tg_util.setlike(static_css)
+        js = dict([(location, tg_util.setlike(static_js[location]))
+            for location in js_location])
 
+        for widget in dynamic:
+            _add_resources(widget, css, js)
         for value in output.itervalues():
-            if hasattr(value, "retrieve_css"):
-                retrieve = getattr(value, "retrieve_css")
-                if callable(retrieve):
-                    css.add_all(value.retrieve_css())
-            if hasattr(value, "retrieve_javascript"):
-                retrieve = getattr(value, "retrieve_javascript")
-                if callable(retrieve):
-                    for script in value.retrieve_javascript():
-                        if hasattr(script, "location"):
-                            js[script.location].add(script)
-                        else:
-                            js[js_location.head].add(script)
+            _add_resources(value, css, js)
         output.update(include_widgets)
         output["tg_css"] = css
         for location in iter(js_location):
@@ -82,9 +149,17 @@ def _process_output(output, template, format, content_type,
             output["tg_flash"] = tg_flash
 
         headers = {'Content-Type': content_type}
-        output = view.render(output, template=template, format=format,
-                    mapping=mapping, headers=headers,
-                    fragment=fragment)
+        if stream:
+            # lets widgets like the DataGrid render their output lazily
+            request.tg_stream = True
+            output = view.render_stream(output, template=template,
+                        format=format, mapping=mapping, headers=headers,
+                        fragment=fragment)
+            _stream_response()
+        else:
+            output = view.render(output, template=template, format=format,
+                        mapping=mapping, headers=headers,
+                        fragment=fragment)
         content_type = headers['Content-Type']
 
     if content_type:
@@ -99,6 +174,35 @@ def _process_output(output, template, format, content_type,
     return output
 
 
+def _stream_response():
+    """Let CherryPy send the response body of this request chunk by chunk.
+
+    CherryPy collects the response body unless the stream_response setting
+    is true. Since the settings are shared by all requests, the setting is
+    not changed, but the response of the current request is finalized
+    without collecting its body instead.
+
+    """
+    cherrypy.response.finalize = _finalize_streamed_response
+
+def _finalize_streamed_response():
+    """Finalize the current response like CherryPy with stream_response."""
+    response = cherrypy.serving.response
+    finalize = response.__class__.finalize
+    if request.method == "OPTIONS" \
+            or response.headers.get("Content-Length") is not None:
+        finalize(response)
+        return
+    # CherryPy does not collect the body if the length is already known
+    response.headers["Content-Length"] = 0
+    try:
+        finalize(response)
+    finally:
+        response.headers.pop("Content-Length", None)
+    response.header_list = [header for header in response.header_list
+        if header[0] != "Content-Length"]
+
+
 class BadFormatError(Exception):
     """Output-format exception."""
 
@@ -213,8 +317,11 @@ class CustomDispatch(functions.GenericFunction):
         return primary
 
 
-def _add_rule(_expose, found_default, as_format, accept_format, template,
-              rulefunc):
+_json_accept_formats = ("application/json", "text/javascript")
+
+
+def _rule_format(found_default, as_format, template):
+    """Return the effective as_format of a rule and the new found_default."""
     if as_format == "default":
         if found_default:
             colon = template.find(":")
@@ -224,6 +331,12 @@ def _add_rule(_expose, found_default, as_format, accept_format, template,
                 as_format = template[:colon]
         else:
             found_default = True
+    return as_format, found_default
+
+
+def _add_rule(_expose, found_default, as_format, accept_format, template,
+              rulefunc):
+    as_format, found_default = _rule_format(found_default, as_format, template)
     ruleparts = ['kw.get("tg_format", "default") == "%s"' % as_format]
     if accept_format:
         ruleparts.append('(accept == "%s" and kw.get("tg_format"'
@@ -235,7 +348,13 @@ def _add_rule(_expose, found_default, as_format, accept_format, template,
     return found_default
 
 
-def _build_rules(func):
+def _json_rulefunc(_func, accept, allow_json, *args, **kw):
+    return _execute_func(_func, "json", "json", "application/json",
+        None, False, args, kw)
+
+
+def _build_generic_rules(func):
+    """Build the RuleDispatch generic function for an exposed method."""
     [generic(CustomDispatch)]
     def _expose(func, accept, allow_json, *args, **kw):
         pass
@@ -246,21 +365,110 @@ def _build_rules(func):
             ' or accept in ("application/json", "text/javascript"))')
         _expose.when('allow_json and (kw.get("tg_format", None) == "json"'
             ' or accept in ("application/json", "text/javascript"))')(
-            lambda _func, accept, allow_json, *args, **kw:
-                _execute_func(_func, "json", "json", "application/json",
-                    None, False, args, kw))
+            _json_rulefunc)
 
     found_default = False
     for ruleinfo in func._ruleinfo:
         found_default = _add_rule(_expose, found_default, **ruleinfo)
 
+    return _expose
+
+
+def _rule_key(value):
+    """Return value as a dispatch table key or None if not expressible.
+
+    The generated rules compare against the string representation of the
+    value, so that is what we use as key as well. Values containing quotes
+    or backslashes would change the meaning of the rule expression and
+    must therefore be handled by the generic function.
+
+    """
+    key = "%s" % value
+    if '"' in key or '\\' in key:
+        return None
+    return key
+
+
+def _build_dispatch_table(func):
+    """Compile the rules of an exposed method into dictionary lookups.
+
+    Returns a tuple (formats, accepts) where formats maps the value of the
+    tg_format parameter and accepts maps the simplified Accept header (only
+    used when no tg_format has been requested) to the rule function.
+    Returns None if some rule cannot be expressed as a key.
+
+    For identical conditions the rule declared first wins, and rules
+    matching the Accept header take precedence over the default rule,
+    exactly as with the generic function.
+
+    """
+    formats, accepts = {}, {}
+    found_default = False
+    for ruleinfo in func._ruleinfo:
+        as_format, found_default = _rule_format(found_default,
+            ruleinfo['as_format'], ruleinfo['template'])
+        key = _rule_key(as_format)
+        if key is None:
+            return None
+        formats.setdefault(key, ruleinfo['rulefunc'])
+        accept_format = ruleinfo['accept_format']
+        if accept_format:
+            key = _rule_key(accept_format)
+            if key is None:
+                return None
+            accepts.setdefault(key, ruleinfo['rulefunc'])
+    return formats, accepts
+
+
+def _build_rules(func):
+    """Build the dispatcher choosing the output format of an exposed method.
+
+    Normally, the rules are compiled once into a dispatch table, so that
+    choosing the rule for a request is a plain dictionary lookup. We only
+    fall back to the RuleDispatch generic function when a rule cannot be
+    expressed as a key or the request does not match any key.
+
+    """
+    table = _build_dispatch_table(func)
+    if table is None:
+        log.debug("Using generic function for dispatching %s", func)
+        func._expose = _build_generic_rules(func)
+        return
+
+    formats, accepts = table
+    json_rule = func._allow_json
+    generic_rules = []
+
+    def fallback(func, accept, allow_json, *args, **kw):
+        if not generic_rules:
+            generic_rules.append(_build_generic_rules(func))
+        return generic_rules[0](func, accept, allow_json, *args, **kw)
+
+    def _expose(func, accept, allow_json, *args, **kw):
+        tg_format = kw.get("tg_format", "default")
+        try:
+            if json_rule and allow_json and (tg_format == "json"
+                    or accept in _json_accept_formats):
+                rulefunc = _json_rulefunc
+            else:
+                rulefunc = None
+                if tg_format == "default":
+                    rulefunc = accepts.get(accept)
+                if rulefunc is None:
+                    rulefunc = formats.get(tg_format)
+        except TypeError: # unhashable parameter
+            rulefunc = None
+        if rulefunc is None:
+            rulefunc = fallback
+        return rulefunc(func, accept, allow_json, *args, **kw)
+
     func._expose = _expose
 
 
 def expose(template=None, validators=None, allow_json=None, html=None,
            format=None, content_type=None, inputform=None, fragment=False,
            as_format="default", mapping=None, accept_format=None,
-           exclude_from_memory_profiling=False):
+           exclude_from_memory_profiling=False, stream=False):
     """Exposes a method to the web.
 
     By putting the expose decorator on a method, you tell TurboGears that
@@ -327,6 +535,12 @@ def expose(template=None, validators=None, allow_json=None, html=None,
             input to this method
     @keyparam exclude_from_memory_profiling allows to exclude individual end points from memory profiling. Can be
             used for performance or in case profiling generates errors
+    @keyparam stream if True, the template output is sent to the client
+            chunk by chunk while it is rendered (only with Kid and Genshi),
+            instead of rendering the whole page before sending it.
+            Headers cannot be changed while the template is rendered,
+            and the template runs after the database transaction has
+            been committed.
     """
     if html:
         template = html
@@ -370,7 +584,7 @@ def expose(template=None, validators=None, allow_json=None, html=None,
             accept_format=accept_format, template=template,
             rulefunc = lambda _func, accept, allow_json, *args, **kw:
                 _execute_func(_func, template, format, content_type,
-                    mapping, fragment, args, kw)))
+                    mapping, fragment, args, kw, stream)))
 
         if allow_json:
             func._allow_json = True
@@ -394,7 +608,8 @@ def _run_with_transaction(accept, args, func, kw):
              *args, **kw)
 
 
-def _execute_func(func, template, format, content_type, mapping, fragment, args, kw):
+def _execute_func(func, template, format, content_type, mapping, fragment, args, kw,
+        stream=False):
     """Call controller method and process it's output."""
     if config.get("tg.strict_parameters", False):
         tg_util.remove_keys(kw, ["tg_random", "tg_format"]
@@ -423,7 +638,8 @@ def _execute_func(func, template, format, content_type, mapping, fragment, args,
         format = output.pop("tg_format", format)
     if template and template.startswith("."):
         template = func.__module__[:func.__module__.rfind('.')]+template
-    return _process_output(output, template, format, content_type, mapping, fragment)
+    return _process_output(output, template, format, content_type, mapping, fragment,
+        stream)
 
 
 def flash(message):
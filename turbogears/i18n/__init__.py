@@ -3,7 +3,8 @@ TurboGears internationalization/localization module.
 """
 
 from turbogears.i18n.tg_gettext import gettext, ngettext, install, \
-    is_locale_supported, lazy_gettext, lazy_ngettext, plain_gettext
+    is_locale_supported, lazy_gettext, lazy_ngettext, plain_gettext, \
+    preload_catalogs, reload_catalogs, catalog_stats
 from turbogears.i18n.utils import get_locale, get_accept_languages, \
     set_session_locale, google_translate
 from turbogears.i18n.format import get_countries, get_country, \
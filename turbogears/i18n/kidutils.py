@@ -6,7 +6,7 @@ from kid.parser import START, TEXT, END
 import turbogears
 # use plain_gettext because Kid template's strings always evaluated immediately
 from turbogears.i18n.tg_gettext import plain_gettext as gettext
-from turbogears.i18n.utils import google_translate
+from turbogears.i18n.utils import get_locale, google_translate
 
 def translate(item, attr=None):
     """Translates the text of element plus the text of all child elements. If attr is present
@@ -66,6 +66,8 @@ def i18n_filter(stream, template, locale=None):
     """
 
     lang_attr = turbogears.config.get("i18n.templateLocaleAttribute", "lang")
+    # determine the locale only once instead of for every text
+    locale = get_locale(locale)
     locales=[locale]
 
     for ev, item in stream:
@@ -1,5 +1,12 @@
 
+import os
+import shutil
+import tempfile
+
+from turbogears import config
 from turbogears.i18n.tg_gettext import *
+from turbogears.i18n.tg_gettext import _catalogs, _resolved_catalogs, \
+    get_resolved_catalog
 from turbogears.i18n.tests import setup_module
 
 def test_gettext():
@@ -21,6 +28,66 @@ def test_gettext_unsupported_locale():
     assert unicode(gettext("Welcome", "en-gb")) == "Welcome"
     assert unicode(gettext("Welcome", "de")) == "Welcome"
 
+def test_resolved_catalog():
+    catalog = get_resolved_catalog("fi_FI")
+    assert catalog is not None
+    assert get_resolved_catalog("fi_FI") is catalog
+    assert get_resolved_catalog("fi") is catalog
+    assert get_resolved_catalog("de") is None
+    assert get_resolved_catalog("fi", "fubar") is None
+
+def test_resolved_catalogs_bounded():
+    # the requested locales come from the clients
+    for n in range(_resolved_catalogs.size + 10):
+        get_resolved_catalog("fi_%d" % n)
+    assert len(_resolved_catalogs) <= _resolved_catalogs.size
+    assert get_resolved_catalog("fi_FI") is get_catalog("fi")
+
+def test_reload_modified_catalogs():
+    locale_dir = config.get("i18n.locale_dir")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tmp_locale_dir = os.path.join(tmp_dir, "locale")
+        shutil.copytree(locale_dir, tmp_locale_dir)
+        config.update({"i18n.locale_dir": tmp_locale_dir,
+            "i18n.reload_catalogs": True})
+        assert unicode(gettext("Welcome", "fi")) == "Tervetuloa"
+        mo_file = os.path.join(tmp_locale_dir, "fi", "LC_MESSAGES",
+            "messages.mo")
+        shutil.copy(os.path.join(tmp_locale_dir, "en", "LC_MESSAGES",
+            "messages.mo"), mo_file)
+        mtime = os.stat(mo_file).st_mtime + 10
+        os.utime(mo_file, (mtime, mtime))
+        assert unicode(gettext("Welcome", "fi")) == "Welcome"
+    finally:
+        config.update({"i18n.locale_dir": locale_dir,
+            "i18n.reload_catalogs": False})
+        _catalogs.get("messages", {}).pop("fi", None)
+        shutil.rmtree(tmp_dir)
+
+def test_preload_catalogs():
+    _catalogs.get("messages", {}).pop("fi", None)
+    preload_catalogs(["fi", "de"])
+    assert "fi" in _catalogs["messages"]
+    assert "de" not in _catalogs["messages"]
+
+def test_reload_catalogs():
+    reload_catalogs()
+    catalog = get_catalog("fi")
+    assert get_resolved_catalog("fi") is catalog
+    reload_catalogs()
+    assert get_catalog("fi") is not catalog
+    assert get_resolved_catalog("fi") is get_catalog("fi")
+    assert unicode(gettext("Welcome", "fi")) == "Tervetuloa"
+
+def test_catalog_stats():
+    get_catalog("fi")
+    gettext("Welcome", "fi")
+    stats = dict([((domain, locale), (messages, size, hits))
+        for domain, locale, messages, size, hits in catalog_stats()])
+    messages, size, hits = stats[("messages", "fi")]
+    assert messages > 0 and size > 0 and hits > 0
+
 def test_ngettext(): 
     assert ngettext("You have %i apple", \
             "You have %i apples", 1) %1 == "You have 1 apple"
@@ -1,13 +1,30 @@
+import errno
+import logging
 import os
 import sys
-from gettext import translation
+import threading
+from gettext import find, GNUTranslations
 
 from turbogears import config
-from turbogears.util import get_package_name, request_available
+from turbogears.util import get_package_name, request_available, LRUCache
 from turbogears.i18n.utils import get_locale
 from turbojson.jsonify import jsonify
 
+log = logging.getLogger("turbogears.i18n")
+
+# loaded catalogs by domain and locale
 _catalogs = {}
+# locks serializing the loading of catalogs by domain and locale
+_catalog_locks = {}
+_catalog_locks_lock = threading.Lock()
+# number of translations looked up in the catalogs by domain and locale
+# (these are not exact, since they are not counted under a lock)
+_catalog_hits = {}
+
+# catalog, path and modification time of the .mo file and the key of the
+# catalog by locale directory, default domain, domain and requested locale
+# (the requested locales come from the clients, so their number is bounded)
+_resolved_catalogs = LRUCache(1000)
 
 def get_locale_dir():
     localedir = config.get("i18n.locale_dir")
@@ -27,24 +44,173 @@ def is_locale_supported(locale, domain=None):
     return localedir and os.path.exists(os.path.join(
         localedir, locale, "LC_MESSAGES", "%s.mo" % domain))
 
+def _load_catalog(domain, locale, localedir):
+    """Load the translations for the locale from the .mo files."""
+    catalog = None
+    for path in find(domain, localedir, [locale], all=True):
+        fp = open(path, 'rb')
+        try:
+            translations = GNUTranslations(fp)
+        finally:
+            fp.close()
+        if catalog is None:
+            catalog = translations
+        else:
+            catalog.add_fallback(translations)
+    if catalog is None:
+        raise IOError(errno.ENOENT,
+            "No translation file found for domain", domain)
+    return catalog
+
 def get_catalog(locale, domain = None):
-    """Return translations for given locale."""
+    """Return translations for given locale.
+
+    The catalog is loaded only once, even if it is requested by several
+    threads at the same time.
+
+    """
     if not domain:
         domain = config.get("i18n.domain", "messages")
 
     catalog = _catalogs.get(domain)
 
-    if not catalog:
-        catalog = _catalogs[domain] = {}
+    if catalog is None:
+        catalog = _catalogs.setdefault(domain, {})
 
     messages = catalog.get(locale)
     if not messages:
-        localedir = get_locale_dir()
-        messages = catalog[locale] = translation(domain=domain,
-            localedir=localedir, languages=[locale])
+        key = (domain, locale)
+        _catalog_locks_lock.acquire()
+        try:
+            lock = _catalog_locks.get(key)
+            if lock is None:
+                lock = _catalog_locks[key] = threading.Lock()
+        finally:
+            _catalog_locks_lock.release()
+        lock.acquire()
+        try:
+            messages = catalog.get(locale)
+            if not messages:
+                messages = catalog[locale] = _load_catalog(
+                    domain, locale, get_locale_dir())
+        finally:
+            lock.release()
 
     return messages
 
+def preload_catalogs(locales=None, domain=None):
+    """Load the catalogs for the given locales.
+
+    If no locales are given, the locales set as i18n.preload_catalogs
+    are loaded, or all locales found in the locale directory if this
+    setting is not a list.
+
+    """
+    if not domain:
+        domain = config.get("i18n.domain", "messages")
+    if locales is None:
+        locales = config.get("i18n.preload_catalogs", None)
+        if not isinstance(locales, (list, tuple)):
+            localedir = get_locale_dir()
+            if localedir and os.path.isdir(localedir):
+                locales = [locale for locale in os.listdir(localedir)
+                    if is_locale_supported(locale, domain)]
+            else:
+                locales = []
+    for locale in locales:
+        try:
+            get_catalog(locale, domain)
+        except IOError:
+            log.warning("No message catalog for locale %s found", locale)
+
+def reload_catalogs():
+    """Reload all loaded catalogs, e.g. after they have been recompiled.
+
+    The catalogs of every domain are replaced at once, translations which
+    are already in progress still use the old catalogs.
+
+    """
+    localedir = get_locale_dir()
+    for domain, catalog in _catalogs.items():
+        new_catalog = {}
+        for locale in catalog.keys():
+            try:
+                new_catalog[locale] = _load_catalog(domain, locale, localedir)
+            except IOError:
+                log.warning("Message catalog for locale %s has been removed",
+                    locale)
+        _catalogs[domain] = new_catalog
+    _resolved_catalogs.clear()
+
+def catalog_stats():
+    """Return statistics about the loaded catalogs.
+
+    Returns a list of (domain, locale, messages, size, hits) tuples, where
+    size is the approximate memory used by the messages in bytes and hits
+    is the number of translations looked up in the catalog.
+
+    """
+    stats = []
+    for domain, catalog in _catalogs.items():
+        for locale, translations in catalog.items():
+            messages = size = 0
+            while translations is not None:
+                translated = getattr(translations, '_catalog', {})
+                messages += len(translated)
+                size += sys.getsizeof(translated)
+                for item in translated.iteritems():
+                    size += sys.getsizeof(item[0]) + sys.getsizeof(item[1])
+                translations = getattr(translations, '_fallback', None)
+            stats.append((domain, locale, messages, size,
+                _catalog_hits.get((domain, locale), 0)))
+    stats.sort()
+    return stats
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def get_resolved_catalog(locale, domain=None):
+    """Return translations for the given locale or None if there are none.
+
+    If the locale is not supported, the language part of the locale is used.
+    The catalog found for the requested locale is cached, so that the file
+    system is not searched on every translation. If i18n.reload_catalogs
+    is set (useful in development), catalogs are reloaded when their
+    .mo file has been modified.
+
+    """
+    default_domain = config.get("i18n.domain", "messages")
+    if not domain:
+        domain = default_domain
+    localedir = get_locale_dir()
+    key = (localedir, default_domain, domain, locale)
+    entry = _resolved_catalogs.get(key)
+    if entry is not None:
+        if not config.get("i18n.reload_catalogs", False) or (
+                entry[1] and _mtime(entry[1]) == entry[2]):
+            if entry[0] is not None:
+                hits_key = entry[3]
+                _catalog_hits[hits_key] = _catalog_hits.get(hits_key, 0) + 1
+            return entry[0]
+    if not is_locale_supported(locale):
+        locale = locale[:2]
+    path = localedir and find(domain, localedir, [locale])
+    mtime = path and _mtime(path)
+    try:
+        if entry is not None and path and path == entry[1]:
+            # the .mo file has been modified
+            catalog = _load_catalog(domain, locale, localedir)
+            _catalogs.setdefault(domain, {})[locale] = catalog
+        else:
+            catalog = get_catalog(locale, domain)
+    except IOError:
+        catalog = None
+    _resolved_catalogs.set(key, (catalog, path, mtime, (domain, locale)))
+    return catalog
+
 def plain_gettext(key, locale=None, domain=None):
     """Get the gettext value for key.
 
@@ -70,16 +236,15 @@ def tg_gettext(key, locale=None, domain=None):
     """
     if locale is None:
         locale = get_locale()
-    if not is_locale_supported(locale):
-        locale = locale[:2]
     if key == '':
         return '' # special case
+    catalog = get_resolved_catalog(locale, domain)
+    if catalog is None:
+        return key
     try:
-        return get_catalog(locale, domain).ugettext(key)
+        return catalog.ugettext(key)
     except KeyError:
         return key
-    except IOError:
-        return key
 
 def plain_ngettext(key1, key2, num, locale=None):
     """Translate two possible texts based on whether num is greater than 1.
@@ -69,8 +69,13 @@ def get_locale(locale=None):
     Returns user locale, using _get_locale or app-specific locale lookup function.
     """
     if not locale:
-        get_locale_f = config.get("i18n.get_locale", _get_locale)
-        locale = get_locale_f()
+        # the locale of the request is only computed once per request
+        locale = getattr(cherrypy.request, "tg_locale", None)
+        if not locale:
+            get_locale_f = config.get("i18n.get_locale", _get_locale)
+            locale = get_locale_f()
+            if request_available():
+                cherrypy.request.tg_locale = locale
     return locale
 
 def _get_locale():
@@ -110,3 +115,5 @@ def set_session_locale(locale):
     Raises an error if session support is not enabled.
     """
     cherrypy.session[config.get("i18n.session_key", "locale")] = locale
+    if request_available():
+        cherrypy.request.tg_locale = locale
@@ -132,6 +132,79 @@ def set_current_provider( provider ):
     cherrypy.request.identityProvider = provider
 
 
+class IdentitySnapshot(object):
+    """Snapshot of the data of an authenticated identity.
+
+    Snapshots are cached by visit key, so that the identity predicates can
+    be checked without querying the database on every request.
+
+    """
+    __slots__ = ('user_id', 'user_name', 'groups', 'group_ids', 'permissions')
+
+    def __init__(self, identity):
+        self.user_id = identity.user_id
+        self.user_name = identity.user_name
+        self.groups = frozenset(identity.groups)
+        self.group_ids = frozenset(identity.group_ids)
+        self.permissions = frozenset(identity.permissions)
+
+
+_identity_cache = None
+
+def create_identity_cache():
+    """Create the cache for identity snapshots according to the config.
+
+    The cache keeps the snapshots of up to 'identity.cache.size' visits
+    (the default of 0 disables caching) for 'identity.cache.ttl' seconds.
+
+    """
+    global _identity_cache
+    from turbogears.visit.api import VisitCache
+    get = turbogears.config.get
+    size = int(get('identity.cache.size', 0))
+    if size > 0:
+        _identity_cache = VisitCache(size,
+            float(get('identity.cache.ttl', 60)))
+    else:
+        _identity_cache = None
+    return _identity_cache
+
+
+def get_identity_cache():
+    """Return the cache for identity snapshots or None if disabled."""
+    return _identity_cache
+
+
+def get_identity_snapshot(identity):
+    """Get the cached snapshot of the given identity.
+
+    Returns None if identity caching is disabled or the visit has no
+    authenticated user. The snapshot will be cached if not yet done.
+    This is used as the snapshot property of the identity classes.
+
+    """
+    try:
+        return identity._snapshot
+    except AttributeError:
+        pass
+    # While the snapshot is taken, the properties must not use it.
+    identity._snapshot = None
+    cache = _identity_cache
+    if cache is not None and identity.visit_key is not None:
+        snapshot = cache.get(identity.visit_key)
+        if snapshot is None and identity.user:
+            snapshot = IdentitySnapshot(identity)
+            cache.set(identity.visit_key, snapshot)
+        identity._snapshot = snapshot
+    return identity._snapshot
+
+
+def invalidate_identity(visit_key):
+    """Remove the cached identity snapshot for the given visit key."""
+    if _identity_cache is not None and visit_key is not None:
+        _identity_cache.remove(visit_key)
+
+
 from turbogears.identity.conditions import *
 
 def _encrypt_password(algorithm, password):
@@ -176,4 +249,5 @@ __all__ = [ 'IdentityManagementNotEnabledException',
     'set_current_identity', 'set_current_provider',
     'set_identity_errors', 'get_identity_errors',
     'was_login_attempted', 'encrypt_password',
-    'get_failure_url']
+    'get_failure_url', 'IdentitySnapshot', 'create_identity_cache',
+    'get_identity_cache', 'get_identity_snapshot', 'invalidate_identity']
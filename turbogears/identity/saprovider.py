@@ -28,6 +28,8 @@ class SqlAlchemyIdentity(object):
         self.visit_key = visit_key
         if user:
             self._user = user
+            # do not cache the identity before the login has been committed
+            self._snapshot = None
             if visit_key is not None:
                 self.login()
 
@@ -40,13 +42,22 @@ class SqlAlchemyIdentity(object):
             pass
         # Attempt to load the user. After this code executes, there *will* be
         # a _user attribute, even if the value is None.
+        snapshot = getattr(self, '_snapshot', None)
+        if snapshot is not None:
+            self._user = user_class.query.get(snapshot.user_id)
+            return self._user
         visit = self.visit_link
         self._user = visit and user_class.query.get(visit.user_id)
         return self._user
     user = property(_get_user)
 
+    snapshot = property(identity.get_identity_snapshot)
+
     def _get_user_name(self):
         """Get user name of this identity."""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.user_name
         if not self.user:
             return None
         return self.user.user_name
@@ -54,6 +65,9 @@ class SqlAlchemyIdentity(object):
 
     def _get_user_id(self):
         """Get user id of this identity."""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.user_id
         if not self.user:
             return None
         return self.user.user_id
@@ -61,7 +75,7 @@ class SqlAlchemyIdentity(object):
 
     def _get_anonymous(self):
         """Return true if not logged in."""
-        return not self.user
+        return self.snapshot is None and not self.user
     anonymous = property(_get_anonymous)
 
     def _get_permissions(self):
@@ -71,6 +85,10 @@ class SqlAlchemyIdentity(object):
         except AttributeError:
             # Permissions haven't been computed yet
             pass
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self._permissions = snapshot.permissions
+            return self._permissions
         if not self.user:
             self._permissions = frozenset()
         else:
@@ -86,6 +104,10 @@ class SqlAlchemyIdentity(object):
         except AttributeError:
             # Groups haven't been computed yet
             pass
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self._groups = snapshot.groups
+            return self._groups
         if not self.user:
             self._groups = frozenset()
         else:
@@ -100,6 +122,10 @@ class SqlAlchemyIdentity(object):
         except AttributeError:
             # Groups haven't been computed yet
             pass
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self._group_ids = snapshot.group_ids
+            return self._group_ids
         if not self.user:
             self._group_ids = frozenset()
         else:
@@ -121,6 +147,7 @@ class SqlAlchemyIdentity(object):
 
     def login(self):
         """Set the link between this identity and the visit."""
+        identity.invalidate_identity(self.visit_key)
         visit = self.visit_link
         if visit:
             visit.user_id = self._user.user_id
@@ -132,6 +159,7 @@ class SqlAlchemyIdentity(object):
 
     def logout(self):
         """Remove the link between this identity and the visit."""
+        identity.invalidate_identity(self.visit_key)
         visit = self.visit_link
         if visit:
             session.delete(visit)
@@ -66,6 +66,8 @@ class SqlObjectIdentity(object):
         self.visit_key = visit_key
         if user:
             self._user = user
+            # do not cache the identity before the login has been committed
+            self._snapshot = None
             if visit_key is not None:
                 self.login()
 
@@ -78,20 +80,30 @@ class SqlObjectIdentity(object):
             pass
         # Attempt to load the user. After this code executes, there *will* be
         # a _user attribute, even if the value is None.
-        visit = self.visit_link
-        if visit:
+        snapshot = getattr(self, '_snapshot', None)
+        if snapshot is not None:
+            user_id = snapshot.user_id
+        else:
+            visit = self.visit_link
+            user_id = visit and visit.user_id
+        if user_id is not None:
             try:
-                self._user = user_class.get(visit.user_id)
+                self._user = user_class.get(user_id)
             except SQLObjectNotFound:
-                log.warning("No such user with ID: %s", visit.user_id)
+                log.warning("No such user with ID: %s", user_id)
                 self._user = None
         else:
             self._user = None
         return self._user
     user = property(_get_user)
 
+    snapshot = property(identity.get_identity_snapshot)
+
     def _get_user_name(self):
         """Get user name of this identity."""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.user_name
         if not self.user:
             return None
         return self.user.user_name
@@ -99,6 +111,9 @@ class SqlObjectIdentity(object):
 
     def _get_user_id(self):
         """Get user id of this identity."""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.user_id
         if not self.user:
             return None
         return self.user.id
@@ -106,7 +121,7 @@ class SqlObjectIdentity(object):
 
     def _get_anonymous(self):
         """Return true if not logged in."""
-        return not self.user
+        return self.snapshot is None and not self.user
     anonymous = property(_get_anonymous)
 
     def _get_permissions(self):
@@ -116,6 +131,10 @@ class SqlObjectIdentity(object):
         except AttributeError:
             # Permissions haven't been computed yet
             pass
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self._permissions = snapshot.permissions
+            return self._permissions
         if not self.user:
             self._permissions = frozenset()
         else:
@@ -131,6 +150,10 @@ class SqlObjectIdentity(object):
         except AttributeError:
             # Groups haven't been computed yet
             pass
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self._groups = snapshot.groups
+            return self._groups
         if not self.user:
             self._groups = frozenset()
         else:
@@ -145,6 +168,10 @@ class SqlObjectIdentity(object):
         except AttributeError:
             # Groups haven't been computed yet
             pass
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self._group_ids = snapshot.group_ids
+            return self._group_ids
         if not self.user:
             self._group_ids = frozenset()
         else:
@@ -169,6 +196,7 @@ class SqlObjectIdentity(object):
 
     def login(self):
         """Set the link between this identity and the visit."""
+        identity.invalidate_identity(self.visit_key)
         visit = self.visit_link
         if visit:
             visit.user_id = self._user.id
@@ -177,6 +205,7 @@ class SqlObjectIdentity(object):
 
     def logout(self):
         """Remove the link between this identity and the visit."""
+        identity.invalidate_identity(self.visit_key)
         visit = self.visit_link
         if visit:
             visit.destroySelf()
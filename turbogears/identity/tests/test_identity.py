@@ -421,6 +421,40 @@ class TestIdentity(unittest.TestCase):
         self.assertEquals(None, cherrypy.serving.request.identity.user_name)
         assert cherrypy.serving.request.identity.anonymous
 
+    def test_identity_cache(self):
+        """Test that identities are cached and invalidated on logout."""
+        startup.stopTurboGears()
+        config.update({'identity.cache.size': 10})
+        try:
+            startup.startTurboGears()
+            cache = identity.get_identity_cache()
+            assert cache is not None
+            testutil.create_request('/in_peon_group?'
+                'user_name=samIam&password=secret&login=Login')
+            session_id = re.match("Set-Cookie: (.*?); Path.*",
+                str(cherrypy.response.simple_cookie)).group(1)
+            visit_key = cherrypy.serving.request.identity.visit_key
+            assert cache.get(visit_key) is None
+            testutil.create_request('/in_peon_group',
+                headers={'Cookie': session_id})
+            assert 'in_peon_group' in cherrypy.response.body[0]
+            snapshot = cache.get(visit_key)
+            assert snapshot is not None
+            assert snapshot.user_name == 'samIam'
+            assert snapshot.groups == frozenset(['peon', 'other'])
+            assert snapshot.permissions == frozenset(['chops_wood'])
+            testutil.create_request('/has_chopper_permission',
+                headers={'Cookie': session_id})
+            assert 'has_chopper_permission' in cherrypy.response.body[0]
+            assert cherrypy.serving.request.identity.snapshot is snapshot
+            testutil.create_request('/logout', headers={'Cookie': session_id})
+            assert cache.get(visit_key) is None
+            testutil.create_request('/in_peon_group',
+                headers={'Cookie': session_id})
+            assert 'identity_failed_answer' in cherrypy.response.body[0]
+        finally:
+            config.update({'identity.cache.size': 0})
+
     def test_logout_with_set_identity(self):
         """Test that logout works even when there is no visit_key
         (e.g. when testutils.set_identity_user is used)."""
@@ -1,5 +1,9 @@
+import os
+import shutil
+import tempfile
 import time
 
+from datetime import datetime, timedelta
 from cStringIO import StringIO
 from urllib import urlencode
 from unittest import TestCase
@@ -7,6 +11,7 @@ from unittest import TestCase
 import cherrypy
 
 from turbogears import config, controllers, expose, startup, testutil, visit
+from turbogears.visit import sharedvisit
 
 
 def cookie_header(morsel):
@@ -128,3 +133,148 @@ class TestVisit(TestCase):
             '%a, %d-%b-%Y %H:%M:%S GMT')[:8] + (0,))
         should_expire = time.mktime(time.gmtime()) + morsel['max-age']
         assert abs(should_expire - expires) < 3
+
+
+class TestBulkUpdates(TestCase):
+
+    def setUp(self):
+        self._chunk_size = config.get('visit.flush.chunk_size', 500)
+        self._bucket = config.get('visit.flush.bucket', 1)
+        config.update({'visit.flush.chunk_size': 2,
+            'visit.flush.bucket': 60})
+        self.manager = visit.api.BaseVisitManager(timedelta(minutes=20))
+
+    def tearDown(self):
+        self.manager.shutdown()
+        config.update({'visit.flush.chunk_size': self._chunk_size,
+            'visit.flush.bucket': self._bucket})
+
+    def test_bulk_updates(self):
+        """Test that queued visits are grouped by expiry and chunked."""
+        queue = dict(a=datetime(2010, 1, 1, 12, 0, 10),
+            b=datetime(2010, 1, 1, 12, 0, 50),
+            c=datetime(2010, 1, 1, 12, 0, 59, 500),
+            d=datetime(2010, 1, 1, 12, 1, 1),
+            e=datetime(2010, 1, 1, 12, 2))
+        updates = dict()
+        for expiry, visit_keys in self.manager.bulk_updates(queue):
+            assert len(visit_keys) <= 2
+            updates.setdefault(expiry, []).extend(visit_keys)
+        for visit_keys in updates.itervalues():
+            visit_keys.sort()
+        assert updates == {datetime(2010, 1, 1, 12, 1): ['a', 'b', 'c'],
+            datetime(2010, 1, 1, 12, 2): ['d', 'e']}
+
+
+class TestVisitCache(TestCase):
+
+    def test_lru(self):
+        """Test that the least recently used visits are discarded."""
+        cache = visit.api.VisitCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        assert cache.hits == 3 and cache.misses == 1
+        cache.remove('a')
+        assert cache.get('a') is None
+        cache.clear()
+        assert not len(cache) and cache.get('c') is None
+
+    def test_ttl(self):
+        """Test that cached visits are discarded after the ttl."""
+        cache = visit.api.VisitCache(2, 0.5)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        time.sleep(1)
+        assert cache.get('a') is None
+        assert not len(cache)
+
+    def test_disabled(self):
+        """Test that the cache can be disabled by setting the size to 0."""
+        cache = visit.api.VisitCache(0, 60)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+
+
+class TestSharedVisits(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = sharedvisit.SocketVisitStore(
+            os.path.join(self.directory, 'visit.sock'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_local_store(self):
+        """Test that the local store keeps track of dirty visits."""
+        store = sharedvisit.LocalVisitStore()
+        expiry = datetime.now() + timedelta(minutes=20)
+        assert store.get('a') is None
+        store.update('a', expiry)
+        store.visits['b'] = datetime.now() - timedelta(minutes=1)
+        assert store.get('a') == expiry
+        assert store.take_dirty() == dict(a=expiry)
+        assert store.take_dirty() == dict()
+        assert 'b' not in store.visits
+        store.requeue(dict(a=expiry))
+        assert store.take_dirty() == dict(a=expiry)
+
+    def test_socket_store(self):
+        """Test that the socket store starts and shares a server."""
+        store = self.store
+        expiry = datetime(2010, 1, 1, 12, 30, 15, 500)
+        assert store.get('a') is None
+        assert store.server is not None
+        assert store.update('a', expiry)
+        other = sharedvisit.SocketVisitStore(store.path)
+        try:
+            assert other.get('a') == expiry
+            assert other.server is None
+            assert other.take_dirty() == dict(a=expiry)
+            assert store.take_dirty() == dict()
+            assert other.requeue(dict(a=expiry, b=expiry))
+            assert store.take_dirty() == dict(a=expiry, b=expiry)
+        finally:
+            other.close()
+        assert not store.update('bad key', expiry)
+        assert store.get('bad key') is None
+
+    def test_server_takeover(self):
+        """Test that another client takes over if the server is gone."""
+        store = self.store
+        store.get('a')
+        other = sharedvisit.SocketVisitStore(store.path)
+        try:
+            other.get('a')
+            store.close()
+            assert other.get('a') is None
+            assert other.server is not None
+        finally:
+            other.close()
+
+    def test_manager(self):
+        """Test that the shared visit manager uses the store."""
+        config.update({'visit.shared.store': 'local'})
+        try:
+            manager_class = type('SharedVisitManager',
+                (sharedvisit.SharedVisitManagerMixin,
+                    visit.api.BaseVisitManager), {})
+            manager = manager_class(timedelta(minutes=20))
+        finally:
+            config.update({'visit.shared.store': 'socket'})
+        try:
+            expiry = datetime.now() + timedelta(minutes=20)
+            manager.update_visit('a', expiry)
+            assert not manager.queue
+            assert manager.store.get('a') == expiry
+            assert manager.known_expiry('a') == expiry
+            assert manager.take_queued_visits() == dict(a=expiry)
+            assert manager.take_queued_visits() is None
+        finally:
+            manager.shutdown()
@@ -11,6 +11,7 @@ except ImportError:
 
 import turbogears
 from turbogears.identity import create_default_provider
+from turbogears.identity import create_identity_cache
 from turbogears.identity import set_current_identity
 from turbogears.identity import set_current_provider
 from turbogears.identity import set_login_attempted
@@ -34,6 +35,7 @@ def start_extension():
                 "Visit tracking must be enabled (visit.on)")
 
     log.info("Identity starting")
+    create_identity_cache()
     # Temporary until tg-admin can call create_extension_model
     create_extension_model()
     # Register the plugin for the Visit Tracking framework
@@ -22,6 +22,7 @@ class MemoryProfilerState(Enum):
     PYMPLER = MemoryProfilerStateItem(id=3, command='pympler', profiling_status=None)
     CACHE = MemoryProfilerStateItem(id=4, command='cache', profiling_status=None)
     DEBUG = MemoryProfilerStateItem(id=5, command='debug', profiling_status=None)
+    CATALOGS = MemoryProfilerStateItem(id=6, command='catalogs', profiling_status=None)
 
 # memory profiler system configuration
 FLUENTD_HOST_NAME = os.environ.get('FLUENTD_HOST_NAME', 'fluentd')
@@ -114,6 +115,12 @@ def _process_fifo_input(_thread_log, config_fifo):
         _set_pympler_profiling_value(params['endpoint'], params['persistence'])
     elif state == MemoryProfilerState.CACHE:
         _publish_cache_size()
+    elif state == MemoryProfilerState.CATALOGS:
+        if params['reload']:
+            _thread_log.info('Reloading message catalogs')
+            from turbogears.i18n import reload_catalogs
+            reload_catalogs()
+        _publish_catalog_stats()
     elif state == MemoryProfilerState.DEBUG:
         _thread_log.info('---------- DEBUGGING PROCESS ({}) ----------'.format(os.getpid()))
         import rpdb
@@ -149,6 +156,24 @@ def _publish_cache_size():
                                                                                                  total_size/1024))
 
 
+def _publish_catalog_stats():
+    from turbogears.i18n import catalog_stats
+    catalogs_summary_out = [['Domain', 'Locale', 'Messages', 'Size', 'Hits']]
+    total_size = 0
+    for domain, locale, messages, size, hits in catalog_stats():
+        catalogs_summary_out.append(['{}'.format(domain), '{}'.format(locale), '{}'.format(messages),
+                                     '{} B'.format(size), '{}'.format(hits)])
+        total_size += size
+
+    summary_lines = ''
+    for line in list(_format_table(catalogs_summary_out)):
+        summary_lines += line + '\n'
+
+    thread_log.info("================ MESSAGE CATALOG SUMMARY ==============\n{}\n"
+                    "----------------------------------------------------\nTOTAL:\t{} KB".format(summary_lines,
+                                                                                                 total_size/1024))
+
+
 def _format_table(rows, header=True):
     """Format a list of lists as a pretty table.
     Keyword arguments:
@@ -196,14 +221,16 @@ def _get_state_from_pipe_command(command):
                                          MemoryProfilerState.ECHO.value.command,
                                          MemoryProfilerState.PYMPLER.value.command,
                                          MemoryProfilerState.CACHE.value.command,
-                                         MemoryProfilerState.DEBUG.value.command]:
+                                         MemoryProfilerState.DEBUG.value.command,
+                                         MemoryProfilerState.CATALOGS.value.command]:
         return MemoryProfilerState.UNKNOWN, None
     return {MemoryProfilerState.ON.value.command: (MemoryProfilerState.ON, None),
             MemoryProfilerState.OFF.value.command: (MemoryProfilerState.OFF, None),
             MemoryProfilerState.ECHO.value.command: (MemoryProfilerState.ECHO, None),
             MemoryProfilerState.PYMPLER.value.command: _parse_pympler_command(command_values),
             MemoryProfilerState.CACHE.value.command: (MemoryProfilerState.CACHE, None),
-            MemoryProfilerState.DEBUG.value.command: (MemoryProfilerState.DEBUG, None)
+            MemoryProfilerState.DEBUG.value.command: (MemoryProfilerState.DEBUG, None),
+            MemoryProfilerState.CATALOGS.value.command: _parse_catalogs_command(command_values)
             }[command_values[0].lower()]
 
 
@@ -222,6 +249,20 @@ def _parse_pympler_command(command_args):
         return MemoryProfilerState.UNKNOWN, None
 
 
+def _parse_catalogs_command(command_args):
+    """
+    parses message catalogs command: 'catalogs' publishes the catalog statistics, 'catalogs reload' reloads the
+    catalogs (e.g. after running 'tg-admin i18n compile') before publishing them
+    :param command_args: list of strings ['catalogs'] or ['catalogs', 'reload']
+    :return: either MemoryProfilerState.CATALOGS and command parameters or UNKNOWN in case of parsing failure
+    """
+    if len(command_args) == 1:
+        return MemoryProfilerState.CATALOGS, {'reload': False}
+    if len(command_args) == 2 and command_args[1].lower() == 'reload':
+        return MemoryProfilerState.CATALOGS, {'reload': True}
+    return MemoryProfilerState.UNKNOWN, None
+
+
 def create_config_thread(_thread_log):
     if not TURBOGEARS_PROFILER_ACTIVATE:
         _thread_log.info("TURBOGEARS_PROFILER deactivated, add TURBOGEARS_PROFILER_ACTIVATE=True "
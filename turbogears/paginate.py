@@ -1,5 +1,11 @@
 
+import heapq
+import re
+import sys
 import types
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import date, datetime
+from itertools import chain, islice
 from math import ceil
 import logging
 import warnings
@@ -10,6 +16,7 @@ except NameError: # Python 2.3
     from sets import Set as set
 
 import cherrypy
+import simplejson
 try:
     import sqlobject
 except ImportError:
@@ -26,7 +33,7 @@ from turbogears.decorator import weak_signature_decorator
 from turbogears.view import variable_providers
 from formencode.variabledecode import variable_encode
 from turbogears.widgets import PaginateDataGrid
-from turbogears.util import add_tg_args
+from turbogears.util import add_tg_args, load_class, LRUCache
 
 log = logging.getLogger("turbogears.paginate")
 
@@ -36,8 +43,12 @@ log = logging.getLogger("turbogears.paginate")
 _so_no_offset = 'mssql maxdb sybase'.split()
 _sa_no_offset = 'mssql maxdb access'.split()
 
-# this is a global that is set the first time paginate() is called
+# databases that lack support for window functions like count(*) over ()
+_sa_no_window = 'sqlite mysql maxdb access sybase firebird'.split()
+
+# these are globals that are set the first time paginate() is called
 _simulate_offset = None
+_count_with_window = None
 
 # these are helper classes for getting data that has no table column
 class attrwrapper:
@@ -59,7 +70,8 @@ class itemwrapper:
 
 def paginate(var_name, default_order='', default_reversed=None, limit=10,
             max_limit=0, allow_limit_override=None, max_pages=5,
-            max_sort=1000, dynamic_limit=None):
+            max_sort=1000, dynamic_limit=None, mode=None, count='exact',
+            stream=False):
     """The famous TurboGears paginate decorator.
 
     @param var_name: The variable name that the paginate decorator will try
@@ -96,9 +108,11 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
     A zero value means that all pages will be shown, no matter how much.
     @type max_pages: integer
 
-    @param max_sort: The maximum number of records that will be sorted in
-    memory if the data cannot be sorted using SQL. If set to 0, sorting in
-    memory will never be performed; if set to None, no limit will be imposed.
+    @param max_sort: The maximum number of records that will be kept in
+    memory for sorting if the data cannot be sorted using SQL. Only the
+    records up to the requested page are kept, so that the first pages
+    of large data can be sorted. If set to 0, sorting in memory will never
+    be performed; if set to None, no limit will be imposed.
     @type max_sort: integer
 
     @param dynamic_limit: If specified, this parameter must be the name
@@ -110,6 +124,41 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
     application preferences and then let the user manage it.
     @type dynamic_limit: string
 
+    @param mode: If set to 'keyset', SQLAlchemy queries and SQLObject
+    select results are paged by the values of the ordering columns instead
+    of using OFFSET. The links to the next and previous page then carry
+    an opaque cursor with the values of the last or first row shown, so
+    that these pages are fetched equally fast no matter how deep they are.
+    Other data and direct jumps to other pages use OFFSET as usual.
+    @type mode: string
+
+    @param count: How the rows of SQL data are counted. With 'exact', they
+    are counted with a COUNT query on every request. With 'cached', the
+    counts are cached by SQL statement for paginate.count_cache.ttl seconds
+    (default 60). With 'estimated', the count is estimated by the function
+    (or dotted path of the function) set as paginate.count_estimator
+    (default: the row estimate of the query planner, only for PostgreSQL),
+    or counted exactly if no estimate is available. With 'combined', the
+    rows are counted by a window function in the same query that fetches
+    the page; data which must be sorted in memory, databases without window
+    functions and databases whose OFFSET is simulated are counted exactly
+    instead. Paginate.exact_count tells
+    whether row_count is exact.
+    @type count: string
+
+    @param stream: If true, data without a length, like iterators and SQL
+    queries, is not counted and never completely kept in memory. Only the
+    rows up to the requested page and one more row are fetched, which tells
+    whether there is a next page. The row_count is then only a lower bound
+    and the rows are counted only if the last page is requested. If set to
+    'count', iterators are consumed to the end for counting them, but only
+    the rows of the requested page are kept, and SQL data is counted as
+    usual. SQLAlchemy queries are fetched in batches of
+    paginate.stream.batch_size rows (default 100) in streaming mode.
+    Rows which must be sorted in memory are consumed to the end, and
+    sorted under the same conditions (see max_sort) as counted rows.
+    @type stream: boolean or string
+
     """
 
     if default_reversed is not None:
@@ -122,6 +171,12 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
         warnings.warn("allow_limit_override is deprecated."
             " Use max_limit to specify an upper bound for limit.",
             DeprecationWarning, 2)
+    if mode not in (None, 'offset', 'keyset'):
+        raise ValueError("paginate: invalid mode %r" % mode)
+    if count not in ('exact', 'cached', 'estimated', 'combined'):
+        raise ValueError("paginate: invalid count %r" % count)
+    if stream not in (False, True, 'count'):
+        raise ValueError("paginate: invalid stream %r" % stream)
 
     def entangle(func):
 
@@ -160,6 +215,7 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
                 limit_ = limit
             order = kwpop('order')
             ordering = kwpop('ordering')
+            cursor = kwpop('cursor')
 
             log.debug("paginate params: page=%s, limit=%s, order=%s",
                 page, limit_, order)
@@ -208,18 +264,138 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
                 sort_ordering(ordering, order)
             log.debug('paginate: ordering is %s', ordering)
 
+            keyset = None
+            if mode == 'keyset':
+                keyset = Keyset.for_data(var_data, ordering)
+
+            global _simulate_offset
+            if _simulate_offset is None:
+                _simulate_offset = get('paginate.simulate_offset', None)
+                if _simulate_offset is None:
+                    _simulate_offset = False
+                    so_db = get('sqlobject.dburi', 'NOMATCH:').split(':', 1)[0]
+                    sa_db = get('sqlalchemy.dburi', 'NOMATCH:').split(':', 1)[0]
+                    if so_db in _so_no_offset or sa_db in _sa_no_offset:
+                        _simulate_offset = True
+                        log.warning("paginate: simulating OFFSET,"
+                            " paginate may be slow"
+                            " (disable with paginate.simulate_offset=False)")
+            global _count_with_window
+            if _count_with_window is None:
+                _count_with_window = get('paginate.count_with_window', None)
+                if _count_with_window is None:
+                    sa_db = get('sqlalchemy.dburi', 'NOMATCH:')
+                    sa_db = sa_db.split(':', 1)[0].split('+', 1)[0]
+                    _count_with_window = (not _simulate_offset
+                        and sa_db not in _sa_no_window)
+
+            exact_count = True
+            streaming = False
             try:
                 row_count = len(var_data)
             except TypeError:
-                try: # SQL query
-                    row_count = var_data.count() or 0
-                except AttributeError: # other iterator
-                    var_data = list(var_data)
-                    row_count = len(var_data)
-
-            if ordering:
-                var_data = sort_data(var_data, ordering,
-                    max_sort is None or 0 < row_count <= max_sort)
+                if stream and keyset is None:
+                    # the rows are counted while fetching the page below
+                    streaming = True
+                    row_count = None
+                    if ((stream == 'count' or page is None)
+                            and hasattr(var_data, 'count')): # SQL query
+                        row_count, exact_count = count_rows(var_data, count)
+                elif (count == 'combined' and _count_with_window
+                        and limit_ and page is not None
+                        and keyset is None and hasattr(var_data, 'count')
+                        and not (ordering
+                            and sort_in_memory(var_data, ordering))):
+                    # count together with the rows of the page below
+                    row_count = None
+                else:
+                    try: # SQL query
+                        row_count, exact_count = count_rows(var_data, count)
+                    except AttributeError: # other iterator
+                        var_data = list(var_data)
+                        row_count = len(var_data)
+
+            if ordering and keyset is None:
+                # only the rows up to the requested page need to be sorted
+                sort_limit, sort_count = None, row_count
+                counted = None
+                if limit_ and page is not None:
+                    if row_count is not None:
+                        if page * limit_ < row_count:
+                            sort_limit = sort_count = page * limit_
+                    elif max_sort is None or page * limit_ <= max_sort:
+                        sort_count = page * limit_
+                        if stream == 'count':
+                            # count the rows consumed while sorting
+                            var_data = counted = _counter(var_data)
+                            sort_limit = sort_count
+                        else:
+                            # keep one more row telling if there is a next page
+                            sort_limit = sort_count + 1
+                if (row_count is None and sort_count is None
+                        and max_sort is not None
+                        and sort_in_memory(var_data, ordering)):
+                    # streamed rows are sorted like counted rows,
+                    # i.e. only if there are not more than max_sort rows
+                    rows = stream_rows(var_data)
+                    var_data = list(islice(rows, max_sort + 1))
+                    if len(var_data) > max_sort:
+                        var_data = chain(var_data, rows)
+                    else:
+                        row_count = sort_count = len(var_data)
+                        exact_count = True
+                var_data = sort_data(var_data, ordering, max_sort is None
+                    or sort_count is not None and 0 < sort_count <= max_sort,
+                    sort_limit)
+                if row_count is None and isinstance(var_data, list):
+                    # the streamed rows have been sorted in memory
+                    if counted is not None:
+                        row_count = counted.consumed
+                    elif sort_limit is None or len(var_data) < sort_limit:
+                        row_count = len(var_data)
+                    if row_count is not None:
+                        exact_count = True
+
+            page_rows = None
+            if streaming and row_count is None:
+                # fetch only the rows up to the requested page
+                if page is None:
+                    offset = None
+                else:
+                    offset = (page - 1) * limit_
+                if (offset and stream != 'count' and not _simulate_offset
+                        and hasattr(var_data, '__getitem__')):
+                    # let the database skip the rows before the page
+                    page_rows, row_count, exact_count = stream_page(
+                        stream_rows(var_data[offset:offset + limit_ + 1]),
+                        0, limit_)
+                    if page_rows:
+                        row_count += offset
+                    else: # page out of range
+                        page_rows = None
+                        row_count, exact_count = count_rows(var_data, count)
+                else:
+                    if (offset == 0 and limit_ and stream != 'count'
+                            and hasattr(var_data, '__getitem__')):
+                        # let the database stop after the first page,
+                        # rows before deeper pages are skipped while streaming
+                        var_data = var_data[:limit_ + 1]
+                    page_rows, row_count, exact_count = stream_page(
+                        stream_rows(var_data), offset, limit_,
+                        stream == 'count')
+                log.debug("paginate: streamed %d rows", row_count)
+
+            if row_count is None:
+                page_rows, row_count = count_with_page(
+                    var_data, (page - 1) * limit_, limit_)
+                if page_rows is None:
+                    try:
+                        row_count = len(var_data)
+                    except TypeError:
+                        row_count = var_data.count() or 0
+                else:
+                    log.debug("paginate: counted %d rows with page",
+                        row_count)
 
             # If limit is zero then return all our rows
             if not limit_:
@@ -242,6 +418,18 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
 
             pages_to_show = _select_pages_to_show(page, page_count, max_pages)
 
+            if keyset is not None:
+                rows = keyset.get_page(keyset.decode_cursor(cursor),
+                    page, page_count, offset, limit_, row_count,
+                    exact_count, _simulate_offset)
+                if rows:
+                    cursor_next = keyset.encode_cursor('next', rows[-1])
+                    cursor_prev = keyset.encode_cursor('prev', rows[0])
+                else:
+                    cursor_next = cursor_prev = None
+            else:
+                cursor_next = cursor_prev = None
+
             # remove pagination parameters from request
             input_values =  variable_encode(cherrypy.request.params.copy())
             input_values.pop('self', None)
@@ -259,7 +447,10 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
                 order=order,
                 ordering=ordering,
                 row_count=row_count,
-                var_name=var_name)
+                var_name=var_name,
+                cursor_next=cursor_next,
+                cursor_prev=cursor_prev,
+                exact_count=exact_count)
 
             cherrypy.request.paginate = paginate_instance
             if not hasattr(cherrypy.request, 'paginates'):
@@ -271,20 +462,11 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
             log.debug("paginate: slicing data between %d and %d",
                 offset, endpoint)
 
-            global _simulate_offset
-            if _simulate_offset is None:
-                _simulate_offset = get('paginate.simulate_offset', None)
-                if _simulate_offset is None:
-                    _simulate_offset = False
-                    so_db = get('sqlobject.dburi', 'NOMATCH:').split(':', 1)[0]
-                    sa_db = get('sqlalchemy.dburi', 'NOMATCH:').split(':', 1)[0]
-                    if so_db in _so_no_offset or sa_db in _sa_no_offset:
-                        _simulate_offset = True
-                        log.warning("paginate: simulating OFFSET,"
-                            " paginate may be slow"
-                            " (disable with paginate.simulate_offset=False)")
-
-            if _simulate_offset:
+            if page_rows is not None:
+                output[var_name] = page_rows
+            elif keyset is not None:
+                output[var_name] = rows
+            elif _simulate_offset:
                 var_data = iter(var_data[:endpoint])
                 # skip over the number of records specified by offset
                 for i in xrange(offset):
@@ -305,7 +487,7 @@ def paginate(var_name, default_order='', default_reversed=None, limit=10,
         if not get('tg.strict_parameters', False):
             # add hint that paginate parameters shall be left intact
             args = set()
-            for arg in 'no', 'limit', 'order', 'ordering':
+            for arg in 'no', 'limit', 'order', 'ordering', 'cursor':
                 args.add(var_name + '_tgp_' + arg)
                 args.add('tg_paginate_' + arg)
             add_tg_args(func, args)
@@ -329,7 +511,8 @@ class Paginate:
     """Class for paginate variable provider."""
 
     def __init__(self, current_page, pages, page_count, input_values,
-                 limit, order, ordering, row_count, var_name):
+                 limit, order, ordering, row_count, var_name,
+                 cursor_next=None, cursor_prev=None, exact_count=True):
 
         self.var_name = var_name
         self.pages = pages
@@ -340,6 +523,10 @@ class Paginate:
         self.order = order
         self.ordering = ordering
         self.row_count = row_count
+        # False if row_count has been estimated or taken from the cache
+        self.exact_count = exact_count
+        self.cursor_next = cursor_next
+        self.cursor_prev = cursor_prev
         self.first_item = page_count and ((current_page - 1) * limit + 1) or 0
         self.last_item = min(current_page * limit, row_count)
 
@@ -356,8 +543,8 @@ class Paginate:
                 var_name + '_tgp_no': current_page + 1,
                 var_name + '_tgp_limit': limit
             })
-            self.href_next = turbogears.url(
-                cherrypy.request.path_info, self.input_values)
+            self.href_next = turbogears.url(cherrypy.request.path_info,
+                self._with_cursor(self.input_values, cursor_next))
             self.input_values.update({
                 var_name + '_tgp_no': 'last',
                 var_name + '_tgp_limit': limit
@@ -373,8 +560,8 @@ class Paginate:
                 var_name + '_tgp_no': current_page - 1,
                 var_name + '_tgp_limit': limit
             })
-            self.href_prev = turbogears.url(
-                cherrypy.request.path_info, self.input_values)
+            self.href_prev = turbogears.url(cherrypy.request.path_info,
+                self._with_cursor(self.input_values, cursor_prev))
             self.input_values.update({
                 var_name + '_tgp_no': 1,
                 var_name + '_tgp_limit': limit
@@ -394,8 +581,19 @@ class Paginate:
         input_values[self.var_name + '_tgp_no'] = page
         if order:
             input_values[ self.var_name + '_tgp_order'] = order
+        elif page == self.current_page + 1:
+            input_values = self._with_cursor(input_values, self.cursor_next)
+        elif page == self.current_page - 1:
+            input_values = self._with_cursor(input_values, self.cursor_prev)
         return turbogears.url('', input_values)
 
+    def _with_cursor(self, input_values, cursor):
+        """Add the keyset cursor for the linked page to the input values."""
+        if cursor:
+            input_values = input_values.copy()
+            input_values[self.var_name + '_tgp_cursor'] = cursor
+        return input_values
+
 
 def _select_pages_to_show(current_page, page_count, max_pages=None):
     """Auxiliary function for getting the range of pages to show."""
@@ -429,15 +627,19 @@ def sort_ordering(ordering, sort_name):
         del ordering[index]
         ordering.insert(0, (not index and '-' or '') + sort_name)
 
-def sqlalchemy_get_column(colname, var_data):
-    """Return a column from sqlalchemy var_data based on colname."""
+def sqlalchemy_get_mapper(var_data):
+    """Return the mapper of sqlalchemy var_data."""
     try:
-        mapper = var_data.mapper
+        return var_data.mapper
     except AttributeError: # SQLAlchemy >= 0.5
         try:
-            mapper = var_data._mapper_zero()
+            return var_data._mapper_zero()
         except AttributeError: # SQLAlchemy <= 0.4 and SelectResullts
-            mapper = var_data._query.mapper
+            return var_data._query.mapper
+
+def sqlalchemy_get_column(colname, var_data):
+    """Return a column from sqlalchemy var_data based on colname."""
+    mapper = sqlalchemy_get_mapper(var_data)
     propnames = colname.split('.')
     colname = propnames.pop()
     for propname in propnames:
@@ -494,11 +696,11 @@ def sql_order_col(col, ascending=True):
         return sqlobject_order_col(col, ascending)
     raise TypeError("Expected Column, but got %s" % type(col))
 
-def sort_data(data, ordering, in_memory=True):
-    """Sort data based on ordering.
+def _split_ordering(data, ordering):
+    """Split ordering into SQL order columns and keys to sort in memory.
 
-    Tries to sort the data using SQL whenever possible,
-    otherwise sorts the data as list in memory unless in_memory is false.
+    Returns the order_by method of SQL data (or None), the SQL order columns
+    and the (name, descending) pairs of the keys that must be sorted in memory.
 
     """
     try:
@@ -512,7 +714,6 @@ def sort_data(data, ordering, in_memory=True):
             order_by = None
     order_cols = []
     key_cols = []
-    num_ascending = num_descending = 0
     for order in ordering:
         if order[0] == '-':
             order = order[1:]
@@ -526,52 +727,471 @@ def sort_data(data, ordering, in_memory=True):
                 continue
         if not order_cols:
             key_cols.append((order, descending))
-            if descending:
-                num_descending += 1
-            else:
-                num_ascending += 1
+    return order_by, order_cols, key_cols
+
+def sort_in_memory(data, ordering):
+    """Check whether data must be sorted in memory based on ordering."""
+    return bool(_split_ordering(data, ordering)[2])
+
+def sort_data(data, ordering, in_memory=True, limit=None):
+    """Sort data based on ordering.
+
+    Tries to sort the data using SQL whenever possible,
+    otherwise sorts the data as list in memory unless in_memory is false.
+    If limit is given, only the first limit rows are needed, and only these
+    are returned if the data is sorted in memory.
+
+    """
+    order_by, order_cols, key_cols = _split_ordering(data, ordering)
     if order_by and order_cols:
         data = order_by(order_cols)
     if key_cols:
         if in_memory:
-            data = list(data)
-            if not data:
-                return data
-            wrapper = isinstance(data[0], dict) and itemwrapper or attrwrapper
-            keys = [(wrapper(col[0]), col[1]) for col in key_cols]
-            if num_ascending == 0 or num_descending == 0:
-                reverse = num_ascending == 0
-                keys = [key[0] for key in keys]
-                if len(key_cols) == 1:
-                    key = keys[0]
-                else:
-                    key = lambda row: [key(row) for key in keys]
+            data = sort_rows(data, key_cols, limit)
+        else:
+            log.debug("paginate: sorting in memory not allowed")
+    return data
+
+# heapq.nsmallest and nlargest accept a key since Python 2.5
+_heap_with_key = sys.version_info >= (2, 5)
+
+class _counter(object):
+    """Helper class for counting the rows consumed from an iterator."""
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.consumed = 0
+    def __iter__(self):
+        return self
+    def next(self):
+        row = self.rows.next()
+        self.consumed += 1
+        return row
+
+class _reversed(object):
+    """Helper class for sorting a key in descending order."""
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value
+    def __cmp__(self, other):
+        return cmp(other.value, self.value)
+
+def sort_rows(rows, keys, limit=None):
+    """Sort rows in memory.
+
+    The keys are given as list of (name, descending) pairs. If limit is
+    given, only the first limit rows are returned, which are found with
+    a bounded heap instead of sorting all rows. Keys with mixed directions
+    are sorted in several stable passes, one for every direction change.
+
+    """
+    rows = iter(rows)
+    try:
+        first = rows.next()
+    except StopIteration:
+        return []
+    rows = chain([first], rows)
+    wrapper = isinstance(first, dict) and itemwrapper or attrwrapper
+    # group the keys into runs with the same direction
+    passes = []
+    for name, descending in keys:
+        if passes and passes[-1][1] == descending:
+            passes[-1][0].append(wrapper(name))
+        else:
+            passes.append(([wrapper(name)], descending))
+    passes = [(len(getters) == 1 and getters[0]
+        or (lambda row, getters=getters: [get(row) for get in getters]),
+        descending) for getters, descending in passes]
+    if limit is not None and _heap_with_key:
+        if len(passes) == 1:
+            key, descending = passes[0]
+            select = descending and heapq.nlargest or heapq.nsmallest
+        else:
+            def key(row):
+                return [descending and _reversed(get(row)) or get(row)
+                    for get, descending in passes]
+            select = heapq.nsmallest
+        return select(limit, rows, key=key)
+    rows = list(rows)
+    passes.reverse()
+    for key, descending in passes:
+        try:
+            rows.sort(key=key, reverse=descending)
+        except TypeError: # Python 2.3
+            if descending:
+                cmpkey = lambda row1, row2: cmp(key(row2), key(row1))
             else:
-                reverse = num_descending > num_ascending
-                def reverse_key(key, descending):
-                    if reverse == descending:
-                        return key
-                    else:
-                        keys = map(key, data)
-                        try:
-                            keys = list(set(keys))
-                        except TypeError: # unhashable
-                            keys.sort()
-                            return lambda row: -keys.index(key(row))
-                        else:
-                            keys.sort()
-                            keys = dict([(k, -n) for n, k in enumerate(keys)])
-                            return lambda row: keys[key(row)]
-                keys = [reverse_key(*key) for key in keys]
-                key = lambda row: [key(row) for key in keys]
+                cmpkey = lambda row1, row2: cmp(key(row1), key(row2))
+            rows.sort(cmpkey)
+    if limit is not None:
+        del rows[limit:]
+    return rows
+
+
+# Counting rows
+
+# row counts and the time they were counted by SQL statement and parameters
+_count_cache = None
+
+def get_count_cache():
+    """Return the LRU cache holding the row counts for count='cached'.
+
+    It keeps paginate.count_cache.size counts (default: 1000) for
+    paginate.count_cache.ttl seconds (default: 60).
+
+    """
+    global _count_cache
+    if _count_cache is None:
+        get = turbogears.config.get
+        _count_cache = LRUCache(get('paginate.count_cache.size', 1000),
+            get('paginate.count_cache.ttl', 60))
+    return _count_cache
+
+def _sqlalchemy_statement(data):
+    """Return the select statement of sqlalchemy data."""
+    try:
+        return data.statement
+    except AttributeError: # SQLAlchemy <= 0.4
+        return data.compile()
+
+def _count_key(data):
+    """Return a key for caching the row count of SQL data or None."""
+    if sqlalchemy:
+        try:
+            compiled = _sqlalchemy_statement(data).compile()
+        except AttributeError:
+            pass
+        else:
+            return str(compiled), repr(sorted(compiled.params.items()))
+    if sqlobject:
+        try:
+            return data._getConnection().queryForSelect(data), None
+        except AttributeError:
+            pass
+    return None
+
+def cached_count(data):
+    """Return the row count of SQL data and whether it has just been counted.
+
+    Counts are cached by SQL statement and parameters in the cache
+    returned by get_count_cache.
+
+    """
+    key = _count_key(data)
+    if key is None:
+        return data.count() or 0, True
+    cache = get_count_cache()
+    row_count = cache.get(key)
+    if row_count is not None:
+        return row_count, False
+    row_count = data.count() or 0
+    cache.set(key, row_count)
+    return row_count, True
+
+def estimate_count(data):
+    """Return the row count of SQL data estimated by the query planner.
+
+    Only PostgreSQL is supported, None is returned for other databases.
+
+    """
+    plan = None
+    if sqlalchemy:
+        try:
+            statement = _sqlalchemy_statement(data)
+            bind = statement.bind or data.session.bind
+        except AttributeError:
+            pass
+        else:
+            if bind.dialect.name not in ('postgres', 'postgresql'):
+                return None
+            compiled = statement.compile(bind=bind)
+            conn = bind.raw_connection()
             try:
-                data.sort(key=key, reverse=reverse)
-            except TypeError: # Python 2.3
-                if reverse:
-                    cmpkey = lambda row1, row2: cmp(key(row2), key(row1))
+                cursor = conn.cursor()
+                cursor.execute('EXPLAIN ' + str(compiled), compiled.params)
+                plan = cursor.fetchone()[0]
+            finally:
+                conn.close()
+    if plan is None and sqlobject:
+        try:
+            conn = data._getConnection()
+        except AttributeError:
+            return None
+        if conn.dbName != 'postgres':
+            return None
+        plan = conn.queryOne('EXPLAIN ' + conn.queryForSelect(data))[0]
+    match = plan and re.search(r'rows=(\d+)', plan)
+    if match:
+        return int(match.group(1))
+    return None
+
+def count_rows(data, count='exact'):
+    """Return the row count of SQL data and whether it is exact.
+
+    See the count parameter of paginate for the possible ways of counting.
+
+    """
+    if count == 'cached':
+        return cached_count(data)
+    if count == 'estimated':
+        estimator = turbogears.config.get(
+            'paginate.count_estimator', estimate_count)
+        if isinstance(estimator, basestring):
+            path = estimator
+            estimator = load_class(path)
+            if estimator is None:
+                raise ValueError("Row count estimator %s not found" % path)
+        row_count = estimator(data)
+        if row_count is not None:
+            return row_count, False
+    return data.count() or 0, True
+
+def count_with_page(data, offset, limit):
+    """Return the rows of a page and the row count using only one query.
+
+    The rows are counted by a window function. Returns (None, None) if the
+    data is not an SQLAlchemy query or the page is empty.
+
+    """
+    if not sqlalchemy or not hasattr(data, 'add_column'):
+        return None, None
+    rows = list(data.add_column(sqlalchemy.sql.literal_column(
+        'count(*) over ()'))[offset:offset + limit])
+    if not rows:
+        return None, None
+    try:
+        single_entity = len(data._entities) == 1 and bool(
+            list(data._mapper_entities))
+    except AttributeError: # SQLAlchemy < 0.5
+        single_entity = len(rows[0]) == 2
+    if single_entity:
+        page_rows = [row[0] for row in rows]
+    else:
+        page_rows = [tuple(row[:-1]) for row in rows]
+    return page_rows, rows[0][-1]
+
+
+# Streaming rows
+
+def stream_rows(data):
+    """Return an iterator over the rows of data.
+
+    SQLAlchemy queries are fetched in batches of paginate.stream.batch_size
+    rows, using a server-side cursor if the database driver supports it.
+
+    """
+    if sqlalchemy and hasattr(data, 'yield_per'):
+        data = data.yield_per(
+            turbogears.config.get('paginate.stream.batch_size', 100))
+        try:
+            data = data.execution_options(stream_results=True)
+        except AttributeError: # SQLAlchemy < 0.6
+            pass
+    return iter(data)
+
+def stream_page(rows, offset, limit, count=False):
+    """Return the rows of a page, the row count and whether it is exact.
+
+    The rows are consumed from the iterator only up to offset + limit + 1,
+    the additional row telling whether there is a next page. The row count
+    is then a lower bound only. If count is true or offset is None, all rows
+    are consumed and counted. Only the rows of one page are kept in memory,
+    so that the rows of the last page are returned if offset is None or
+    if the rows end before the offset.
+
+    """
+    if not limit:
+        rows = list(rows)
+        return rows, len(rows), True
+    page_rows = []
+    row_count = 0
+    for row in rows:
+        if offset is None or row_count < offset + limit:
+            if not row_count % limit:
+                page_rows = []
+            page_rows.append(row)
+        elif not count:
+            return page_rows, row_count + 1, False
+        row_count += 1
+    return page_rows, row_count, True
+
+
+# Keyset pagination
+
+def _encode_key_value(value):
+    """Encode a key value for a cursor."""
+    if isinstance(value, datetime):
+        return {'datetime': list(value.timetuple()[:6]) + [value.microsecond]}
+    if isinstance(value, date):
+        return {'date': list(value.timetuple()[:3])}
+    if value is None or not isinstance(value,
+            (basestring, int, long, float)):
+        # NULL values cannot be compared in SQL
+        raise TypeError("Cannot use %r as key value" % value)
+    return value
+
+def _decode_key_value(value):
+    """Decode a key value from a cursor."""
+    if isinstance(value, dict):
+        if 'datetime' in value:
+            return datetime(*value['datetime'])
+        return date(*value['date'])
+    if value is None or isinstance(value, list):
+        raise TypeError("Invalid key value %r" % value)
+    return value
+
+
+class Keyset(object):
+    """Helper for paging SQL data by the values of the ordering columns.
+
+    The primary key columns are added to the ordering columns so that the
+    rows are totally ordered. A page following (or preceding) a row is
+    selected with a condition on the values of these columns in that row
+    instead of an OFFSET.
+
+    """
+
+    def __init__(self, data, columns, getters, order_by, order_col,
+            and_, or_):
+        self.data = data
+        # list of (column, descending) pairs
+        self.columns = columns
+        # functions returning the key values from a row
+        self.getters = getters
+        self.order_by = order_by
+        self.order_col = order_col
+        self.and_, self.or_ = and_, or_
+
+    def for_data(cls, data, ordering):
+        """Return a Keyset for the data or None if it cannot be used.
+
+        Keysets can be used for SQLAlchemy queries and SQLObject select
+        results if all ordering columns are table columns which cannot be
+        NULL, since rows with NULL values cannot be found by comparison.
+
+        """
+        try:
+            if sqlalchemy and hasattr(data, 'order_by'):
+                mapper = sqlalchemy_get_mapper(data)
+                primary_key = list(mapper.primary_key)
+                def get_primary_key(row):
+                    try:
+                        return mapper.primary_key_from_instance(row)
+                    except AttributeError: # SQLAlchemy <= 0.3
+                        return mapper.identity(row)
+                get_column, order_col = (
+                    sqlalchemy_get_column, sqlalchemy_order_col)
+                not_null = lambda col, name: not getattr(col, 'nullable', True)
+                and_, or_ = sqlalchemy.and_, sqlalchemy.or_
+                order_by = data.order_by
+            elif sqlobject and hasattr(data, 'orderBy'):
+                primary_key = [data.sourceClass.q.id]
+                get_primary_key = lambda row: [row.id]
+                get_column, order_col = (
+                    sqlobject_get_column, sqlobject_order_col)
+                so_columns = data.sourceClass.sqlmeta.columns
+                not_null = lambda col, name: getattr(
+                    so_columns.get(name), 'notNone', False)
+                and_, or_ = sqlobject.AND, sqlobject.OR
+                order_by = data.orderBy
+            else:
+                return None
+            if not hasattr(data, 'filter'):
+                return None
+        except AttributeError:
+            return None
+        columns = []
+        getters = []
+        for order in ordering:
+            if order[0] == '-':
+                order = order[1:]
+                descending = True
+            else:
+                descending = False
+            col = get_column(order, data)
+            if col is None or not not_null(col, order):
+                return None
+            columns.append((col, descending))
+            getters.append(attrwrapper(order))
+        for n, col in enumerate(primary_key):
+            columns.append((col, False))
+            getters.append(lambda row, n=n: get_primary_key(row)[n])
+        return cls(data, columns, getters, order_by, order_col, and_, or_)
+    for_data = classmethod(for_data)
+
+    def encode_cursor(self, direction, row):
+        """Return a cursor for the page in the direction from the row.
+
+        Returns None if the row has key values which cannot be used.
+
+        """
+        try:
+            values = [_encode_key_value(getter(row))
+                for getter in self.getters]
+        except (AttributeError, TypeError):
+            return None
+        return urlsafe_b64encode(simplejson.dumps([direction[0], values]))
+
+    def decode_cursor(self, cursor):
+        """Return the direction and key values of the cursor or None."""
+        if not cursor:
+            return None
+        try:
+            direction, values = simplejson.loads(
+                urlsafe_b64decode(str(cursor)))
+            if direction not in ('n', 'p') or len(values) != len(
+                    self.getters):
+                raise ValueError
+            values = map(_decode_key_value, values)
+        except Exception:
+            log.debug("paginate: ignoring invalid cursor %r", cursor)
+            return None
+        return direction == 'p' and 'prev' or 'next', values
+
+    def select(self, values=None, backwards=False):
+        """Return the data ordered by the key, following the key values.
+
+        If backwards is true, the data is ordered in the opposite direction.
+
+        """
+        columns = self.columns
+        data = self.order_by([self.order_col(col, descending != backwards)
+            for col, descending in columns])
+        if values is not None:
+            conditions = []
+            for n, (col, descending) in enumerate(columns):
+                terms = [columns[i][0] == values[i] for i in xrange(n)]
+                if descending != backwards:
+                    terms.append(col < values[n])
                 else:
-                    cmpkey = lambda row1, row2: cmp(key(row1), key(row2))
-                data.sort(cmpkey)
+                    terms.append(col > values[n])
+                conditions.append(self.and_(*terms))
+            data = data.filter(self.or_(*conditions))
+        return data
+
+    def get_page(self, cursor, page, page_count, offset, limit, row_count,
+            exact_count=True, simulate_offset=False):
+        """Return the rows of the page.
+
+        The page is selected using the cursor if there is one. The first
+        and (if the row count is exact) the last page are selected with
+        LIMIT only, all other pages without a cursor need an OFFSET, or
+        skip the rows before the page if OFFSET must be simulated.
+
+        """
+        backwards = False
+        if cursor is not None:
+            direction, values = cursor
+            backwards = direction == 'prev'
+            rows = self.select(values, backwards)[:limit]
+        elif 1 < page == page_count and exact_count:
+            backwards = True
+            rows = self.select(None, True)[:row_count - offset]
+        elif simulate_offset:
+            # skip over the number of records specified by offset
+            rows = islice(self.select()[:offset + limit], offset, None)
         else:
-            log.debug("paginate: sorting in memory not allowed")
-    return data
+            rows = self.select()[offset:offset + limit]
+        rows = list(rows)
+        if backwards:
+            rows.reverse()
+        return rows
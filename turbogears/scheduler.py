@@ -2,12 +2,14 @@
 
 This task scheduler is designed to be used from inside your own program.
 You can schedule Python functions to be called at specific intervals or
-days. It uses the standard 'sched' module for the actual task scheduling,
-but provides much more:
+days. The pending tasks are kept in a heap ordered by their due time, and
+the scheduler waits on a condition variable until the first task is due
+or the first task changes. Additionally, it provides:
     - repeated tasks (at intervals, or on specific days)
     - error handling (exceptions in tasks don't kill the scheduler)
     - optional to run scheduler in its own thread or separate process
     - optional to run a task in its own thread or separate process
+    - optional to run a task in a bounded pool of worker threads or processes
 
 If the threading module is available, you can use the various Threaded
 variants of the scheduler and associated tasks. If threading is not
@@ -19,13 +21,40 @@ There are three Scheduler classes:
 
 You usually add new tasks to a scheduler using the add_interval_task or
 add_daytime_task methods, with the appropriate processmethod argument
-to select sequential, threaded or forked processing. NOTE: it is impossible
-to add new tasks to a ForkedScheduler, after the scheduler has been started!
-For more control you could use one of the following Task classes
-and use schedule_task or schedule_task_abs:
+to select sequential, threaded, forked or pooled processing. NOTE: it is
+impossible to add new tasks to a ForkedScheduler, after the scheduler has
+been started! For more control you could use one of the following Task
+classes and use schedule_task or schedule_task_abs:
     IntervalTask    ThreadedIntervalTask    ForkedIntervalTask
     WeekdayTask     ThreadedWeekdayTask     ForkedWeekdayTask
     MonthdayTask    ThreadedMonthdayTask    ForkedMonthdayTask
+    PooledIntervalTask    PooledWeekdayTask    PooledMonthdayTask
+
+Pooled tasks are executed by a fixed number of worker threads, or worker
+processes if tg.scheduler.pool is set to 'process' (the action and its
+arguments must then be picklable). The number of workers is set with
+tg.scheduler.workers (default 4). The overlap argument of pooled tasks
+determines what happens when a task is due while its previous run has
+not finished yet: with 'skip' (the default) the run is skipped, with
+'queue' it is started when the previous run has finished (at most one
+run is kept waiting), and with 'concurrent' the runs may overlap.
+
+All tasks count their runs and skipped runs and keep track of how long
+the runs took and how late they were started.
+
+If several processes run the same scheduled tasks, e.g. in a pre-forked
+or multi-node deployment, a lock backend can make sure that every task
+is run by only one of these processes. Before a task is run, the process
+claims it for somewhat longer than the time until the task is due again,
+and renews the claim with every run. The other processes skip the task
+as long as the claim is held and take over when it has expired. With
+tg.scheduler.lock = 'file', tasks are claimed with file locks, which
+works for the processes of a single host and are released immediately
+when the holding process dies. With tg.scheduler.lock = 'database', the
+claims are lease rows in the tg_scheduler_lease table of the database
+given by tg.scheduler.lock.dburi (default sqlalchemy.dburi), which works
+across hosts with synchronized clocks. Tasks are claimed by their name,
+so give tasks with the same action different names.
 
 Kronos is the Greek God of Time.
 
@@ -43,54 +72,68 @@ no longer be supported/in development.
 
 
 import os, sys
-import sched, time
+import random
+import re
+import socket
+import tempfile
+import time
 import traceback
 import weakref
+from heapq import heappush, heappop, heapify
 
-from turbogears.util import Enum
+try:
+    import threading
+except ImportError: # Python built without threads
+    import dummy_threading as threading
+
+from turbogears.util import Enum, get_package_name, load_class
+
+method = Enum("sequential", "forked", "threaded", "pooled")
 
-method = Enum("sequential", "forked", "threaded")
+overlap_policies = ('skip', 'queue', 'concurrent')
 
 class Scheduler:
     """The Scheduler itself."""
 
     def __init__(self):
         self.running = True
-        self.sched = sched.scheduler(time.time, self.__delayfunc)
-
-    def __delayfunc(self, delay):
-        # This delay function is basically a time.sleep() that is
-        # divided up, so that we can check the self.running flag while delaying.
-        # there is an additional check in here to ensure that the top item of
-        # the queue hasn't changed
-        if delay < 10:
-            time.sleep(delay)
-        else:
-            toptime = self.sched.queue[0][0]
-            endtime = time.time() + delay
-            period = 5
-            stoptime = endtime - period
-            while self.running and stoptime > time.time() and \
-                self.sched.queue[0][0] == toptime:
-                time.sleep(period)
-            if not self.running or self.sched.queue[0][0] != toptime:
-                return
-            now = time.time()
-            if endtime > now:
-                time.sleep(endtime - now)
+        # heap of [time, sequence number, task] entries, the task of
+        # a cancelled entry is set to None and the entry is discarded
+        # when it gets to the top of the heap
+        self.queue = []
+        self._sequence = 0
+        self._cancelled = 0
+        self._cond = threading.Condition()
+        self.pool = None # worker pool for pooled tasks
+        self.lock = None # lock backend for claiming tasks for this process
+        self.lock_grace = 60 # additional time a task is claimed (seconds)
 
     def _acquire_lock(self):
-        pass
+        self._cond.acquire()
 
     def _release_lock(self):
-        pass
+        self._cond.release()
 
-    def add_interval_task(self, action, taskname, initialdelay, interval, processmethod, args, kw):
+    def _wait(self, timeout=None):
+        # Wait until the timeout (seconds) has passed or the scheduler has
+        # been notified of a change of the first task, while holding the lock.
+        self._cond.wait(timeout)
+
+    def get_pool(self):
+        """Return the worker pool for pooled tasks, creating it if needed."""
+        if self.pool is None:
+            self.pool = create_worker_pool()
+        return self.pool
+
+    def add_interval_task(self, action, taskname, initialdelay, interval, processmethod, args, kw,
+            overlap='skip'):
         """Add a new Interval Task to the schedule. A very short initialdelay or one of
         zero cannot be honored, you will see a slight delay before the task is first
         executed. This is because the scheduler needs to pick it up in its loop."""
         if initialdelay < 0 or interval < 1:
             raise ValueError("delay or interval must be >0")
+        if overlap not in overlap_policies:
+            raise ValueError("invalid overlap policy")
         # Select the correct IntervalTask class. Not all types may be available!
         if processmethod == method.sequential:
             TaskClass=IntervalTask
@@ -98,6 +141,8 @@ class Scheduler:
             TaskClass = ThreadedIntervalTask
         elif processmethod == method.forked:
             TaskClass = ForkedIntervalTask
+        elif processmethod == method.pooled:
+            TaskClass = PooledIntervalTask
         else:
             raise ValueError("invalid processmethod")
         if not args:
@@ -105,13 +150,17 @@ class Scheduler:
         if not kw:
             kw = {}
         task = TaskClass(taskname, interval, action, args, kw)
+        task.overlap = overlap
         self.schedule_task(task, initialdelay)
         return task
 
-    def add_daytime_task(self, action, taskname, weekdays, monthdays, timeonday, processmethod, args, kw):
+    def add_daytime_task(self, action, taskname, weekdays, monthdays, timeonday, processmethod, args, kw,
+            overlap='skip'):
         """Add a new Day Task (Weekday or Monthday) to the schedule."""
         if weekdays and monthdays:
             raise ValueError("you can only specify weekdays or monthdays, not both")
+        if overlap not in overlap_policies:
+            raise ValueError("invalid overlap policy")
         if not args:
             args = []
         if not kw:
@@ -124,6 +173,8 @@ class Scheduler:
                 TaskClass = ThreadedWeekdayTask
             elif processmethod == method.forked:
                 TaskClass = ForkedWeekdayTask
+            elif processmethod == method.pooled:
+                TaskClass = PooledWeekdayTask
             else:
                 raise ValueError("invalid processmethod")
             task = TaskClass(taskname, weekdays, timeonday, action, args, kw)
@@ -135,39 +186,32 @@ class Scheduler:
                 TaskClass = ThreadedMonthdayTask
             elif processmethod == method.forked:
                 TaskClass = ForkedMonthdayTask
+            elif processmethod == method.pooled:
+                TaskClass = PooledMonthdayTask
             else:
                 raise ValueError("invalid processmethod")
             task = TaskClass(taskname, monthdays, timeonday, action, args, kw)
+        task.overlap = overlap
         firsttime = task.get_schedule_time(True)
         self.schedule_task_abs(task, firsttime)
         return task
 
     def schedule_task(self, task, delay):
         """Low-level method to add a new task to the scheduler with the given delay (seconds)."""
-        if self.running:
-            self._acquire_lock() # lock the sched queue, if needed
-            try:
-                task.event = self.sched.enter(delay, 0, task,
-                            (weakref.ref(self),) )
-            finally:
-                self._release_lock()
-        else:
-            task.event = self.sched.enter(delay, 0, task,
-                        (weakref.ref(self),) )
+        self.schedule_task_abs(task, time.time() + delay)
 
     def schedule_task_abs(self, task, abstime):
         """Low-level method to add a new task to the scheduler for the given absolute time value."""
-        if self.running:
-            self._acquire_lock() # lock the sched queue, if needed
-            try:
-                task.event = self.sched.enterabs(abstime, 0, task,
-                                    (weakref.ref(self),) )
-            finally:
-                self._release_lock()
-        else:
-            task.event = self.sched.enterabs(abstime, 0, task,
-                                (weakref.ref(self),) )
-
+        self._acquire_lock() # lock the task queue
+        try:
+            self._sequence += 1
+            task.event = event = [abstime, self._sequence, task]
+            heappush(self.queue, event)
+            if self.queue[0] is event:
+                # the scheduler has to wake up earlier
+                self._cond.notify()
+        finally:
+            self._release_lock()
 
     def start(self):
         """Start the scheduler."""
@@ -175,43 +219,137 @@ class Scheduler:
 
     def stop(self):
         """Remove all pending tasks and stop the Scheduler."""
-        self.running = False
-        self.sched.queue[:] = []
+        self._acquire_lock()
+        try:
+            self.running = False
+            self.queue[:] = []
+            self._cancelled = 0
+            self._cond.notifyAll()
+            pool, self.pool = self.pool, None
+        finally:
+            self._release_lock()
+        if pool is not None:
+            pool.stop()
 
     def cancel(self, task):
-        self.sched.cancel(task.event)
+        """Remove a pending task from the scheduler."""
+        self._acquire_lock()
+        try:
+            event = task.event
+            if event[2] is None:
+                raise ValueError("task is not scheduled")
+            event[2] = None
+            self._cancelled += 1
+            queue = self.queue
+            if queue and queue[0] is event:
+                self._cond.notify()
+            if self._cancelled > len(queue) // 2:
+                # too many cancelled entries, rebuild the heap
+                queue[:] = [entry for entry in queue if entry[2] is not None]
+                heapify(queue)
+                self._cancelled = 0
+        finally:
+            self._release_lock()
+
+    def _next_task(self):
+        # Wait until the first task is due, then remove and return it.
+        # Returns None when the scheduler has been stopped.
+        self._acquire_lock()
+        try:
+            queue = self.queue
+            while self.running:
+                while queue and queue[0][2] is None:
+                    heappop(queue)
+                    self._cancelled -= 1
+                if not queue:
+                    self._wait()
+                    continue
+                delay = queue[0][0] - time.time()
+                if delay > 0:
+                    self._wait(delay)
+                    continue
+                event = heappop(queue)
+                task, event[2] = event[2], None
+                return task
+        finally:
+            self._release_lock()
 
     def _run(self):
         # Low-level run method to do the actual scheduling loop.
         while self.running:
+            task = self._next_task()
+            if task is None:
+                break
             try:
-                self.sched.run()
+                if self.lock is None or self._claim(task):
+                    task(weakref.ref(self))
+                else:
+                    # the task is run by another process
+                    task.reschedule(self)
             except Exception, e:
                 print >> sys.stderr, "ERROR DURING SCHEDULER EXECUTION", e
                 print >> sys.stderr, "".join(traceback.format_exception(*sys.exc_info()))
                 print >> sys.stderr, "-"*20
-            # queue is empty; sleep a short while before checking again
-            if self.running:
-                time.sleep(5)
+        if self.lock is not None:
+            # let other processes take over the tasks
+            self.lock.close()
+
+    def _claim(self, task):
+        # Claim the task for this process until shortly after it is due again.
+        # Returns False if the task has been claimed by another process.
+        period = getattr(task, 'interval', 24 * 60 * 60) # day tasks run daily
+        try:
+            return self.lock.acquire(task_lock_name(task),
+                period + self.lock_grace)
+        except Exception, e:
+            print >> sys.stderr, "ERROR WHILE CLAIMING TASK", e
+            print >> sys.stderr, "".join(traceback.format_exception(*sys.exc_info()))
+            print >> sys.stderr, "-"*20
+            return False
 
 
 class Task:
     """Abstract base class of all scheduler tasks"""
+
+    overlap = 'skip' # only used by pooled tasks
+
     def __init__(self, name, action, args, kw):
         """This is an abstract class!"""
         self.name = name
         self.action = action
         self.args = args
         self.kw = kw
+        # statistics of the runs of this task (times in seconds)
+        self.runs = 0
+        self.skipped = 0
+        self.last_duration = None
+        self.total_duration = 0.0
+        self.lateness = None
+        self.max_lateness = 0.0
 
     def __call__(self, schedulerref):
         """Execute the task action in the scheduler's thread."""
-        try:
-            self.execute()
-        except Exception, e:
-            self.handle_exception(e)
+        if self.runs_today():
+            due, start = self.event[0], time.time()
+            try:
+                self.execute()
+            except Exception, e:
+                self.handle_exception(e)
+            self._record_run(due, start, time.time())
         self.reschedule(schedulerref())
 
+    def runs_today(self):
+        """Check whether the task shall be run today."""
+        return True
+
+    def _record_run(self, due, start, end):
+        # Record the statistics of a run of this task.
+        self.runs += 1
+        self.last_duration = end - start
+        self.total_duration += self.last_duration
+        self.lateness = max(start - due, 0.0)
+        self.max_lateness = max(self.max_lateness, self.lateness)
+
     def reschedule(self, scheduler):
         """This is an abstract class, this method is defined in one of the sub classes!"""
         raise NotImplementedError("you're using the abstract base class 'Task', use a concrete class instead")
@@ -279,11 +417,14 @@ class WeekdayTask(DayTaskRescheduler, Task):
         Task.__init__(self, name, action, args, kw)
         self.days = weekdays
 
+    def runs_today(self):
+        # check if we should run this task today (this day of the week).
+        return time.localtime().tm_wday + 1 in self.days
+
     def execute(self):
         # This is called every day, at the correct time. We only need to
         # check if we should run this task today (this day of the week).
-        weekday = time.localtime().tm_wday + 1
-        if weekday in self.days:
+        if self.runs_today():
             self.action(*self.args, **self.kw)
 
 class MonthdayTask(DayTaskRescheduler, Task):
@@ -297,10 +438,14 @@ class MonthdayTask(DayTaskRescheduler, Task):
         Task.__init__(self, name, action, args, kw)
         self.days = monthdays
 
+    def runs_today(self):
+        # check if we should run this task today (this day of the month).
+        return time.localtime().tm_mday in self.days
+
     def execute(self):
         # This is called every day, at the correct time. We only need to
         # check if we should run this task today (this day of the month).
-        if time.localtime().tm_mday in self.days:
+        if self.runs_today():
             self.action(*self.args, **self.kw)
 
 
@@ -309,9 +454,6 @@ try:
 
     class ThreadedScheduler(Scheduler):
         """A Scheduler that runs in its own thread."""
-        def __init__(self):
-            Scheduler.__init__(self)
-            self._lock = threading.Lock()     # we require a lock around the task queue
         def start(self):
             # Start method that splices of a thread in which the scheduler will run.
             self.thread = threading.Thread(target=self._run)
@@ -324,24 +466,25 @@ try:
                 self.thread.join()
             except AttributeError:
                 pass
-        def _acquire_lock(self):
-            self._lock.acquire()    # lock the thread's task queue
-        def _release_lock(self):
-            self._lock.release()    # release the thread's task queue
 
     class ThreadedTaskMixin:
         """A mixin class to make a Task execute in a separate thread."""
         def __call__(self, schedulerref):
             # execute the task action in its own thread.
-            threading.Thread(target=self.threadedcall).start()
+            if self.runs_today():
+                threading.Thread(target=self.threadedcall,
+                    args=(self.event[0],)).start()
             self.reschedule(schedulerref())
-        def threadedcall(self):
+        def threadedcall(self, due=None):
             # This method is run within its own thread, so we have to
             # do the execute() call and exception handling here.
+            start = time.time()
             try:
                 self.execute()
             except Exception, e:
                 self.handle_exception(e)
+            if due is not None:
+                self._record_run(due, start, time.time())
 
     class ThreadedIntervalTask(ThreadedTaskMixin, IntervalTask):
         """Interval Task that executes in its own thread."""
@@ -353,6 +496,142 @@ try:
         """Monthday Task that executes in its own thread."""
         pass
 
+    import Queue
+
+    class ThreadWorkerPool:
+        """A fixed number of threads executing pooled tasks."""
+        def __init__(self, workers):
+            self.workers = workers
+            self.queue = Queue.Queue()
+            self.threads = []
+            self.running = True
+        def submit(self, func, args, callback):
+            # Call func with args in a worker thread and pass the
+            # result to the callback, starting the threads if needed.
+            if not self.running:
+                return
+            if not self.threads:
+                for n in range(self.workers):
+                    thread = threading.Thread(target=self.work)
+                    thread.setDaemon(True)
+                    thread.start()
+                    self.threads.append(thread)
+            self.queue.put((func, args, callback))
+        def work(self):
+            # The loop of the worker threads.
+            while True:
+                job = self.queue.get()
+                if job is None:
+                    break
+                func, args, callback = job
+                callback(func(*args))
+        def stop(self):
+            # Let the threads exit after the runs which are already queued.
+            self.running = False
+            for thread in self.threads:
+                self.queue.put(None)
+            self.threads = []
+
+    class ProcessWorkerPool:
+        """A fixed number of persistent processes executing pooled tasks."""
+        def __init__(self, workers):
+            import multiprocessing # Python >= 2.6
+            self.pool = multiprocessing.Pool(workers)
+            self.running = True
+        def submit(self, func, args, callback):
+            # Call func with args in a worker process and pass the
+            # result to the callback in the parent process.
+            if self.running:
+                self.pool.apply_async(func, args, callback=callback)
+        def stop(self):
+            # Let the processes exit after the runs which are already queued.
+            self.running = False
+            self.pool.close()
+
+    def create_worker_pool():
+        """Create the worker pool for pooled tasks as configured."""
+        from turbogears import config
+        workers = int(config.get('tg.scheduler.workers', 4))
+        if workers < 1:
+            raise ValueError("tg.scheduler.workers must be >0")
+        pool = config.get('tg.scheduler.pool', 'thread')
+        if pool == 'thread':
+            return ThreadWorkerPool(workers)
+        elif pool == 'process':
+            return ProcessWorkerPool(workers)
+        raise ValueError("tg.scheduler.pool must be 'thread' or 'process'")
+
+    def _execute_pooled(action, args, kw):
+        # Execute a task action in a worker thread or process.
+        # The error is returned as string, since it must be pickled.
+        start = time.time()
+        try:
+            action(*args, **kw)
+            error = None
+        except Exception:
+            error = "".join(traceback.format_exception(*sys.exc_info()))
+        return start, time.time(), error
+
+    # lock for the run states and statistics of pooled tasks
+    _pooled_lock = threading.Lock()
+
+    class PooledTaskMixin:
+        """A mixin class to make a Task execute in the scheduler's worker pool."""
+        _active = 0 # number of submitted runs
+        _waiting = None # due time of the run waiting for the previous one
+        def __call__(self, schedulerref):
+            # submit the task action to the worker pool.
+            scheduler = schedulerref()
+            if self.runs_today():
+                due = self.event[0]
+                _pooled_lock.acquire()
+                try:
+                    if not self._active or self.overlap == 'concurrent':
+                        self._active += 1
+                    elif self.overlap == 'queue' and self._waiting is None:
+                        self._waiting, due = due, None
+                    else:
+                        self.skipped += 1
+                        due = None
+                finally:
+                    _pooled_lock.release()
+                if due is not None:
+                    self._submit(scheduler.get_pool(), due)
+            self.reschedule(scheduler)
+        def _submit(self, pool, due):
+            # submit a run of the task action which was due at the given time.
+            def callback(result):
+                self._finished(pool, due, result)
+            pool.submit(_execute_pooled, (self.action, self.args, self.kw),
+                callback)
+        def _finished(self, pool, due, result):
+            # This is called when a run has finished.
+            start, end, error = result
+            if error:
+                print >> sys.stderr, "ERROR DURING TASK EXECUTION"
+                print >> sys.stderr, error
+                print >> sys.stderr, "-"*20
+            _pooled_lock.acquire()
+            try:
+                self._record_run(due, start, end)
+                due, self._waiting = self._waiting, None
+                if due is None:
+                    self._active -= 1
+            finally:
+                _pooled_lock.release()
+            if due is not None:
+                self._submit(pool, due)
+
+    class PooledIntervalTask(PooledTaskMixin, IntervalTask):
+        """Interval Task that executes in the scheduler's worker pool."""
+        pass
+    class PooledWeekdayTask(PooledTaskMixin, WeekdayTask):
+        """Weekday Task that executes in the scheduler's worker pool."""
+        pass
+    class PooledMonthdayTask(PooledTaskMixin, MonthdayTask):
+        """Monthday Task that executes in the scheduler's worker pool."""
+        pass
+
 except ImportError:
     # threading is not available
     pass
@@ -377,18 +656,28 @@ if hasattr(os,"fork"):
             else:
                 # we are the parent
                 self.childpid = pid
-                del self.sched      # can no longer insert in the scheduler queue
+                del self.queue      # can no longer insert in the scheduler queue
         def stop(self):
             # Stop method that stops the scheduler and waits for the process to finish.
             os.kill(self.childpid, signal.SIGUSR1)
             os.waitpid(self.childpid, 0)
         def signalhandler(self, sig, stack):
             Scheduler.stop(self)
+        def _wait(self, timeout=None):
+            # No other thread can change the queue of the forked process,
+            # so just sleep until a signal arrives, like the stop signal.
+            if timeout is None:
+                signal.pause()
+            else:
+                time.sleep(timeout)
 
     class ForkedTaskMixin:
         """A mixin class to make a Task execute in a separate process."""
         def __call__(self, schedulerref):
             # execute the task action in its own process.
+            if not self.runs_today():
+                self.reschedule(schedulerref())
+                return
             pid = os.fork()
             if pid == 0:
                 # we are the child
@@ -399,6 +688,7 @@ if hasattr(os,"fork"):
                 os._exit(0)
             else:
                 # we are the parent
+                self.runs += 1
                 self.reschedule(schedulerref())
 
     class ForkedIntervalTask(ForkedTaskMixin, IntervalTask):
@@ -411,6 +701,150 @@ if hasattr(os,"fork"):
         """Monthday Task that executes in its own process."""
         pass
 
+def task_lock_name(task):
+    """Return the name under which a task is claimed by a process."""
+    if task.name:
+        return task.name
+    action = task.action
+    name = getattr(action, '__name__', None) or action.__class__.__name__
+    im_class = getattr(action, 'im_class', None)
+    if im_class is not None:
+        name = '%s.%s' % (im_class.__name__, name)
+    return '%s.%s' % (getattr(action, '__module__', None), name)
+
+
+class FileTaskLock:
+    """Lock backend claiming tasks with file locks.
+
+    The lock files are created in the given directory, which must be
+    private. A task is claimed as long as the process holds the lock
+    on its file, so the ttl is not used.
+
+    """
+    def __init__(self, directory, prefix='turbogears'):
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        # Everybody who can lock the files can block the tasks,
+        # so we make sure that the directory is private.
+        stat = os.stat(directory)
+        if stat.st_uid != os.getuid() or stat.st_mode & 077:
+            raise ValueError("Directory of the scheduler lock files %s"
+                " must be private." % directory)
+        self.directory = directory
+        self.prefix = prefix
+        self.files = {}
+
+    def acquire(self, name, ttl):
+        """Claim the task with the given name for this process."""
+        if name in self.files:
+            return True
+        import fcntl
+        path = os.path.join(self.directory, '%s.%s.lock'
+            % (self.prefix, re.sub(r'[^\w.-]', '_', name)))
+        lockfile = open(path, 'a')
+        try:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lockfile.close()
+            return False
+        self.files[name] = lockfile
+        return True
+
+    def release(self, name):
+        """Release the claim on the task with the given name."""
+        lockfile = self.files.pop(name, None)
+        if lockfile is not None:
+            lockfile.close()
+
+    def close(self):
+        """Release all claims of this process."""
+        for name in self.files.keys():
+            self.release(name)
+
+
+class DatabaseTaskLock:
+    """Lock backend claiming tasks with lease rows in a database.
+
+    The leases are kept in a table with the name, the owner and the
+    expiry time of every claimed task, which is created if needed.
+    A lease is acquired by updating the row if it has expired or
+    belongs to this process, or by inserting the row if there is none.
+
+    """
+    def __init__(self, dburi, tablename='tg_scheduler_lease'):
+        import sqlalchemy
+        try:
+            from sqlalchemy.exc import DBAPIError
+        except ImportError: # SQLAlchemy < 0.5
+            try:
+                from sqlalchemy.exceptions import DBAPIError
+            except ImportError: # SQLAlchemy 0.3
+                from sqlalchemy.exceptions import SQLError as DBAPIError
+        self.DBAPIError = DBAPIError
+        self.and_, self.or_ = sqlalchemy.and_, sqlalchemy.or_
+        self.engine = sqlalchemy.create_engine(dburi)
+        try:
+            metadata = sqlalchemy.MetaData(bind=self.engine)
+        except TypeError: # SQLAlchemy 0.3
+            metadata = sqlalchemy.BoundMetaData(self.engine)
+        self.table = sqlalchemy.Table(tablename, metadata,
+            sqlalchemy.Column('name', sqlalchemy.String(255),
+                primary_key=True),
+            sqlalchemy.Column('owner', sqlalchemy.String(255),
+                nullable=False),
+            sqlalchemy.Column('expires', sqlalchemy.Float, nullable=False))
+        self.table.create(checkfirst=True)
+        self.token = '%s:%08x' % (socket.gethostname(),
+            random.getrandbits(32))
+
+    def owner(self):
+        """Return the owner name of the leases of this process."""
+        return '%s:%d' % (self.token, os.getpid())
+
+    def acquire(self, name, ttl):
+        """Claim the task with the given name for ttl seconds."""
+        table, owner, now = self.table, self.owner(), time.time()
+        c = table.c
+        result = table.update(self.and_(c.name == name,
+                self.or_(c.owner == owner, c.expires < now)),
+            values=dict(owner=owner, expires=now + ttl)).execute()
+        if result.rowcount:
+            return True
+        try:
+            table.insert().execute(name=name, owner=owner, expires=now + ttl)
+        except self.DBAPIError: # the lease is held by another process
+            return False
+        return True
+
+    def release(self, name):
+        """Release the lease on the task with the given name."""
+        c = self.table.c
+        self.table.delete(self.and_(c.name == name,
+            c.owner == self.owner())).execute()
+
+    def close(self):
+        """Release all leases of this process."""
+        self.table.delete(self.table.c.owner == self.owner()).execute()
+
+
+def create_task_lock():
+    """Create the lock backend specified in the config file or None."""
+    from turbogears import config
+    lock = config.get('tg.scheduler.lock', None)
+    if not lock:
+        return None
+    if lock == 'file':
+        directory = config.get('tg.scheduler.lock.dir', None)
+        if not directory:
+            directory = os.path.join(tempfile.gettempdir(),
+                'tg-scheduler-%d' % os.getuid())
+        return FileTaskLock(directory, get_package_name() or 'turbogears')
+    if lock == 'database':
+        return DatabaseTaskLock(config.get('tg.scheduler.lock.dburi', None)
+            or config.get('sqlalchemy.dburi'))
+    return load_class(lock)()
+
+
 _scheduler_instance = None
 
 def _get_scheduler():
@@ -422,7 +856,10 @@ def _get_scheduler():
     return si
 
 def _start_scheduler():
+    from turbogears import config
     si = _get_scheduler()
+    si.lock = create_task_lock()
+    si.lock_grace = float(config.get('tg.scheduler.lock.grace', 60))
     si.start()
 
 def _stop_scheduler():
@@ -432,27 +869,28 @@ def _stop_scheduler():
     si.stop()
 
 def add_interval_task(action, interval, args=None, kw=None,
-        initialdelay=0, processmethod=method.threaded, taskname=None):
+        initialdelay=0, processmethod=method.threaded, taskname=None,
+        overlap='skip'):
     si = _get_scheduler()
     return si.add_interval_task(action=action, interval=interval, args=args,
             kw=kw, initialdelay=initialdelay,
-            processmethod=processmethod, taskname=taskname)
+            processmethod=processmethod, taskname=taskname, overlap=overlap)
 
 def add_weekday_task(action, weekdays, timeonday, args=None, kw=None,
-        processmethod=method.threaded, taskname=None):
+        processmethod=method.threaded, taskname=None, overlap='skip'):
     si = _get_scheduler()
     return si.add_daytime_task(action=action, taskname=taskname,
             weekdays=weekdays, monthdays=None, timeonday=timeonday,
-            processmethod=processmethod, args=args, kw=kw)
+            processmethod=processmethod, args=args, kw=kw, overlap=overlap)
 
 
 def add_monthday_task(action, monthdays, timeonday,
         args=None, kw=None,
-        processmethod=method.threaded, taskname=None):
+        processmethod=method.threaded, taskname=None, overlap='skip'):
     si = _get_scheduler()
     return si.add_daytime_task(action=action, taskname=taskname,
             weekdays=None, monthdays=monthdays, timeonday=timeonday,
-            processmethod=processmethod, args=args, kw=kw)
+            processmethod=processmethod, args=args, kw=kw, overlap=overlap)
 
 def cancel(task):
     si = _get_scheduler()
@@ -17,7 +17,7 @@ from cherrypy._cpwsgi import wsgiApp, CPHTTPRequest
 from cherrypy._cpwsgiserver import CherryPyWSGIServer
 
 from turbogears import config, scheduler, database
-from turbogears import view
+from turbogears import view, i18n
 from turbogears.database import hub_registry, EndTransactionsFilter
 
 log = logging.getLogger("turbogears.startup")
@@ -244,6 +244,10 @@ def startTurboGears():
     view.load_engines()
     view.loadBaseTemplates()
 
+    # Load the message catalogs before the first request needs them
+    if config.get('i18n.preload_catalogs', False):
+        i18n.preload_catalogs()
+
     # Add request filters
     global webpath
     webpath = config.get('server.webpath') or ''
@@ -0,0 +1,123 @@
+import cherrypy
+
+from turbogears import cache_page, controllers, expose, flash
+from turbogears.cache import MemoryPageCache
+from turbogears.testutil import create_request
+
+
+page_cache = MemoryPageCache()
+
+
+class CacheRoot(controllers.RootController):
+
+    def __init__(self):
+        self.calls = 0
+        page_cache.clear()
+
+    [cache_page(ttl=60, backend=page_cache)]
+    [expose("turbogears.tests.simple")]
+    [expose("json")]
+    def cached(self, value="foo"):
+        self.calls += 1
+        return dict(title="Foobar", mybool=False,
+            someval="%s %d" % (value, self.calls))
+
+    [cache_page(backend=page_cache)]
+    [expose("json")]
+    def headers(self):
+        self.calls += 1
+        cherrypy.response.headers["Cache-Control"] = "max-age=60"
+        cherrypy.response.headers["X-Calls"] = str(self.calls)
+        return dict(calls=self.calls)
+
+    [cache_page(ttl=0, backend=page_cache)]
+    [expose("json")]
+    def expired(self):
+        self.calls += 1
+        return dict(calls=self.calls)
+
+    [cache_page(backend=page_cache)]
+    [expose("json")]
+    def flashing(self):
+        self.calls += 1
+        flash("Cached?")
+        return dict(calls=self.calls)
+
+
+def test_cached_page():
+    root = cherrypy.root = CacheRoot()
+    create_request("/cached")
+    assert "Paging all foo 1" in cherrypy.response.body[0]
+    etag = cherrypy.response.headers["ETag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    create_request("/cached")
+    assert "Paging all foo 1" in cherrypy.response.body[0]
+    assert cherrypy.response.headers["ETag"] == etag
+    assert root.calls == 1
+
+
+def test_cache_key():
+    root = cherrypy.root = CacheRoot()
+    create_request("/cached")
+    create_request("/cached?value=bar")
+    assert "Paging all bar 2" in cherrypy.response.body[0]
+    create_request("/cached?tg_format=json")
+    assert '"someval": "foo 3"' in cherrypy.response.body[0]
+    assert cherrypy.response.headers["Content-Type"].startswith(
+        "application/json")
+    create_request("/cached?tg_format=json")
+    assert cherrypy.response.headers["Content-Type"].startswith(
+        "application/json")
+    create_request("/cached")
+    assert cherrypy.response.headers["Content-Type"].startswith("text/html")
+    assert root.calls == 3
+
+
+def test_not_modified():
+    root = cherrypy.root = CacheRoot()
+    create_request("/cached")
+    etag = cherrypy.response.headers["ETag"]
+    create_request("/cached", headers={"If-None-Match": '"other", ' + etag})
+    assert cherrypy.response.status.startswith("304")
+    assert not "".join(cherrypy.response.body)
+    create_request("/cached", headers={"If-None-Match": '"other"'})
+    assert cherrypy.response.status.startswith("200")
+    assert root.calls == 1
+
+
+def test_cached_headers():
+    root = cherrypy.root = CacheRoot()
+    create_request("/headers")
+    create_request("/headers")
+    assert root.calls == 1
+    headers = cherrypy.response.headers
+    assert headers["Cache-Control"] == "max-age=60"
+    assert headers["X-Calls"] == "1"
+    assert headers["Content-Type"].startswith("application/json")
+    assert "Set-Cookie" not in headers
+
+
+def test_uncached_pages():
+    root = cherrypy.root = CacheRoot()
+    create_request("/expired")
+    create_request("/expired")
+    assert root.calls == 2
+    create_request("/cached", method="POST")
+    create_request("/cached", method="POST")
+    assert root.calls == 4
+    # pages setting cookies are not cached
+    create_request("/flashing")
+    create_request("/flashing")
+    assert root.calls == 6
+
+
+def test_memory_cache():
+    cache = MemoryPageCache(size=2)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, -1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    cache.set("b", 2, 60)
+    cache.set("c", 3, 60)
+    assert cache.get("c") == 3
+    assert len(cache) == 2 and cache.get("a") is None
@@ -18,6 +18,10 @@ class ExposeRoot(controllers.RootController):
     def with_json_via_accept(self):
         return dict(title="Foobar", mybool=False, someval="foo")
 
+    [expose("turbogears.tests.simple", stream=True)]
+    def streamed(self):
+        return dict(someval="streamed")
+
 
 def test_gettinghtml():
     cherrypy.root = ExposeRoot()
@@ -51,6 +55,21 @@ def test_getting_plaintext():
     print cherrypy.response.body[0]
     assert cherrypy.response.body[0] == "This is a plain text for foo."
 
+def test_streamed():
+    cherrypy.root = ExposeRoot()
+    create_request("/streamed")
+    assert cherrypy.response.headers["Content-Type"] == \
+        "text/html; charset=utf-8"
+    assert "Content-Length" not in cherrypy.response.headers
+    body = "".join(cherrypy.response.body)
+    assert "Paging all streamed" in body
+    # streaming is set for the request, not in the shared configuration
+    assert not cherrypy.config.get('stream_response')
+    assert not [path for path, settings in cherrypy.config.configs.items()
+        if 'stream_response' in settings]
+    assert not [name for name, value in cherrypy.response.header_list
+        if name == "Content-Length"]
+
 def test_allow_json():
 
     class NewRoot(controllers.RootController):
@@ -71,3 +90,23 @@ def test_allow_json():
     assert values == dict(title="Foobar", mybool=False, someval="niggles",
         tg_flash=None)
     assert cherrypy.response.headers["Content-Type"] == "application/json"
+
+def test_dispatch_table():
+    root = ExposeRoot()
+    func = root.with_json_via_accept
+    formats, accepts = controllers._build_dispatch_table(func)
+    assert sorted(formats) == ["cheetah", "default", "json"]
+    assert sorted(accepts) == ["application/json", "text/plain"]
+
+def test_dispatch_fallback():
+
+    class QuoteRoot(controllers.RootController):
+        [expose("turbogears.tests.simple")]
+        [expose("json", as_format='j"s"on')]
+        def test(self):
+            return dict(title="Foobar", mybool=False, someval="foo")
+
+    cherrypy.root = QuoteRoot()
+    create_request("/test")
+    assert controllers._build_dispatch_table(cherrypy.root.test) is None
+    assert "Paging all foo" in cherrypy.response.body[0]
@@ -126,6 +126,27 @@ def test_include_widgets():
     config.update({"global": {"tg.include_widgets": []}})
     assert "MochiKit.js" in cherrypy.response.body[0]
 
+def test_include_widgets_cache():
+    """The included widgets are cached until the configuration changes"""
+    config.update({"global": {"tg.include_widgets": ["mochikit"]}})
+    include_widgets = controllers._get_include_widgets()
+    assert controllers._get_include_widgets() is include_widgets
+    assert "tg_mochikit" in include_widgets[0]
+    assert mochikit in include_widgets[2]['head']
+    assert not include_widgets[3]
+    config.update({"global": {"tg.include_widgets": []}})
+    testutil.create_request("/")
+    assert "MochiKit.js" not in cherrypy.response.body[0]
+    assert not controllers._get_include_widgets()[0]
+
+def test_mochikit_all_keeps_config():
+    """Setting tg.mochikit_all does not alter tg.include_widgets"""
+    config.update({"global": {"tg.mochikit_all": True}})
+    testutil.create_request("/")
+    testutil.create_request("/")
+    config.update({"global": {"tg.mochikit_all": False}})
+    assert config.get("tg.include_widgets", []) == []
+
 
 class State(object):
     counter = 0
@@ -66,6 +66,17 @@ class TestMemoryProfilerSetup(TestCase):
         assert_that(state, equal_to(MemoryProfilerState.UNKNOWN))
         assert_that(params, equal_to(None))
 
+    def test__get_state_from_pipe_command_catalogs(self):
+        state, params = _get_state_from_pipe_command('catalogs')
+        assert_that(state, equal_to(MemoryProfilerState.CATALOGS))
+        assert_that(params, equal_to({'reload': False}))
+        state, params = _get_state_from_pipe_command('CATALOGS reload')
+        assert_that(state, equal_to(MemoryProfilerState.CATALOGS))
+        assert_that(params, equal_to({'reload': True}))
+        state, params = _get_state_from_pipe_command('catalogs nonsense')
+        assert_that(state, equal_to(MemoryProfilerState.UNKNOWN))
+        assert_that(params, equal_to(None))
+
     def test_toggle_memory_profile_via_fifo_on(self):
         thread_logger = MagicMock(info=MagicMock())
         config_fifo = MagicMock(readline=MagicMock(return_value='ON\n'))
@@ -1,5 +1,6 @@
 """Tests for paginate"""
 
+import re
 import unittest
 from urllib import quote
 import warnings
@@ -7,7 +8,8 @@ import warnings
 from turbogears import config, expose, database
 from turbogears.controllers import RootController, url
 from turbogears.database import get_engine, metadata, session, mapper
-from turbogears.paginate import paginate, sort_ordering, sort_data
+from turbogears.paginate import paginate, sort_ordering, sort_data, \
+    count_rows, estimate_count
 from turbogears.testutil import create_request, sqlalchemy_cleanup
 from turbojson.jsonify import jsonify
 
@@ -144,6 +146,27 @@ def test_sort_in_memory():
         assert sort_data(bA, ['b', '-a']) == bA
         assert sort_data(Ba, ['b', '-a']) == bA
         assert sort_data(BA, ['b', '-a']) == bA
+        # only the first rows are needed
+        assert sort_data(BA, ['a', 'b'], limit=1) == ab[:1]
+        assert sort_data(ab, ['-a', '-b'], limit=3) == AB[:3]
+        assert sort_data(iter(ab), ['a', '-b'], limit=2) == aB[:2]
+        assert sort_data(BA, ['-b', 'a'], limit=3) == Ba[:3]
+        assert sort_data(ab, ['b', '-a'], limit=5) == bA
+
+
+def estimate_rows(data):
+    """Row count estimator used by test_count_estimator."""
+    return 42
+
+
+def test_count_estimator():
+    """Test configuring the row count estimator with its dotted path."""
+    config.update({'paginate.count_estimator':
+        'turbogears.tests.test_paginate.estimate_rows'})
+    try:
+        assert count_rows(listlike(), 'estimated') == (42, False)
+    finally:
+        config.update({'paginate.count_estimator': estimate_count})
 
 
 class Spy(object):
@@ -373,6 +396,28 @@ class TestBasicPagination(TestPagination):
             data = []
             return dict(data=data, spy=spy)
 
+        [expose()]
+        [paginate("data", limit=4, stream=True)]
+        def stream(self):
+            spy = Spy(var_name='data', limit=4, order=None, ordering=[])
+            data = iter(range(10))
+            return dict(data=data, spy=spy)
+
+        [expose()]
+        [paginate("data", limit=4, stream='count')]
+        def stream_count(self):
+            spy = Spy(var_name='data', pages=xrange(1, 4), limit=4,
+                      page_count=3, order=None, ordering=[], row_count=10)
+            data = iter(range(10))
+            return dict(data=data, spy=spy)
+
+        [expose()]
+        [paginate("data", limit=4, default_order="-n", stream=True)]
+        def stream_sorted(self):
+            spy = Spy(var_name='data', limit=4, ordering=['-n'])
+            data = iter([dict(n=n) for n in range(10)])
+            return dict(data=data, spy=spy)
+
 
     def test_pagination_old_style(self):
         self.request("/basic")
@@ -664,6 +709,34 @@ class TestBasicPagination(TestPagination):
         finally:
             config.update({'server.webpath': ''})
 
+    def test_stream(self):
+        self.request("/stream")
+        assert '"data": [0, 1, 2, 3]' in self.body
+        Spy.assert_ok(self.body, 'page_count', 2)
+        Spy.assert_ok(self.body, 'row_count', 5)
+        Spy.assert_ok(self.body, 'exact_count', False)
+        self.request("/stream?data_tgp_no=2")
+        assert '"data": [4, 5, 6, 7]' in self.body
+        Spy.assert_ok(self.body, 'page_count', 3)
+        Spy.assert_ok(self.body, 'exact_count', False)
+        for page in 3, 4, 'last':
+            self.request("/stream?data_tgp_no=%s" % page)
+            assert '"data": [8, 9]' in self.body
+            Spy.assert_ok(self.body, 'current_page', 3)
+            Spy.assert_ok(self.body, 'row_count', 10)
+            Spy.assert_ok(self.body, 'exact_count', True)
+        self.request("/stream_count?data_tgp_no=2")
+        assert '"data": [4, 5, 6, 7]' in self.body
+        Spy.assert_ok(self.body, 'exact_count', True)
+
+    def test_stream_sorted(self):
+        self.request("/stream_sorted")
+        assert '"data": [{"n": 9}, {"n": 8}, {"n": 7}, {"n": 6}]' in self.body
+        self.request("/stream_sorted?data_tgp_no=last")
+        assert '"data": [{"n": 1}, {"n": 0}]' in self.body
+        Spy.assert_ok(self.body, 'current_page', 3)
+        Spy.assert_ok(self.body, 'row_count', 10)
+
     def test_empty_data(self):
         self.request("/empty")
         assert '"data": []' in self.body
@@ -702,7 +775,7 @@ class SOAddress(SQLObject):
     id = IntCol(),
     user_id = IntCol()
     street = StringCol()
-    city = StringCol()
+    city = StringCol(notNone=True)
 
     def __repr__(self):
         # using "[...]" instead of "<...>" avoids rendering "&lt;"
@@ -722,7 +795,7 @@ def create_tables():
         Column('id', Integer, primary_key=True),
         Column('user_id', Integer, ForeignKey("users.id")),
         Column('street', String(50)),
-        Column('city', String(40)))
+        Column('city', String(40), nullable=False))
 
     mapper(Occupation, occupations_table)
     mapper(User, users_table, properties={
@@ -832,6 +905,12 @@ class TestDatabasePagination(TestPagination):
         reversed3 = paginate("data", default_order=["-id"])(__common)
         reversed3 = expose("turbogears.tests.paginate")(reversed3)
 
+        # cached and combined row counts
+        cached_count = paginate("data", default_order="id", count='cached')(__common)
+        cached_count = expose("turbogears.tests.paginate")(cached_count)
+        combined_count = paginate("data", default_order="id", count='combined')(__common)
+        combined_count = expose("turbogears.tests.paginate")(combined_count)
+
         # +/+
         default_compound_ordering1 = paginate("data", default_order=["city", "street"])(__common)
         default_compound_ordering1 = expose("turbogears.tests.paginate")(default_compound_ordering1)
@@ -890,6 +969,54 @@ class TestDatabasePagination(TestPagination):
                       order=None, row_count=0)
             return dict(data=data, spy=spy)
 
+        [expose("turbogears.tests.paginate")]
+        [paginate("data", default_order="city", limit=5, mode='keyset')]
+        def keyset(self, method=None):
+            if method == 'Q':
+                data = session.query(Address)
+            elif method == 'QA':
+                data = session.query(Address).all()
+            elif method == 'SR':
+                data = SASelectResults(session.query(Address))
+            elif method == 'SO':
+                data = SOAddress.select()
+            elif method == 'SL':
+                data = list(SOAddress.select())
+            else:
+                raise ValueError("Invalid method %r" % method)
+
+            spy = Spy(var_name='data', limit=5, page_count=4,
+                      order=None, row_count=16)
+            return dict(data=data, spy=spy)
+
+        [expose("turbogears.tests.paginate")]
+        [paginate("data", default_order="user_id", limit=5, mode='keyset')]
+        def keyset_nullable(self, method=None):
+            if method == 'Q':
+                data = session.query(Address)
+            elif method == 'SO':
+                data = SOAddress.select()
+            else:
+                raise ValueError("Invalid method %r" % method)
+            spy = Spy(var_name='data', limit=5, page_count=4,
+                      order=None, row_count=16)
+            return dict(data=data, spy=spy)
+
+        [expose("turbogears.tests.paginate")]
+        [paginate("data", default_order="id", limit=5, stream=True)]
+        def stream(self, method=None):
+            if method == 'Q':
+                data = session.query(Address)
+            elif method == 'SR':
+                data = SASelectResults(session.query(Address))
+            elif method == 'SO':
+                data = SOAddress.select()
+            else:
+                raise ValueError("Invalid method %r" % method)
+
+            spy = Spy(var_name='data', limit=5, order=None)
+            return dict(data=data, spy=spy)
+
 
     def assert_order(self, *args):
         expr = 'data="%s"' % ''.join(['[Address %r]' % x for x in args])
@@ -942,6 +1069,23 @@ class TestDatabasePagination(TestPagination):
                 Spy.assert_ok(self.body, 'last_item', 16)
                 Spy.assert_ok(self.body, 'ordering', ['street'])
 
+    def test_count(self):
+        for test in "cached_count", "combined_count":
+            for method in query_methods:
+                self.request("/%s?method=%s" % (test, method))
+                self.assert_order(1, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+                Spy.assert_ok(self.body, 'row_count', 16)
+                self.request("/%s?method=%s&data_tgp_no=2" % (test, method))
+                self.assert_order(11, 12, 13, 14, 15, 16)
+                Spy.assert_ok(self.body, 'row_count', 16)
+        # counts taken from the cache are not exact
+        self.request("/cached_count?method=Q")
+        Spy.assert_ok(self.body, 'exact_count', False)
+        self.request("/combined_count?method=Q")
+        Spy.assert_ok(self.body, 'exact_count', True)
+        self.request("/combined_count?method=Q&data_tgp_no=last")
+        self.assert_order(11, 12, 13, 14, 15, 16)
+
     def test_strict_parameters(self):
         config.update({'tg.strict_parameters': True})
         try:
@@ -1180,6 +1324,69 @@ class TestDatabasePagination(TestPagination):
         self.request("/empty_with_groupby")
         self.assert_order()
 
+    def get_attribute(self, name):
+        cursor = re.search(r"%s=('[^']*'|None) " % name, self.body).group(1)
+        return eval(cursor)
+
+    def test_keyset(self):
+        for method in query_methods:
+            self.request("/keyset?method=%s" % method)
+            self.assert_order(1, 3, 9, 10, 12)
+            cursor = self.get_attribute('cursor_next')
+            if method in ('QA', 'SL'):
+                # lists are paged by offset
+                assert cursor is None
+            else:
+                assert cursor
+                assert 'data_tgp_cursor=' in self.get_attribute('href_next')
+                self.request("/keyset?method=%s&data_tgp_no=2"
+                    "&data_tgp_cursor=%s" % (method, quote(cursor)))
+            self.assert_order(13, 16, 4, 7, 8)
+            Spy.assert_ok(self.body, 'current_page', 2)
+            # jump to a page without cursor
+            self.request("/keyset?method=%s&data_tgp_no=3" % method)
+            self.assert_order(14, 15, 2, 5, 6)
+            cursor = self.get_attribute('cursor_prev')
+            if cursor:
+                self.request("/keyset?method=%s&data_tgp_no=2"
+                    "&data_tgp_cursor=%s" % (method, quote(cursor)))
+                self.assert_order(13, 16, 4, 7, 8)
+            self.request("/keyset?method=%s&data_tgp_no=last" % method)
+            self.assert_order(11)
+            Spy.assert_ok(self.body, 'current_page', 4)
+            # invalid cursors are ignored
+            self.request("/keyset?method=%s&data_tgp_no=2"
+                "&data_tgp_cursor=invalid" % method)
+            self.assert_order(13, 16, 4, 7, 8)
+
+    def test_keyset_nullable(self):
+        # rows with NULL keys cannot be found by comparison,
+        # so these are paged by offset
+        for method in ('Q', 'SO'):
+            self.request("/keyset_nullable?method=%s&data_tgp_no=2" % method)
+            Spy.assert_ok(self.body, 'current_page', 2)
+            assert self.get_attribute('cursor_next') is None
+
+    def test_stream(self):
+        for method in query_methods:
+            if method in ('QA', 'SL'):
+                continue
+            self.request("/stream?method=%s" % method)
+            self.assert_order(1, 2, 3, 4, 5)
+            Spy.assert_ok(self.body, 'page_count', 2)
+            Spy.assert_ok(self.body, 'exact_count', False)
+            self.request("/stream?method=%s&data_tgp_no=3" % method)
+            self.assert_order(11, 12, 13, 14, 15)
+            Spy.assert_ok(self.body, 'row_count', 16)
+            Spy.assert_ok(self.body, 'exact_count', False)
+            for page in 4, 5, 'last':
+                self.request("/stream?method=%s&data_tgp_no=%s"
+                    % (method, page))
+                self.assert_order(16)
+                Spy.assert_ok(self.body, 'current_page', 4)
+                Spy.assert_ok(self.body, 'row_count', 16)
+                Spy.assert_ok(self.body, 'exact_count', True)
+
 
 def setup_module():
     global _sa_dburi, _so_dburi
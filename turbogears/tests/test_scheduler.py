@@ -0,0 +1,228 @@
+"""Tests for the scheduler"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from turbogears import scheduler
+
+
+class Recorder(object):
+    """Helper class recording the times when a task was run."""
+
+    def __init__(self):
+        self.times = []
+        self.event = threading.Event()
+
+    def __call__(self):
+        self.times.append(time.time())
+        self.event.set()
+
+
+def test_wake_up_for_new_first_task():
+    s = scheduler.ThreadedScheduler()
+    s.start()
+    try:
+        late, early = Recorder(), Recorder()
+        s.add_interval_task(late, 'late', 3600, 3600,
+            scheduler.method.sequential, None, None)
+        time.sleep(0.1)
+        start = time.time()
+        s.add_interval_task(early, 'early', 0.2, 3600,
+            scheduler.method.sequential, None, None)
+        early.event.wait(2)
+        assert early.times, "task has not been run"
+        assert 0.15 < early.times[0] - start < 1
+        assert not late.times
+    finally:
+        s.stop()
+
+
+def test_cancel():
+    s = scheduler.ThreadedScheduler()
+    s.start()
+    try:
+        first, second = Recorder(), Recorder()
+        task = s.add_interval_task(first, 'first', 0.2, 3600,
+            scheduler.method.sequential, None, None)
+        s.add_interval_task(second, 'second', 0.4, 3600,
+            scheduler.method.sequential, None, None)
+        s.cancel(task)
+        try:
+            s.cancel(task)
+        except ValueError:
+            pass
+        else:
+            assert False, "task could be cancelled twice"
+        second.event.wait(2)
+        assert second.times
+        assert not first.times
+        assert [event[2].name for event in s.queue
+            if event[2] is not None] == ['second']
+    finally:
+        s.stop()
+
+
+def test_cancel_many():
+    s = scheduler.Scheduler()
+    tasks = [s.add_interval_task(Recorder(), 'task%d' % n, 3600 + n, 3600,
+        scheduler.method.sequential, None, None) for n in range(10)]
+    for task in tasks[:8]:
+        s.cancel(task)
+    # the heap has been rebuilt without the cancelled tasks
+    assert len(s.queue) < 10
+    assert [event[2] for event in sorted(s.queue)
+        if event[2] is not None] == tasks[8:]
+
+
+def test_cancel_stopped():
+    s = scheduler.Scheduler()
+    task = s.add_interval_task(Recorder(), 'task', 3600, 3600,
+        scheduler.method.sequential, None, None)
+    s.stop()
+    # the queue is empty, but the task has not been run or cancelled
+    s.cancel(task)
+    assert not s.queue
+
+
+def test_stop_idle_scheduler():
+    s = scheduler.ThreadedScheduler()
+    s.start()
+    time.sleep(0.1)
+    start = time.time()
+    s.stop()
+    assert time.time() - start < 1
+    assert not s.thread.isAlive()
+
+
+class SlowAction(object):
+    """Helper class recording how many runs of a task overlapped."""
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        self.lock.acquire()
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.lock.release()
+        time.sleep(self.duration)
+        self.lock.acquire()
+        self.active -= 1
+        self.lock.release()
+
+
+def test_pooled_overlap():
+    for overlap, max_active in ('skip', 1), ('queue', 1), ('concurrent', 2):
+        s = scheduler.ThreadedScheduler()
+        s.pool = scheduler.ThreadWorkerPool(2)
+        s.start()
+        try:
+            action = SlowAction(0.35)
+            task = scheduler.PooledIntervalTask('slow', 0.1, action, [], {})
+            task.overlap = overlap
+            s.schedule_task(task, 0)
+            time.sleep(1)
+        finally:
+            s.stop()
+        assert action.max_active == max_active, overlap
+        assert task.runs >= 1
+        assert task.last_duration >= 0.3
+        assert task.lateness is not None and task.lateness >= 0
+        if overlap == 'concurrent':
+            assert not task.skipped
+        else:
+            assert task.skipped
+
+
+def test_task_statistics():
+    s = scheduler.ThreadedScheduler()
+    s.start()
+    try:
+        recorder = Recorder()
+        task = s.add_interval_task(recorder, 'stats', 0, 3600,
+            scheduler.method.sequential, None, None)
+        recorder.event.wait(2)
+        time.sleep(0.1)
+        assert task.runs == 1
+        assert task.skipped == 0
+        assert 0 <= task.lateness < 1
+        assert task.total_duration == task.last_duration
+    finally:
+        s.stop()
+    try:
+        s.add_interval_task(recorder, 'invalid', 0, 3600,
+            scheduler.method.pooled, None, None, overlap='never')
+    except ValueError:
+        pass
+    else:
+        assert False, "invalid overlap policy accepted"
+
+
+def test_file_lock():
+    directory = tempfile.mkdtemp()
+    try:
+        lock1 = scheduler.FileTaskLock(directory)
+        lock2 = scheduler.FileTaskLock(directory)
+        assert lock1.acquire('task', 60)
+        assert lock1.acquire('task', 60)
+        assert not lock2.acquire('task', 60)
+        assert lock2.acquire('other task', 60)
+        lock1.close()
+        assert lock2.acquire('task', 60)
+        assert not lock1.acquire('task', 60)
+        lock2.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_database_lock():
+    handle, path = tempfile.mkstemp('.db')
+    os.close(handle)
+    try:
+        dburi = 'sqlite:///%s' % path
+        lock1 = scheduler.DatabaseTaskLock(dburi)
+        lock2 = scheduler.DatabaseTaskLock(dburi)
+        assert lock1.acquire('task', 0.3)
+        assert lock1.acquire('task', 0.3)
+        assert not lock2.acquire('task', 0.3)
+        assert lock2.acquire('other task', 0.3)
+        # the lease of a dead process expires
+        time.sleep(0.4)
+        assert lock2.acquire('task', 60)
+        assert not lock1.acquire('task', 60)
+        lock2.close()
+        assert lock1.acquire('task', 60)
+        lock1.close()
+    finally:
+        os.remove(path)
+
+
+def test_claimed_tasks():
+    directory = tempfile.mkdtemp()
+    schedulers, recorders = [], []
+    try:
+        for n in range(2):
+            s = scheduler.ThreadedScheduler()
+            s.lock = scheduler.FileTaskLock(directory)
+            recorder = Recorder()
+            s.schedule_task(scheduler.IntervalTask(
+                'claimed', 0.1, recorder, [], {}), 0.05 * n)
+            schedulers.append(s)
+            recorders.append(recorder)
+            s.start()
+        time.sleep(0.5)
+        assert len(recorders[0].times) > 2
+        assert not recorders[1].times
+        # the other scheduler takes over
+        schedulers[0].stop()
+        time.sleep(0.5)
+        assert len(recorders[1].times) > 2
+    finally:
+        for s in schedulers:
+            s.stop()
+        shutil.rmtree(directory)
@@ -24,6 +24,111 @@ def test_deprecated():
     stderr.close()
 
 
+def test_setlike():
+    s = util.setlike()
+    s.add_all([1, 2, 2, 3, 1])
+    assert s == [1, 2, 3]
+    assert isinstance(s, list)
+    assert 2 in s and 4 not in s
+    s.add(4)
+    s.add(2)
+    s.add_all([5, 1, 6])
+    assert s == [1, 2, 3, 4, 5, 6]
+    assert s[0] == 1 and s[-1] == 6
+    s.remove(2)
+    assert 2 not in s
+    s.add(2)
+    assert s == [1, 3, 4, 5, 6, 2]
+    del s[0]
+    assert 1 not in s
+    assert s.pop() == 2 and 2 not in s
+
+
+def test_setlike_list_methods():
+    s = util.setlike([1, 2, 2])
+    assert s == [1, 2, 2]
+    s.append(1)
+    s.extend([3, 3])
+    s += [4]
+    s.insert(0, 4)
+    assert s == [4, 1, 2, 2, 1, 3, 3, 4]
+    s.remove(2)
+    assert 2 in s
+    assert s.pop() == 4 and 4 in s
+    assert s.pop(0) == 4 and 4 not in s
+    s[0] = 5
+    assert s == [5, 2, 1, 3, 3] and 1 in s and 5 in s
+    del s[2]
+    assert 1 not in s
+    s[1:] = [6, 5]
+    assert s == [5, 6, 5] and 2 not in s and 3 not in s
+    del s[::2]
+    assert s == [6] and 5 not in s
+    s *= 2
+    s.remove(6)
+    assert s == [6] and 6 in s
+    s.add(6)
+    assert s == [6]
+
+
+def test_setlike_unhashable():
+    s = util.setlike()
+    s.add_all([[1], [1], 2, {}, {}])
+    assert s == [[1], 2, {}]
+    assert [1] in s and {} in s and [2] not in s
+    s.add([2])
+    s.add([1])
+    assert s == [[1], 2, {}, [2]]
+    s.append([2])
+    s.remove([2])
+    assert [2] in s
+    s[3] = 3
+    assert [2] not in s and 3 in s
+
+
+def test_setlike_copy():
+    s = util.setlike([1, 2])
+    t = util.setlike(s)
+    t.add(3)
+    assert s == [1, 2] and 3 not in s
+    assert t == [1, 2, 3] and 3 in t
+    from copy import copy, deepcopy
+    for t in copy(s), deepcopy(s):
+        assert isinstance(t, util.setlike)
+        assert t == [1, 2] and 2 in t
+
+
+
+def test_lru_cache():
+    cache = util.LRUCache(3)
+    for key in "abc":
+        cache.set(key, key.upper())
+    assert cache.get("a") == "A"
+    cache.set("d", "D")
+    assert "b" not in cache and len(cache) == 3
+    assert cache.get("b") is None
+    assert cache.get("b", "default") == "default"
+    cache.set("c", "C2")
+    cache.set("e", "E")
+    assert "a" not in cache
+    assert [cache.get(key) for key in "cde"] == ["C2", "D", "E"]
+    cache.clear()
+    assert len(cache) == 0 and cache.get("c") is None
+    assert cache.hits == 4 and cache.misses == 3
+
+def test_lru_cache_ttl():
+    cache = util.LRUCache(3, ttl=60)
+    cache.set("a", "A")
+    cache.set("b", "B", -1)
+    assert "a" in cache and "b" not in cache
+    assert cache.get("a") == "A" and cache.get("b") is None
+    assert len(cache) == 1
+    cache.remove("a")
+    assert cache.get("a") is None
+    cache = util.LRUCache(0)
+    cache.set("a", "A")
+    assert cache.get("a") is None
+
 def test_adapt_call():
     adapt = util.adapt_call
 
@@ -96,6 +201,27 @@ def test_adapt_call():
     assert adapt(f, (1, 2, 3), dict(y=4, z=5)) == ((1, 2, 3), dict(y=4, z=5))
 
 
+def test_get_signature():
+
+    def f(a, b, x=1, *args):
+        pass
+
+    signature = util.get_signature(f)
+    assert util.get_signature(f) is signature
+    assert signature.argnames == ('a', 'b', 'x')
+    assert signature.varargs == 'args'
+    assert signature.kwargs is None
+    assert signature.defaults == (1,)
+    assert signature.allowed(1) == frozenset(['b', 'x'])
+
+    class A(object):
+        def m(self, y):
+            pass
+
+    assert util.get_signature(A().m) is util.get_signature(A.m)
+    assert util.get_signature(A.m).argnames == ('self', 'y')
+
+
 def test_call_on_stack():
 
     def recurse(level):
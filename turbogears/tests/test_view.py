@@ -42,6 +42,32 @@ class TestView(unittest.TestCase):
         val = view.render(info, template="turbogears.tests.simple")
         self.failUnless(u"Paging all " + ustr in val.decode("utf-8"))
 
+    def test_render_stream(self):
+        template = "turbogears.tests.simple"
+        headers = {}
+        chunks = view.render_stream(dict(someval="streamed"), template,
+            headers=headers)
+        assert headers.get('Content-Type') == 'text/html; charset=utf-8'
+        assert "".join(chunks) == view.render(dict(someval="streamed"),
+            template)
+        chunks = view.render_stream(dict(someval="streamed"), template,
+            format='xml', fragment=True)
+        assert "".join(chunks) == view.render(dict(someval="streamed"),
+            template, format='xml', fragment=True)
+
+    def test_kid_template_filter(self):
+        from turbogears.i18n import i18n_filter
+        engine = view.engines['kid']
+        template = "turbogears.tests.simple"
+        t = view.kid_template(engine, template, dict(someval="filtered"))
+        assert i18n_filter not in t._filters
+        config.update({'i18n.run_template_filter': True})
+        try:
+            t = view.kid_template(engine, template, dict(someval="filtered"))
+            assert i18n_filter in t._filters
+        finally:
+            config.update({'i18n.run_template_filter': False})
+
     def test_templateRetrievalByPath(self):
         config.update({'server.environment' : 'development'})
         from turbokid import kidsupport
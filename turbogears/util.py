@@ -4,12 +4,15 @@ import os
 import sys
 import re
 import logging
+import threading
+import time
 import warnings
 import htmlentitydefs
 from inspect import getargspec, getargvalues
 from itertools import izip, islice, chain
 from operator import isSequenceType
 from urllib import quote, unquote
+from weakref import WeakKeyDictionary
 
 try:
     set
@@ -143,7 +146,57 @@ def Enum(*names):
 
 
 class setlike(list):
-    """Set preserving item order."""
+    """Set preserving item order.
+
+    This is a list, so it can be iterated, indexed and altered like a list,
+    but the add and add_all methods only add items which are not contained
+    yet. Membership tests use a dictionary index counting the occurrences
+    of every item, with a linear scan only as fallback for unhashable items.
+
+    """
+
+    def __init__(self, iterable=()):
+        list.__init__(self, iterable)
+        if isinstance(iterable, setlike):
+            self._index = iterable._index.copy()
+            self._unhashable = iterable._unhashable[:]
+        else:
+            self._reindex()
+
+    def _reindex(self):
+        """Rebuild the index after the list has been altered."""
+        self._index = {}
+        self._unhashable = []
+        for item in self:
+            self._count(item)
+
+    def _count(self, item):
+        """Count an occurrence of an item which has been added."""
+        try:
+            self._index[item] = self._index.get(item, 0) + 1
+        except TypeError:
+            self._unhashable.append(item)
+
+    def _uncount(self, item):
+        """Forget an occurrence of an item which has been removed."""
+        try:
+            count = self._index[item]
+        except TypeError:
+            self._unhashable.remove(item)
+        else:
+            if count > 1:
+                self._index[item] = count - 1
+            else:
+                del self._index[item]
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def __contains__(self, item):
+        try:
+            return item in self._index
+        except TypeError:
+            return item in self._unhashable
 
     def add(self, item):
         if item not in self:
@@ -153,6 +206,169 @@ class setlike(list):
         for item in iterable:
             self.add(item)
 
+    def append(self, item):
+        list.append(self, item)
+        self._count(item)
+
+    def extend(self, iterable):
+        for item in iterable:
+            self.append(item)
+
+    def __iadd__(self, iterable):
+        self.extend(iterable)
+        return self
+
+    def insert(self, i, item):
+        list.insert(self, i, item)
+        self._count(item)
+
+    def remove(self, item):
+        list.remove(self, item)
+        self._uncount(item)
+
+    def pop(self, *args):
+        item = list.pop(self, *args)
+        self._uncount(item)
+        return item
+
+    def __setitem__(self, i, item):
+        if isinstance(i, slice):
+            list.__setitem__(self, i, item)
+            self._reindex()
+        else:
+            old = self[i]
+            list.__setitem__(self, i, item)
+            self._uncount(old)
+            self._count(item)
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            list.__delitem__(self, i)
+            self._reindex()
+        else:
+            self._uncount(self[i])
+            list.__delitem__(self, i)
+
+    def __setslice__(self, i, j, iterable):
+        list.__setslice__(self, i, j, iterable)
+        self._reindex()
+
+    def __delslice__(self, i, j):
+        list.__delslice__(self, i, j)
+        self._reindex()
+
+    def __imul__(self, n):
+        list.__imul__(self, n)
+        self._reindex()
+        return self
+
+
+class LRUCache(object):
+    """Cache with a bounded size discarding the least recently used items.
+
+    The items are kept in a dictionary and a circular doubly linked list
+    ordered by their last use, so that get and set take constant time.
+    If a ttl (in seconds) is given, items are discarded when they have been
+    stored for longer than that. A size of 0 disables the cache. The hits
+    and misses attributes count the successful and failed lookups.
+    All operations are thread-safe.
+
+    """
+
+    def __init__(self, size=1000, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        link = self._links.get(key)
+        return link is not None and (link[4] is None or link[4] > time.time())
+
+    def _touch(self, link):
+        """Move the link to the most recently used end of the list."""
+        root = self._root
+        link[0][1], link[1][0] = link[1], link[0]
+        link[0], link[1] = root[0], root
+        root[0][1] = root[0] = link
+
+    def _unlink(self, link):
+        """Remove the link from the list and the dictionary."""
+        link[0][1], link[1][0] = link[1], link[0]
+        del self._links[link[2]]
+
+    def get(self, key, default=None):
+        """Return the item cached for the key and mark it as recently used."""
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                if link[4] is None or link[4] > time.time():
+                    self._touch(link)
+                    self.hits += 1
+                    return link[3]
+                self._unlink(link)
+            self.misses += 1
+            return default
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, ttl=None):
+        """Cache the item, discarding the least recently used one if full.
+
+        The item expires after ttl seconds, or the ttl of the cache if None.
+
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            expires = None
+        else:
+            expires = time.time() + ttl
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                root = self._root
+                if len(self._links) >= self.size:
+                    oldest = root[1]
+                    if oldest is root:
+                        return
+                    self._unlink(oldest)
+                link = [root[0], root, key, value, expires]
+                root[0][1] = root[0] = link
+                self._links[key] = link
+            else:
+                link[3], link[4] = value, expires
+                self._touch(link)
+        finally:
+            self._lock.release()
+
+    def remove(self, key):
+        """Remove the item cached for the key if there is one."""
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Remove all cached items."""
+        self._lock.acquire()
+        try:
+            root = []
+            root[:] = [root, root, None, None, None]
+            self._root = root
+            self._links = {}
+        finally:
+            self._lock.release()
+
 
 def get_project_meta(name):
     """Get egg-info file with that name in the current project."""
@@ -228,34 +444,75 @@ def ensure_sequence(obj):
         return [obj]
 
 
+class _Signature(object):
+    """Compiled signature of a function as needed for adapting calls."""
+
+    __slots__ = ('argnames', 'varargs', 'kwargs', 'defaults',
+        'positional', '_allowed')
+
+    def __init__(self, func):
+        argnames, varargs, kwargs, defaults = getargspec(func)
+        self.argnames = tuple(argnames)
+        self.varargs = varargs
+        self.kwargs = kwargs
+        self.defaults = tuple(ensure_sequence(defaults))
+        # number of arguments without default values
+        self.positional = len(argnames) - len(self.defaults)
+        self._allowed = {}
+
+    def allowed(self, start=0):
+        """Return the set of allowed keyword arguments."""
+        try:
+            return self._allowed[start]
+        except KeyError:
+            allowed = self._allowed[start] = frozenset(self.argnames[start:])
+            return allowed
+
+
+_signatures = WeakKeyDictionary()
+
+def get_signature(func):
+    """Get the cached compiled signature of the given function or method.
+
+    The result has the attributes argnames, varargs, kwargs and defaults
+    like the result of inspect.getargspec, but argnames and defaults are
+    always tuples, so that the cached signature cannot be altered.
+
+    """
+    func = getattr(func, 'im_func', func)
+    try:
+        return _signatures[func]
+    except KeyError:
+        signature = _signatures[func] = _Signature(func)
+        return signature
+
+
 def to_kw(func, args, kw, start=0):
     """Convert all applicable arguments to keyword arguments."""
-    argnames, defaults = getargspec(func)[::3]
-    defaults = ensure_sequence(defaults)
+    signature = get_signature(func)
     kv_pairs = izip(
-        islice(argnames, start, len(argnames) - len(defaults)), args)
+        islice(signature.argnames, start, signature.positional), args)
     for k, v in kv_pairs:
         kw[k] = v
-    return args[len(argnames)-len(defaults)-start:], kw
+    return args[signature.positional-start:], kw
 
 
 def from_kw(func, args, kw, start=0):
     """Extract named positional arguments from keyword arguments."""
-    argnames, defaults = getargspec(func)[::3]
-    defaults = ensure_sequence(defaults)
-    newargs = [kw.pop(name) for name in islice(argnames, start,
-        len(argnames) - len(defaults)) if name in kw]
+    signature = get_signature(func)
+    newargs = [kw.pop(name) for name in islice(signature.argnames, start,
+        signature.positional) if name in kw]
     newargs.extend(args)
     return newargs, kw
 
 
 def adapt_call(func, args, kw, start=0):
     """Remove excess arguments."""
-    argnames, varargs, kwargs = getargspec(func)[:3]
-    del argnames[:start]
-    if kwargs in (None, "_decorator__kwargs"):
-        remove_keys(kw, [key for key in kw if key not in argnames])
-    if varargs in (None, "_decorator__varargs"):
+    signature = get_signature(func)
+    argnames = signature.argnames[start:]
+    if signature.kwargs in (None, "_decorator__kwargs"):
+        remove_keys(kw, set(kw).difference(signature.allowed(start)))
+    if signature.varargs in (None, "_decorator__varargs"):
         args = args[:len(argnames)]
     for n, key in enumerate(argnames):
         if key in kw:
@@ -294,24 +551,21 @@ def remove_keys(dict_, seq):
 
 def has_arg(func, argname):
     """Check whether function has argument."""
-    return argname in getargspec(func)[0]
+    return argname in get_signature(func).allowed()
 
 
 def arg_index(func, argname):
     """Find index of argument as declared for given function."""
-    argnames = getargspec(func)[0]
     if has_arg(func, argname):
-        return argnames.index(argname)
+        return get_signature(func).argnames.index(argname)
     else:
         return None
 
 
 def inject_arg(func, argname, argval, args, kw, start=0):
     """Insert argument into call."""
-    argnames, defaults = getargspec(func)[::3]
-    defaults = ensure_sequence(defaults)
     pos = arg_index(func, argname)
-    if pos is None or pos > len(argnames) - len(defaults) - 1:
+    if pos is None or pos > get_signature(func).positional - 1:
         kw[argname] = argval
     else:
         pos -= start
@@ -674,10 +928,10 @@ def fixentities(htmltext):
     return re.sub("&(\w+);?", repl, htmltext)
 
 
-__all__ = ["Bunch", "DictObj", "DictWrapper", "Enum", "setlike",
+__all__ = ["Bunch", "DictObj", "DictWrapper", "Enum", "setlike", "LRUCache",
            "get_package_name", "get_model", "load_project_config",
-           "ensure_sequence", "has_arg", "to_kw", "from_kw", "adapt_call",
-           "call_on_stack", "remove_keys", "arg_index",
+           "ensure_sequence", "get_signature", "has_arg", "to_kw", "from_kw",
+           "adapt_call", "call_on_stack", "remove_keys", "arg_index",
            "inject_arg", "inject_args", "add_tg_args", "bind_args",
            "recursive_update", "combine_contexts",
            "request_available", "flatten_sequence", "load_class",
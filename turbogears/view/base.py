@@ -14,7 +14,7 @@ import turbogears
 from turbogears import identity, config
 from turbogears.i18n import i18n_filter, get_locale
 from turbogears.util import Bunch, \
-    adapt_call, deprecated, get_template_encoding_default, \
+    adapt_call, deprecated, has_arg, get_template_encoding_default, \
     get_mime_type_for_format, mime_type_has_charset
 
 log = logging.getLogger("turbogears.view")
@@ -109,6 +109,48 @@ def render(info, template=None, format=None, headers=None,
     @type template: string
 
     """
+    engine, template, enginename, format = _prepare_render(
+        info, template, format, headers)
+    return _engine_render(engine, info, template, format, fragment, mapping)
+
+
+def render_stream(info, template=None, format=None, headers=None,
+        mapping=None, fragment=False):
+    """Renders data in the desired format as iterator over encoded chunks.
+
+    The parameters are the same as for render(). Kid and Genshi templates
+    are rendered incrementally (unless a mapping is passed to an engine
+    supporting it), the output of other template engines is returned as
+    one chunk. The headers are set and the first chunk has
+    already been rendered when this function returns, so that errors at
+    the start of the template are raised here.
+
+    """
+    engine, template, enginename, format = _prepare_render(
+        info, template, format, headers)
+    encoding = get_template_encoding_default(enginename)
+    if mapping and has_arg(engine.render, 'mapping'):
+        # only the engine knows how to apply the mapping
+        chunks = [_engine_render(
+            engine, info, template, format, fragment, mapping)]
+    elif enginename == 'kid':
+        chunks = _kid_generate(engine, info, template, format, fragment)
+    elif enginename == 'genshi':
+        chunks = _genshi_generate(engine, info, template, format, fragment)
+    else:
+        chunks = [_engine_render(
+            engine, info, template, format, fragment, mapping)]
+    chunks = _join_chunks(chunks, encoding,
+        config.get('tg.stream_chunk_size', 8192))
+    try:
+        first = chunks.next()
+    except StopIteration:
+        return iter([])
+    return chain([first], chunks)
+
+
+def _prepare_render(info, template, format, headers):
+    """Choose the template engine and format and set the headers."""
     template = format == 'json' and 'json' or info.pop(
         "tg_template", template)
     if not info.has_key("tg_flash"):
@@ -152,6 +194,11 @@ def render(info, template=None, format=None, headers=None,
                 content_type += '; charset=' + charset
         headers['Content-Type'] = content_type
 
+    return engine, template, enginename, format
+
+
+def _engine_render(engine, info, template, format, fragment, mapping):
+    """Render data with the template engine."""
     args, kw = adapt_call(engine.render, args= [],
         kw = dict(info=info, format=format, fragment=fragment,
         template=template, mapping=mapping), start=1)
@@ -159,6 +206,70 @@ def render(info, template=None, format=None, headers=None,
     return engine.render(**kw)
 
 
+def kid_template(engine, template, info):
+    """Create an instance of a Kid template as the TurboKid plugin does.
+
+    The template gets the standard variables of the engine and the info,
+    and runs the i18n filter if i18n.run_template_filter is set. It can
+    then be transformed, serialized or generated without the plugin.
+
+    """
+    if isinstance(template, type):
+        tclass = template
+    else:
+        tclass = engine.load_template(template)
+    data = dict()
+    get_extra_vars = getattr(engine, 'get_extra_vars', None)
+    if get_extra_vars:
+        data.update(get_extra_vars())
+    data.update(info)
+    t = tclass(**data)
+    assume_encoding = getattr(engine, 'assume_encoding', None)
+    if assume_encoding and 'assume_encoding' not in info:
+        t.assume_encoding = assume_encoding
+    if config.get("i18n.run_template_filter", False) \
+            and i18n_filter not in t._filters:
+        t._filters.append(i18n_filter)
+    return t
+
+
+def _kid_generate(engine, info, template, format, fragment):
+    """Generate the output of a Kid template incrementally."""
+    return kid_template(engine, template, info).generate(
+        encoding=get_template_encoding_default('kid'),
+        output=format, fragment=fragment)
+
+
+def _genshi_generate(engine, info, template, format, fragment):
+    """Generate the output of a Genshi template incrementally."""
+    method = format.split('-', 1)[0]
+    if method == 'plain':
+        method = 'text'
+    doctype = None
+    if not fragment and method in ('html', 'xhtml'):
+        if '-' in format:
+            doctype = format
+        else:
+            doctype = config.get('genshi.default_doctype', None)
+    return engine.transform(info, template).serialize(
+        method=method, doctype=doctype)
+
+
+def _join_chunks(chunks, encoding, size):
+    """Encode the chunks and join them to chunks of at least size bytes."""
+    buf, length = [], 0
+    for chunk in chunks:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode(encoding)
+        buf.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buf)
+            buf, length = [], 0
+    if buf:
+        yield ''.join(buf)
+
+
 def transform(info, template):
     """Create ElementTree representation of the output."""
     engine, template, enginename = _choose_engine(template)
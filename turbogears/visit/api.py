@@ -16,6 +16,7 @@ import pkg_resources
 
 from cherrypy.filters.basefilter import BaseFilter
 from turbogears import config
+from turbogears.util import LRUCache
 
 from psycopg2.extensions import TransactionRollbackError
 import traceback
@@ -293,6 +294,28 @@ class VisitFilter(BaseFilter):
             cookies[self.cookie_name].output())
 
 
+class VisitCache(LRUCache):
+    """Thread-safe LRU cache of data (like expiry times) keyed by visit key.
+
+    At most size entries are kept, and entries are discarded when they
+    have been stored for more than ttl seconds (unless ttl is 0), so that
+    changes made by other processes are seen after that time.
+
+    """
+
+    def __init__(self, size, ttl):
+        LRUCache.__init__(self, size, ttl > 0 and ttl or None)
+
+
+def _round_up_expiry(expiry, bucket):
+    """Round up the expiry time to a multiple of bucket seconds."""
+    rest = (expiry.hour * 3600 + expiry.minute * 60 + expiry.second) % bucket
+    if rest or expiry.microsecond:
+        expiry = expiry.replace(microsecond=0) + timedelta(
+            seconds=bucket - rest)
+    return expiry
+
+
 class BaseVisitManager(threading.Thread):
 
     def __init__(self, timeout):
@@ -302,6 +325,17 @@ class BaseVisitManager(threading.Thread):
         self.lock = threading.Lock()
         self._shutdown = threading.Event()
         self.interval = 30
+        get = config.get
+        # Update the queued visits with as few statements as possible
+        self.bulk_update = get("visit.flush.bulk", False)
+        # How many visit keys may be updated with one statement?
+        self.chunk_size = int(get("visit.flush.chunk_size", 500))
+        # Expiry times are rounded up to this number of seconds, so that
+        # visits with nearly the same expiry can be updated together
+        self.bucket = int(get("visit.flush.bucket", 1))
+        # Cache the expiry of visits to avoid looking them up on every request
+        self.cache = VisitCache(int(get("visit.cache.size", 10000)),
+            float(get("visit.cache.ttl", 60)))
         self.setDaemon(True)
         # We need to create the visit model before the manager thread is
         # started.
@@ -327,12 +361,51 @@ class BaseVisitManager(threading.Thread):
         """Extend the expiration of the queued visits."""
         raise NotImplementedError
 
+    def known_expiry(self, visit_key):
+        """Return the expiry of the visit if known without a lookup.
+
+        The expiry is known if the visit has been queued for an update.
+        Cached expiry times are only returned if they have not yet passed,
+        since the visit may have been extended by another process.
+
+        """
+        try:
+            return self.queue[visit_key]
+        except KeyError:
+            pass
+        expiry = self.cache.get(visit_key)
+        if expiry is not None and expiry >= datetime.now(expiry.tzinfo):
+            return expiry
+        return None
+
+    def bulk_updates(self, queue):
+        """Group the queued visits for bulk updates.
+
+        Yields (expiry, visit_keys) pairs where visit_keys is a list of at
+        most chunk_size visit keys that shall be set to the given expiry.
+
+        """
+        buckets = dict()
+        bucket = self.bucket
+        for visit_key, expiry in queue.iteritems():
+            if bucket > 0:
+                expiry = _round_up_expiry(expiry, bucket)
+            buckets.setdefault(expiry, []).append(visit_key)
+        chunk_size = self.chunk_size
+        for expiry, visit_keys in buckets.iteritems():
+            if chunk_size > 0:
+                for i in xrange(0, len(visit_keys), chunk_size):
+                    yield expiry, visit_keys[i:i+chunk_size]
+            else:
+                yield expiry, visit_keys
+
     def update_visit(self, visit_key, expiry):
         try:
             self.lock.acquire()
             self.queue[visit_key] = expiry
         finally:
             self.lock.release()
+        self.cache.set(visit_key, expiry)
 
     def shutdown(self, timeout=None):
         self._shutdown.set()
@@ -340,26 +413,35 @@ class BaseVisitManager(threading.Thread):
         if self.isAlive():
             log.error("Visit Manager thread failed to shutdown.")
 
+    def take_queued_visits(self):
+        """Return the queued visits (or None) and empty the queue."""
+        self.lock.acquire()
+        try:
+            # make a copy of the queue and empty the original
+            if self.queue:
+                queue = self.queue.copy()
+                self.queue.clear()
+                return queue
+        finally:
+            self.lock.release()
+        return None
+
+    def requeue_visits(self, queue):
+        """Put back visits which could not be updated into the queue."""
+        try:
+            self.lock.acquire()
+            self.queue.update(queue)
+        finally:
+            self.lock.release()
+
     def run(self):
         while not self._shutdown.isSet():
-            self.lock.acquire()
-            queue = None
-            try:
-                # make a copy of the queue and empty the original
-                if self.queue:
-                    queue = self.queue.copy()
-                    self.queue.clear()
-            finally:
-                self.lock.release()
+            queue = self.take_queued_visits()
             if queue is not None:
                 try:
                     self.update_queued_visits(queue)
                 except TransactionRollbackError:
                     traceback.print_exc()
-                    try:
-                        self.lock.acquire()
-                        self.queue.update(queue)
-                    finally:
-                        self.lock.release()
+                    self.requeue_visits(queue)
 
             self._shutdown.wait(self.interval)
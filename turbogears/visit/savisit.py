@@ -1,4 +1,5 @@
 from datetime import datetime
+from inspect import getargspec
 
 from sqlalchemy import Table, Column, String, DateTime
 from sqlalchemy.orm import class_mapper
@@ -14,6 +15,14 @@ log = logging.getLogger("turbogears.identity.savisit")
 visit_class = None
 
 
+def in_values(column, values):
+    """Return the clause 'column IN values' for all SQLAlchemy versions."""
+    if getargspec(column.in_)[1]:
+        # SQLAlchemy 0.3 expects the values as separate arguments
+        return column.in_(*values)
+    return column.in_(values)
+
+
 class SqlAlchemyVisitManager(BaseVisitManager):
 
     def __init__(self, timeout):
@@ -53,9 +62,8 @@ class SqlAlchemyVisitManager(BaseVisitManager):
         Returns None if the visit doesn't exist or has expired.
 
         """
-        try:
-            expiry = self.queue[visit_key]
-        except KeyError:
+        expiry = self.known_expiry(visit_key)
+        if expiry is None:
             visit = visit_class.lookup_visit(visit_key)
             if not visit:
                 return None
@@ -68,6 +76,8 @@ class SqlAlchemyVisitManager(BaseVisitManager):
         return Visit(visit_key, False)
 
     def update_queued_visits(self, queue):
+        if self.bulk_update:
+            return self.bulk_update_queued_visits(queue)
         # TODO this should be made transactional
         table = class_mapper(visit_class).mapped_table
         # Now update each of the visits with the most recent expiry
@@ -77,6 +87,26 @@ class SqlAlchemyVisitManager(BaseVisitManager):
             get_engine().execute(table.update(table.c.visit_key == visit_key,
                 values=dict(expiry=expiry)))
 
+    def bulk_update_queued_visits(self, queue):
+        """Update the queued visits in bulk inside one transaction."""
+        table = class_mapper(visit_class).mapped_table
+        conn = get_engine().connect()
+        try:
+            transaction = conn.begin()
+            try:
+                for expiry, visit_keys in self.bulk_updates(queue):
+                    log.info("updating %d visits to expire at %s",
+                        len(visit_keys), expiry)
+                    conn.execute(table.update(
+                        in_values(table.c.visit_key, visit_keys),
+                        values=dict(expiry=expiry)))
+                transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+        finally:
+            conn.close()
+
 
 # The Visit table
 
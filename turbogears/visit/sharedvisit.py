@@ -0,0 +1,468 @@
+"""Visit manager sharing the visits between all processes on a host.
+
+When an application runs in several worker processes, every process would
+look up and extend the same visits in the database on its own. The shared
+visit manager keeps the expiry times of the visits in a store that is shared
+by all processes on the host instead, and writes them through to the visit
+table of a backing visit manager (like 'sqlobject' or 'sqlalchemy')
+asynchronously. Each extended visit is written by only one of the processes.
+
+The default store is a small server listening on a Unix domain socket. It is
+started by the first process that needs it and taken over by another process
+if that one goes away. Updates are acknowledged before they are written to
+the database, so if the process running the server is killed, the visits
+extended since the last write keep their previous expiry.
+
+"""
+
+import errno
+import logging
+import os
+import socket
+import tempfile
+import threading
+
+from datetime import datetime
+from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import pkg_resources
+
+from turbogears import config
+from turbogears.util import get_package_name, load_class
+
+log = logging.getLogger("turbogears.visit.sharedvisit")
+
+
+class LocalVisitStore(object):
+    """Visit store kept in the memory of the current process.
+
+    This is the store used by the visit store server, but it can also be
+    used as a stand-in for the shared store if there is only one process.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # expiry times of all known visits
+        self.visits = dict()
+        # expiry times which have not yet been written to the database
+        self.dirty = dict()
+
+    def get(self, visit_key):
+        """Return the expiry of the visit or None."""
+        return self.visits.get(visit_key)
+
+    def update(self, visit_key, expiry):
+        """Extend the visit, the expiry will be written to the database."""
+        self.lock.acquire()
+        try:
+            self.visits[visit_key] = self.dirty[visit_key] = expiry
+        finally:
+            self.lock.release()
+        return True
+
+    def take_dirty(self):
+        """Return and clear the visits that need to be written to the database.
+
+        Visits which have expired and need not be written any more are
+        forgotten at the same time.
+
+        """
+        self.lock.acquire()
+        try:
+            dirty, self.dirty = self.dirty, dict()
+            visits = self.visits
+            now = datetime.now()
+            for visit_key, expiry in visits.items():
+                if expiry < now and visit_key not in dirty:
+                    del visits[visit_key]
+        finally:
+            self.lock.release()
+        return dirty
+
+    def requeue(self, queue):
+        """Mark visits which could not be written to the database as dirty."""
+        self.lock.acquire()
+        try:
+            dirty = self.dirty
+            for visit_key, expiry in queue.iteritems():
+                if visit_key not in dirty:
+                    dirty[visit_key] = expiry
+        finally:
+            self.lock.release()
+        return True
+
+    def close(self):
+        pass
+
+
+def _format_expiry(expiry):
+    return '%04d%02d%02d%02d%02d%02d%06d' % (expiry.year, expiry.month,
+        expiry.day, expiry.hour, expiry.minute, expiry.second,
+        expiry.microsecond)
+
+def _parse_expiry(value):
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+        int(value[8:10]), int(value[10:12]), int(value[12:14]),
+        int(value[14:20]))
+
+def _valid_key(visit_key):
+    """Check whether the visit key can be passed through the socket."""
+    return visit_key and len(visit_key) <= 40 and visit_key.isalnum()
+
+
+class VisitStoreHandler(StreamRequestHandler):
+    """Handle the requests of one client of the visit store server.
+
+    The protocol is line based. Each request is answered with one line
+    unless noted otherwise:
+
+      GET <key>             -> <expiry> or "-"
+      UPDATE <key> <expiry> -> "OK"
+      TAKE                  -> "<key> <expiry>" lines, terminated by "."
+      REQUEUE <count>       -> followed by <count> "<key> <expiry>" lines,
+                               answered with "OK"
+
+    """
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.server.add_connection(self.connection)
+
+    def finish(self):
+        self.server.remove_connection(self.connection)
+        StreamRequestHandler.finish(self)
+
+    def handle(self):
+        store = self.server.store
+        rfile, wfile = self.rfile, self.wfile
+        while True:
+            line = rfile.readline()
+            if not line:
+                break
+            args = line.split()
+            try:
+                command = args[0]
+                if command == 'GET':
+                    expiry = store.get(args[1])
+                    if expiry is None:
+                        wfile.write('-\n')
+                    else:
+                        wfile.write('%s\n' % _format_expiry(expiry))
+                elif command == 'UPDATE':
+                    store.update(args[1], _parse_expiry(args[2]))
+                    wfile.write('OK\n')
+                elif command == 'TAKE':
+                    for visit_key, expiry in store.take_dirty().iteritems():
+                        wfile.write('%s %s\n' % (
+                            visit_key, _format_expiry(expiry)))
+                    wfile.write('.\n')
+                elif command == 'REQUEUE':
+                    queue = dict()
+                    for i in xrange(int(args[1])):
+                        visit_key, expiry = rfile.readline().split()
+                        queue[visit_key] = _parse_expiry(expiry)
+                    store.requeue(queue)
+                    wfile.write('OK\n')
+                else:
+                    raise ValueError(command)
+            except (IndexError, ValueError):
+                log.warning("Invalid visit store request: %r", line)
+                break
+            try:
+                wfile.flush()
+            except socket.error:
+                break
+
+
+class VisitStoreServer(ThreadingMixIn, UnixStreamServer):
+    """Server sharing a LocalVisitStore through a Unix domain socket.
+
+    The dirty visits are only kept in the memory of the process running the
+    server until a client takes them, they are lost if the process dies.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        UnixStreamServer.__init__(self, path, VisitStoreHandler)
+        self.path = path
+        self.store = LocalVisitStore()
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever,
+            name="VisitStoreServer")
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def add_connection(self, connection):
+        self.lock.acquire()
+        try:
+            self.connections.add(connection)
+        finally:
+            self.lock.release()
+
+    def remove_connection(self, connection):
+        self.lock.acquire()
+        try:
+            self.connections.discard(connection)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Stop the server and drop the connections of all clients."""
+        self.shutdown()
+        self.server_close()
+        self.lock.acquire()
+        try:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+        finally:
+            self.lock.release()
+
+
+class SocketVisitStore(object):
+    """Client of the visit store server listening on a Unix domain socket.
+
+    Every thread uses its own connection. If the server cannot be reached,
+    this process starts a new server.
+
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        # Everybody who can connect to the socket can read the visit keys,
+        # so we make sure that the directory is private.
+        stat = os.stat(directory)
+        if stat.st_uid != os.getuid() or stat.st_mode & 077:
+            raise ValueError("Directory of the visit store socket %s"
+                " must be private." % directory)
+        self.path = path
+        self.server = None
+        self.local = threading.local()
+
+    def _start_server(self):
+        """Start a server unless another process has done so already."""
+        lockfile = open(self.path + '.lock', 'a')
+        try:
+            if fcntl:
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                return self._connect()
+            except socket.error:
+                pass
+            # The socket is stale, its server is gone
+            try:
+                os.unlink(self.path)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+            log.info("Starting visit store server on %s", self.path)
+            self.server = VisitStoreServer(self.path)
+            return self._connect()
+        finally:
+            lockfile.close()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except socket.error:
+            sock.close()
+            raise
+        self.local.sock = sock
+        self.local.rfile = sock.makefile('rb')
+        return sock
+
+    def _disconnect(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is not None:
+            self.local.rfile.close()
+            sock.close()
+            self.local.sock = self.local.rfile = None
+
+    def _request(self, request):
+        """Send the request and return the file to read the response from.
+
+        The request is repeated once with a new connection (and a new server
+        if needed) if the connection has been lost.
+
+        """
+        for retry in (False, True):
+            sock = getattr(self.local, 'sock', None)
+            try:
+                if sock is None:
+                    try:
+                        sock = self._connect()
+                    except socket.error:
+                        sock = self._start_server()
+                sock.sendall(request)
+                return self.local.rfile
+            except socket.error:
+                self._disconnect()
+                if retry:
+                    raise
+
+    def _readline(self, rfile):
+        line = rfile.readline()
+        if not line:
+            self._disconnect()
+            raise socket.error(errno.ECONNRESET, "Visit store server is gone")
+        return line.rstrip('\n')
+
+    def get(self, visit_key):
+        if not _valid_key(visit_key):
+            return None
+        rfile = self._request('GET %s\n' % visit_key)
+        expiry = self._readline(rfile)
+        if expiry == '-':
+            return None
+        return _parse_expiry(expiry)
+
+    def update(self, visit_key, expiry):
+        if not _valid_key(visit_key):
+            return False
+        rfile = self._request('UPDATE %s %s\n' % (
+            visit_key, _format_expiry(expiry)))
+        return self._readline(rfile) == 'OK'
+
+    def take_dirty(self):
+        rfile = self._request('TAKE\n')
+        dirty = dict()
+        while True:
+            line = self._readline(rfile)
+            if line == '.':
+                break
+            visit_key, expiry = line.split()
+            dirty[visit_key] = _parse_expiry(expiry)
+        return dirty
+
+    def requeue(self, queue):
+        request = ['REQUEUE %d\n' % len(queue)]
+        for visit_key, expiry in queue.iteritems():
+            request.append('%s %s\n' % (visit_key, _format_expiry(expiry)))
+        rfile = self._request(''.join(request))
+        return self._readline(rfile) == 'OK'
+
+    def close(self):
+        self._disconnect()
+        server = self.server
+        if server is not None:
+            self.server = None
+            server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+def create_visit_store():
+    """Create the visit store specified in the config file."""
+    store = config.get("visit.shared.store", "socket")
+    if store == "socket":
+        if not hasattr(socket, 'AF_UNIX'):
+            log.warning("Unix domain sockets are not available:"
+                " visits are not shared between processes.")
+            return LocalVisitStore()
+        path = config.get("visit.shared.socket", None)
+        if not path:
+            path = os.path.join(tempfile.gettempdir(),
+                "tg-visit-%d" % os.getuid(),
+                "%s.sock" % (get_package_name() or "turbogears"))
+        return SocketVisitStore(path)
+    if store == "local":
+        return LocalVisitStore()
+    return load_class(store)()
+
+
+class SharedVisitManagerMixin(object):
+    """Mixin keeping the visits of a visit manager in a shared visit store.
+
+    If the store cannot be reached, the visit manager falls back to looking
+    up and queueing the visits in the current process.
+
+    """
+
+    def __init__(self, timeout):
+        self.store = create_visit_store()
+        super(SharedVisitManagerMixin, self).__init__(timeout)
+
+    def _store_call(self, method, *args):
+        try:
+            return getattr(self.store, method)(*args)
+        except (socket.error, IOError), e:
+            log.warning("Visit store is not available: %s", e)
+            return None
+
+    def known_expiry(self, visit_key):
+        expiry = self._store_call('get', visit_key)
+        if expiry is not None and expiry >= datetime.now(expiry.tzinfo):
+            return expiry
+        return super(SharedVisitManagerMixin, self).known_expiry(visit_key)
+
+    def update_visit(self, visit_key, expiry):
+        if self._store_call('update', visit_key, expiry):
+            self.cache.set(visit_key, expiry)
+        else:
+            super(SharedVisitManagerMixin, self).update_visit(
+                visit_key, expiry)
+
+    def take_queued_visits(self):
+        queue = super(SharedVisitManagerMixin, self).take_queued_visits()
+        dirty = self._store_call('take_dirty')
+        if dirty:
+            if queue:
+                for visit_key, expiry in queue.iteritems():
+                    if visit_key not in dirty or dirty[visit_key] < expiry:
+                        dirty[visit_key] = expiry
+            queue = dirty
+        return queue
+
+    def requeue_visits(self, queue):
+        if not self._store_call('requeue', queue):
+            super(SharedVisitManagerMixin, self).requeue_visits(queue)
+
+    def shutdown(self, timeout=None):
+        super(SharedVisitManagerMixin, self).shutdown(timeout)
+        if getattr(self.store, 'server', None) is not None:
+            # Other processes lose their visits when the server goes away,
+            # so write them to the database before.
+            queue = self.take_queued_visits()
+            if queue:
+                try:
+                    self.update_queued_visits(queue)
+                except Exception:
+                    log.exception("Could not write shared visits on shutdown")
+        self.store.close()
+
+
+def SharedVisitManager(timeout):
+    """Create a shared visit manager.
+
+    The visits are written to the database by the visit manager plugin
+    specified as 'visit.shared.manager' in the config file.
+
+    """
+    plugin_name = config.get("visit.shared.manager", "sqlobject")
+    if plugin_name == "shared":
+        raise RuntimeError("The shared visit manager cannot share itself")
+    plugins = pkg_resources.iter_entry_points(
+        "turbogears.visit.manager", plugin_name)
+    log.debug("Loading shared visit manager from plugin: %s", plugin_name)
+    for entrypoint in plugins:
+        plugin = entrypoint.load()
+        manager_class = type('Shared' + plugin.__name__,
+            (SharedVisitManagerMixin, plugin), {})
+        return manager_class(timeout)
+    raise RuntimeError("VisitManager plugin missing: %s" % plugin_name)
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from sqlobject import SQLObject, SQLObjectNotFound, StringCol, DateTimeCol
-from sqlobject.sqlbuilder import Update
+from sqlobject.sqlbuilder import Update, IN
 
 from turbogears import config
 from turbogears.database import PackageHub
@@ -57,9 +57,8 @@ class SqlObjectVisitManager(BaseVisitManager):
         Returns None if the visit doesn't exist or has expired.
 
         """
-        try:
-            expiry = self.queue[visit_key]
-        except KeyError:
+        expiry = self.known_expiry(visit_key)
+        if expiry is None:
             visit = visit_class.lookup_visit(visit_key)
             if not visit:
                 return None
@@ -74,6 +73,8 @@ class SqlObjectVisitManager(BaseVisitManager):
     def update_queued_visits(self, queue):
         if hub is None: # if VisitManager extension wasn't shutted down cleanly
             return
+        if self.bulk_update:
+            return self.bulk_update_queued_visits(queue)
         hub.begin()
         try:
             conn = hub.getConnection()
@@ -91,6 +92,24 @@ class SqlObjectVisitManager(BaseVisitManager):
         finally:
             hub.end()
 
+    def bulk_update_queued_visits(self, queue):
+        """Update the queued visits in bulk inside one transaction."""
+        hub.begin()
+        try:
+            conn = hub.getConnection()
+            try:
+                for expiry, visit_keys in self.bulk_updates(queue):
+                    u = Update(visit_class.q,
+                        {visit_class.q.expiry.fieldName: expiry},
+                        where=IN(visit_class.q.visit_key, visit_keys))
+                    conn.query(conn.sqlrepr(u))
+                hub.commit()
+            except:
+                hub.rollback()
+                raise
+        finally:
+            hub.end()
+
 
 class TG_Visit(SQLObject):
 
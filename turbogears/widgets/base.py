@@ -2,11 +2,15 @@ import os
 import itertools
 import pkg_resources
 import warnings
+from datetime import date, datetime, time
+from kid import Element, ElementStream, Comment, ProcessingInstruction
+from kid.parser import START, END
 from turbogears import view, startup, config
 from turbogears.util import setlike, to_unicode, copy_if_mutable, \
-    get_package_name
+    get_package_name, LRUCache
 from turbogears.i18n.utils import get_locale
-from turbogears.widgets.meta import MetaWidget, load_kid_template
+from turbogears.i18n.tg_gettext import lazystring
+from turbogears.widgets.meta import MetaWidget, ParamPlan, load_kid_template
 from cherrypy.config import configs
 
 try:
@@ -19,7 +23,7 @@ __all__ = ['load_widgets', 'all_widgets', 'Widget', 'CompoundWidget',
     'Resource', 'Link', 'CSSLink', 'JSLink',
     'Source', 'CSSSource', 'JSSource',
     'js_location', 'mochikit', 'jsi18nwidget',
-    'WidgetDescription', 'set_with_self']
+    'WidgetDescription', 'set_with_self', 'Fragment']
 
 
 class Enum(set):
@@ -76,6 +80,177 @@ PlainHTML = load_kid_template("""
 """, modname='turbogears.widgets.plainhtml')[0]
 
 
+#############################################################################
+# Cache of rendered widget fragments                                        #
+#############################################################################
+
+_fragment_cache = None
+
+def get_fragment_cache():
+    """Return the LRU cache holding the output of cacheable widgets.
+
+    Its size is set with widgets.fragment_cache.size (default: 500).
+
+    """
+    global _fragment_cache
+    if _fragment_cache is None:
+        _fragment_cache = LRUCache(
+            config.get('widgets.fragment_cache.size', 500))
+    return _fragment_cache
+
+_scalar_types = (basestring, int, long, float, bool, type(None),
+    date, datetime, time)
+
+def freeze_params(value):
+    """Convert template parameters into a hashable key.
+
+    Raises a TypeError if the parameters contain values whose effect on the
+    output cannot be determined, like callables or arbitrary objects.
+
+    """
+    if isinstance(value, dict):
+        items = [(key, freeze_params(item))
+            for key, item in value.iteritems()]
+        items.sort()
+        return dict, tuple(items)
+    if isinstance(value, (list, tuple)):
+        return value.__class__, tuple([freeze_params(item) for item in value])
+    if isinstance(value, (set, frozenset)):
+        items = [freeze_params(item) for item in value]
+        items.sort()
+        return set, tuple(items)
+    if isinstance(value, Widget):
+        return Widget, value._declaration_counter
+    if isinstance(value, lazystring):
+        return unicode, unicode(value)
+    if isinstance(value, _scalar_types):
+        return value.__class__, value
+    raise TypeError("Cannot use %r in a cache key" % value)
+
+
+_template_names = {}
+
+def template_names(template):
+    """Return the set of global names referenced by a compiled Kid template.
+
+    This includes the names used by the templates it extends. Attribute
+    names are contained as well, so that the result may be too large.
+
+    """
+    names = _template_names.get(template)
+    if names is None:
+        names = set()
+        codes = []
+        for cls in template.__mro__:
+            if cls.__module__.split('.', 1)[0] == 'kid':
+                continue
+            for item in cls.__dict__.itervalues():
+                code = getattr(item, 'func_code', None)
+                if code is not None:
+                    codes.append(code)
+        while codes:
+            code = codes.pop()
+            names.update(code.co_names)
+            for const in code.co_consts:
+                if isinstance(const, type(code)):
+                    codes.append(const)
+        _template_names[template] = names
+    return names
+
+_uses_stdvars = {}
+
+def uses_stdvars(template):
+    """Check whether a compiled Kid template uses the standard variables.
+
+    These are tg (and the deprecated std) and the variables added by
+    the root_variable_providers, which depend on the current request.
+    The result is remembered per template until the providers change.
+
+    """
+    providers = tuple(view.root_variable_providers)
+    try:
+        key, result = _uses_stdvars[template]
+    except KeyError:
+        key = None
+    if key != providers:
+        names = template_names(template)
+        result = 'tg' in names or 'std' in names
+        if not result and providers:
+            root_vars = dict()
+            for provider in providers:
+                provider(root_vars)
+            for name in root_vars:
+                if name in names:
+                    result = True
+                    break
+        _uses_stdvars[template] = providers, result
+    return result
+
+
+def record_events(stream):
+    """Record the events of an element stream in a list.
+
+    Instead of the elements, only their tag, attributes and (for comments and
+    processing instructions) text are kept, since elements can be modified
+    by templates which expand them.
+
+    """
+    events = []
+    for ev, item in stream:
+        if ev == START:
+            if item.tag in (Comment, ProcessingInstruction):
+                text = item.text
+            else:
+                text = None
+            item = item.tag, item.attrib.items(), text
+        elif ev == END:
+            item = None
+        events.append((ev, item))
+    return events
+
+def replay_events(events):
+    """Generate the events recorded with record_events with new elements."""
+    stack = []
+    for ev, item in events:
+        if ev == START:
+            tag, attrib, text = item
+            item = Element(tag, dict(attrib))
+            if text is not None:
+                item.text = text
+            stack.append(item)
+        elif ev == END:
+            item = stack.pop()
+        yield ev, item
+
+
+class Fragment(ElementStream):
+    """The recorded output of a cacheable widget.
+
+    The output of the widget template is recorded once as a list of stream
+    events, which is replayed whenever the fragment is embedded in a Kid
+    template, without running the template again. The serialized form of the
+    fragment in the various output formats is cached as well and returned by
+    render.
+
+    """
+
+    def __init__(self, key, events):
+        ElementStream.__init__(self, replay_events(events))
+        self.key = key
+        self.events = events
+
+    def serialize(self, format="html"):
+        """Return the serialized fragment in the given output format."""
+        cache = get_fragment_cache()
+        key = self.key, format
+        output = cache.get(key)
+        if output is None:
+            t = PlainHTML(elements=ElementStream(replay_events(self.events)))
+            output = t.serialize(output=format, fragment=True)
+            cache.set(key, output)
+        return output
+
+
 #############################################################################
 # Widgets base classes                                                      #
 #############################################################################
@@ -106,6 +281,14 @@ class Widget(object):
                 overridal. Read on...
     params_doc: A dictionary containing 'params' names as keys and their
                 docstring as value. For documentation at the widget browser.
+    cacheable : If True, the output of the widget is cached and reused for
+                all display calls with the same template parameters. Only
+                widgets whose parameters are plain values (strings, numbers,
+                lists, dicts, ...) can be cached, widgets getting callables
+                or other objects are always rendered. The same holds for
+                widgets whose template uses the standard variables (tg),
+                since these depend on the request. Can be overridden at
+                __init__ and at display time like the params.
 
     All initialization parameters listed at the class attribute "params" can be
     defined as class attributes, overriden at __init__ or at display time. They
@@ -137,6 +320,7 @@ class Widget(object):
     javascript = []
     params = []
     params_doc = {}
+    cacheable = False
 
     def __init__(self, name=None, template=None, default=None, **params):
         """Widget initialization.
@@ -181,6 +365,9 @@ class Widget(object):
         if default is not None:
             self.default = default
 
+        if 'cacheable' in params:
+            self.cacheable = params.pop('cacheable')
+
         # logic for managing the params attribute
         for param in self.__class__.params:
             if param in params:
@@ -258,21 +445,38 @@ class Widget(object):
             warnings.warn("Widget instance '%r' has no template defined" % self)
             return None
 
-        # logic for managing the params attribute
-        for param in self.__class__.params:
-            if param in params:
-                param_value = params[param]
+        cacheable = params.pop('cacheable', self.cacheable)
+        # set by render to get serialized output
+        serialize = params.pop('_serialize', None)
+        # set by widgets which are rendered lazily while the page is streamed
+        stream = params.pop('_stream', False)
+
+        # logic for managing the params attribute: the instance values of
+        # the params are sorted once, since the widget cannot be modified
+        # after its first display
+        plan = self.__dict__.get('_display_plan')
+        if plan is None:
+            plan = ParamPlan(self)
+            if self._locked:
+                self.__dict__['_display_plan'] = plan
+        overrides = params
+        params = plan.constants.copy()
+        for param, param_value in plan.callables:
+            if param not in overrides:
+                params[param] = copy_if_mutable(param_value())
+        for param, param_value in plan.mutables:
+            if param not in overrides:
+                # make sure we don't pass a reference to mutables
+                params[param] = copy_if_mutable(param_value)
+        params_set = self.__class__._params_set
+        for param, param_value in overrides.iteritems():
+            if param in params_set:
+                # the param has been overridden (passed as a keyword
+                # argument inside **params)
                 if callable(param_value):
                     param_value = param_value()
-
-            else:
-                # if the param hasn't been overridden (passed as a keyword
-                # argument inside **params) put the corresponding instance
-                # value inside params.
-                param_value = getattr(self, param, None)
-
-            # make sure we don't pass a reference to mutables
-            params[param] = copy_if_mutable(param_value)
+                param_value = copy_if_mutable(param_value)
+            params[param] = param_value
 
         if not params.get('name'):
             params['name'] = self.name
@@ -281,10 +485,12 @@ class Widget(object):
         params['value'] = to_unicode(self.adjust_value(value, **params))
         self.update_params(params)
         # update_data has been deprecated
-        self.update_data(params)
+        if self._custom_update_data:
+            self.update_data(params)
 
         try:
-            transform = view.engines['kid'].transform
+            engine = view.engines['kid']
+            transform = engine.transform
 
         except (KeyError, AttributeError):
             # this can happen if you render a widget before application startup
@@ -292,15 +498,60 @@ class Widget(object):
             raise RuntimeError("Trying to render a widget,"
                 " but Kid templating engine is not yet loaded.")
 
+        if cacheable and not uses_stdvars(self.template_c):
+            try:
+                key = (self._declaration_counter, str(get_locale()),
+                    freeze_params(params))
+            except TypeError:
+                pass
+            else:
+                cache = get_fragment_cache()
+                events = cache.get(key)
+                if events is None:
+                    events = record_events(
+                        self._template(engine, params).transform())
+                    cache.set(key, events)
+                fragment = Fragment(key, events)
+                if serialize:
+                    return fragment.serialize(serialize)
+                return fragment
+
+        if serialize:
+            # serialize the template output as it is generated, without
+            # building an element tree first
+            return self._template(engine, params).serialize(
+                output=serialize, fragment=True)
+        if stream:
+            # the template is run while the enclosing template is serialized
+            return self._template(engine, params).transform()
         return transform(params, self.template_c)
 
+    def _template(self, engine, params):
+        """Return an instance of the widget template.
+
+        The template gets the standard variables like tg and runs the i18n
+        filter if configured, exactly as with engine.transform.
+
+        """
+        return view.kid_template(engine, self.template_c, params)
+
     def render(self, value=None, format="html", **params):
         """Exactly the same as display() but return serialized output instead.
 
         Useful for debugging or to display the widget in a non-Kid template
-        like Cheetah, STAN, ...
+        like Cheetah, STAN, ... In Genshi templates, the output rendered with
+        format="xhtml" can be embedded as Markup().
+
+        If display is not overridden (or only by methods passing all params
+        on unchanged, marked with a true forwards_params attribute), the
+        template output is serialized as it is generated, without building
+        an element tree first.
 
         """
+        display = self.__class__.display.im_func
+        if display is Widget.display.im_func \
+                or getattr(display, 'forwards_params', False):
+            return self.display(value, _serialize=format, **params) or ''
         elem = self.display(value, **params)
         t = PlainHTML(elements=elem)
         return t.serialize(output=format, fragment=True)
@@ -386,6 +637,7 @@ class CompoundWidget(Widget):
         for member in self.__class__.member_widgets:
             params[member] = getattr(self, member, None)
         return super(CompoundWidget, self).display(value, **params)
+    display.forwards_params = True
 
     def update_params(self, d):
         super(CompoundWidget, self).update_params(d)
@@ -1,7 +1,12 @@
 import itertools
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
 from datetime import datetime
 
-from turbogears import validators, expose
+from turbogears import validators, expose, config
+from turbogears.util import LRUCache, to_unicode
 from turbojson import jsonify
 from turbogears.widgets.base import CSSLink, JSLink, CSSSource, JSSource, \
                                     Widget, WidgetsList, static, mochikit, \
@@ -14,6 +19,7 @@ from turbogears.widgets.rpc import RPC
 
 __all__ = ["CalendarDatePicker", "CalendarDateTimePicker",
     "AutoCompleteField", "AutoCompleteTextField",
+    "PrefixIndex", "AutoCompleteController",
     "LinkRemoteFunction", "RemoteForm", "AjaxGrid", "URLLink"]
 
 
@@ -272,6 +278,237 @@ class AutoCompleteTextFieldDesc(CoreWD):
         return dict(states=states)
 
 
+class PrefixIndex(object):
+    """In-memory index completing search strings by their prefix.
+
+    Can be used to answer the search requests of autocomplete widgets
+    without querying the database on every keystroke. The entries are
+    strings (as expected by AutoCompleteTextField) or (text, value) tuples
+    (as expected by AutoCompleteField). They are kept in an array sorted by
+    their lower-cased text, so that the entries starting with a prefix are
+    found by binary search.
+
+    The source of the entries is an iterable or a callable returning an
+    iterable, which is called when the index is searched for the first time
+    and whenever it is refreshed. If ttl is set, the index is refreshed when
+    it is searched more than ttl seconds after the last refresh; in the
+    meantime other threads keep using the old entries. Single entries can
+    be added and removed without rebuilding the index.
+
+    At most limit entries are returned per search (default: the
+    autocomplete.limit setting or 20, 0 for no limit). The results of the
+    last cache_size searches are cached (default: the
+    autocomplete.cache.size setting or 1000).
+
+    """
+
+    _max_char = unichr(sys.maxunicode)
+
+    def __init__(self, source=(), limit=None, ttl=None, cache_size=None,
+            ignore_case=True):
+        self.source = source
+        self.limit = limit
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.ignore_case = ignore_case
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # the sorted entries and the cache of the searches in these entries,
+        # replaced together so that searches never see a stale cache
+        self._state = None
+        self.refreshed = None
+
+    def from_sqlobject(cls, so_class, column, value_column=None, **kw):
+        """Create an index of the values of a column of an SQLObject class.
+
+        If value_column is given, the entries are (text, value) tuples of
+        the values of both columns, e.g. the names and ids of the rows.
+        Only the columns are queried, not the complete rows.
+
+        """
+        def source():
+            from sqlobject.sqlbuilder import Select
+            columns = [getattr(so_class.q, column)]
+            if value_column:
+                columns.append(getattr(so_class.q, value_column))
+            connection = so_class._connection
+            return connection.queryAll(connection.sqlrepr(Select(columns)))
+        return cls(source, **kw)
+    from_sqlobject = classmethod(from_sqlobject)
+
+    def from_sqlalchemy(cls, column, value_column=None, session=None, **kw):
+        """Create an index of the values of an SQLAlchemy column.
+
+        The column can be a table column (or a mapped class attribute with
+        SQLAlchemy 0.5). If value_column is given, the entries are
+        (text, value) tuples of the values of both columns. The columns are
+        selected with the given session or with the bound metadata.
+
+        """
+        def source():
+            from sqlalchemy import select
+            columns = [column]
+            if value_column is not None:
+                columns.append(value_column)
+            if session is None:
+                return select(columns).execute()
+            return session.execute(select(columns))
+        return cls(source, **kw)
+    from_sqlalchemy = classmethod(from_sqlalchemy)
+
+    def __len__(self):
+        return len(self._state and self._state[0] or ())
+
+    def _key(self, text):
+        """Return the key under which a text is indexed."""
+        text = to_unicode(text)
+        if self.ignore_case:
+            text = text.lower()
+        return text
+
+    def _entry(self, row):
+        """Turn a row of the source into a (key, entry) pair."""
+        if isinstance(row, basestring):
+            text = row = to_unicode(row)
+        else:
+            row = tuple(row)
+            text = row[0]
+            if text is None:
+                return None
+            text = to_unicode(text)
+            if len(row) == 1:
+                row = text
+            else:
+                row = (text,) + row[1:]
+        return self._key(text), row
+
+    def refresh(self):
+        """Reload all entries from the source."""
+        self._refresh_lock.acquire()
+        try:
+            self._reload()
+        finally:
+            self._refresh_lock.release()
+
+    def _reload(self):
+        source = self.source
+        if callable(source):
+            source = source()
+        entries = [entry for entry in itertools.imap(self._entry, source)
+            if entry is not None]
+        entries.sort()
+        self._lock.acquire()
+        try:
+            self.refreshed = time.time()
+            self._state = entries, self._new_cache()
+        finally:
+            self._lock.release()
+
+    def _new_cache(self):
+        """Create an empty cache for the search results."""
+        # the setting is only read when the index is used
+        cache_size = self.cache_size
+        if cache_size is None:
+            cache_size = config.get("autocomplete.cache.size", 1000)
+        return LRUCache(cache_size)
+
+    def _check_fresh(self):
+        """Load the entries or reload them if they are too old."""
+        if self._state is None:
+            self._refresh_lock.acquire()
+            try:
+                if self._state is None:
+                    self._reload()
+            finally:
+                self._refresh_lock.release()
+        elif self.ttl is not None and time.time() > self.refreshed + self.ttl:
+            # only one thread reloads the entries
+            if self._refresh_lock.acquire(False):
+                try:
+                    self._reload()
+                finally:
+                    self._refresh_lock.release()
+
+    def _modify(self, modify):
+        """Modify a copy of the entries, so that searches are not disturbed."""
+        self._lock.acquire()
+        try:
+            if self._state is not None:
+                entries = self._state[0][:]
+                modify(entries)
+                self._state = entries, self._new_cache()
+        finally:
+            self._lock.release()
+
+    def add(self, row):
+        """Add an entry to the index.
+
+        Entries are only added to an index which has already been loaded,
+        since the source is expected to contain them as well.
+
+        """
+        entry = self._entry(row)
+        if entry is not None:
+            self._modify(lambda entries: insort(entries, entry))
+
+    def remove(self, row):
+        """Remove an entry from the index if it is contained."""
+        entry = self._entry(row)
+        if entry is not None:
+            def remove(entries):
+                i = bisect_left(entries, entry)
+                if i < len(entries) and entries[i] == entry:
+                    del entries[i]
+            self._modify(remove)
+
+    def search(self, prefix, limit=None):
+        """Return the entries whose text starts with the given prefix."""
+        self._check_fresh()
+        if limit is None:
+            limit = self.limit
+            if limit is None:
+                limit = config.get("autocomplete.limit", 20)
+        key = self._key(prefix or '')
+        entries, cache = self._state
+        results = cache.get((key, limit))
+        if results is None:
+            start = bisect_left(entries, (key,))
+            end = bisect_left(entries, (key + self._max_char,), start)
+            if limit and end > start + limit:
+                end = start + limit
+            results = [entry[1] for entry in entries[start:end]]
+            cache.set((key, limit), results)
+        return results[:]
+
+
+class AutoCompleteController(object):
+    """Mixin for controllers answering the searches of autocomplete widgets.
+
+    The complete method searches the PrefixIndex set as completion_index
+    for the search_param of the request and returns the results under the
+    result_name, as expected by AutoCompleteField and AutoCompleteTextField
+    with the same search_param and result_name::
+
+        class EmployeeController(controllers.Controller,
+                AutoCompleteController):
+            completion_index = PrefixIndex.from_sqlobject(
+                Employee, 'name', 'id', ttl=600)
+
+        employee = AutoCompleteField('employee',
+            search_controller='/employees/complete')
+
+    """
+
+    completion_index = None
+    search_param = AutoComplete.search_param
+    result_name = AutoComplete.result_name
+
+    [expose(format="json")]
+    def complete(self, **kw):
+        results = self.completion_index.search(kw.get(self.search_param))
+        return {self.result_name: results}
+
+
 class LinkRemoteFunction(RPC):
     """Link with remote execution.
 
@@ -4,8 +4,11 @@ See also: http://trac.turbogears.org/turbogears/wiki/DataGridWidget
 
 """
 
+from cherrypy import request
+from kid.parser import START, END, TEXT
+from kid.template_util import generate_content, make_attrib
 from turbogears.widgets import Widget, CSSLink, static
-from turbogears.widgets.base import CoreWD
+from turbogears.widgets.base import CoreWD, Element
 
 NoDefault = object()
 
@@ -24,17 +27,37 @@ class DataGrid(Widget):
     You can specify columns' data statically, via fields ctor parameter, or
     dynamically, by via 'fields' key.
 
+    The value can be any iterable of rows, including iterators, SQL result
+    proxies, SQLObject select results and SQLAlchemy queries, which are
+    iterated only once and without fetching all rows in advance. The cells
+    of the rows are generated by a row formatter which is compiled once per
+    set of columns, unless get_field_getter has been overridden. Templates
+    get the stream of the rows by calling rows().
+
+    When the page is rendered with expose(stream=True), display returns a
+    stream of the rows instead of an element tree, so that the rows are
+    fetched, rendered and sent to the client one after the other. This can
+    be forced or prevented by setting the stream param to True or False.
+    If stream is True, SQLAlchemy queries are also fetched in batches
+    (see paginate.stream_rows), which must not be used for queries with
+    eagerly loaded collections.
+
     """
     css = [CSSLink(static, "grid.css")]
     template = "turbogears.widgets.templates.datagrid"
+    params = ["stream"]
+    params_doc = {'stream': 'Whether the rows are rendered while the page is'
+        ' sent (default: only if the page is exposed with stream=True)'}
     fields = None
+    stream = None
 
     class Column:
         """Simple struct that describes single DataGrid column.
 
         Column has:
           - a name, which allows to uniquely identify column in a DataGrid
-          - getter, which is used to extract field's value
+          - getter, which is used to extract field's value (an attribute
+            name, an index or a function)
           - title, which is displayed in the table's header
           - options, which is a way to carry arbitrary user-defined data
 
@@ -42,7 +65,9 @@ class DataGrid(Widget):
         def __init__(self, name, getter=None, title=None, options=None):
             if not name:
                 raise ValueError, 'name is required'
-            if getter:
+            if isinstance(getter, (int, long)):
+                self.getter = DataGrid.itemwrapper(getter)
+            elif getter:
                 if callable(getter):
                     self.getter = getter
                 else: # assume it's an attribute name
@@ -60,6 +85,20 @@ class DataGrid(Widget):
             return default
         def get_field(self, row):
             return self.getter(row)
+        def compile_getter(self):
+            """Return the fastest function to extract the field's value."""
+            if self.__class__.get_field.im_func is not \
+                    DataGrid.Column.get_field.im_func:
+                return self.get_field
+            getter = self.getter
+            if isinstance(getter, DataGrid.attrwrapper):
+                name = getter.name
+                if '.' not in name:
+                    return lambda row: getattr(row, name)
+            elif isinstance(getter, DataGrid.itemwrapper):
+                index = getter.index
+                return lambda row: row[index]
+            return getter
         def __str__(self):
             return "<DataGrid.Column %s>" % self.name
 
@@ -78,6 +117,17 @@ class DataGrid(Widget):
                 obj = getattr(obj, name)
             return obj
 
+    class itemwrapper:
+        """Helper class that returns an item of a sequence when called.
+
+        This allows to access the fields of tuples or result rows by index.
+
+        """
+        def __init__(self, index):
+            self.index = index
+        def __call__(self, row):
+            return row[self.index]
+
     def __init__(self, fields=None, **kw):
         super(DataGrid, self).__init__(**kw)
         if fields:
@@ -111,15 +161,100 @@ class DataGrid(Widget):
         return _get_field
     get_field_getter = staticmethod(get_field_getter)
 
+    def get_row_formatter(columns):
+        """Return a function returning the list of fields of a row.
+
+        The getters of the columns are looked up once, so that formatting
+        a row needs just one call per field.
+
+        """
+        getters = [col.compile_getter() for col in columns]
+        return lambda row: [getter(row) for getter in getters]
+    get_row_formatter = staticmethod(get_row_formatter)
+
+    def iter_rows(value, batched=False):
+        """Return an iterator over the rows given as value.
+
+        Rows of SQLObject select results are fetched lazily instead of being
+        loaded all at once. SQLAlchemy queries are fetched in batches only
+        if batched is true, since this is not possible for queries with
+        eagerly loaded collections.
+
+        """
+        if value is None:
+            return iter(())
+        if hasattr(value, 'lazyIter'):
+            return value.lazyIter()
+        if batched:
+            from turbogears.paginate import stream_rows
+            return stream_rows(value)
+        return iter(value)
+    iter_rows = staticmethod(iter_rows)
+
+    def generate_rows(self, rows, columns, format_row, encoding=None,
+            batched=False):
+        """Generate the stream events of the table rows.
+
+        This produces the same output as the loop over the rows in the
+        datagrid template, without running the template code for every cell.
+
+        """
+        attribs = [make_attrib({u'align': [col.get_option('align', None)]},
+            encoding) for col in columns]
+        row_attribs = {u'class': u'even'}, {u'class': u'odd'}
+        for i, row in enumerate(self.iter_rows(rows, batched)):
+            tr = Element(u'tr', row_attribs[i % 2])
+            yield START, tr
+            yield TEXT, u'\n    '
+            for attrib, field in zip(attribs, format_row(row)):
+                td = Element(u'td', attrib)
+                yield START, td
+                if isinstance(field, basestring):
+                    yield TEXT, field
+                else:
+                    for event in generate_content(field):
+                        yield event
+                yield END, td
+            yield TEXT, u'\n  '
+            yield END, tr
+
+    def display(self, value=None, **params):
+        stream = params.get('stream', self.stream)
+        if stream is None:
+            stream = getattr(request, 'tg_stream', False)
+        if stream:
+            params['_stream'] = True
+        return super(DataGrid, self).display(value, **params)
+    display.forwards_params = True
+
     def update_params(self, d):
         super(DataGrid, self).update_params(d)
         if d.get('fields'):
             fields = d.pop('fields')
             columns = self._parse(fields)
+            format_row = self.get_row_formatter(columns)
         else:
             columns = self.columns[:]
+            formatter = self.__dict__.get('_formatter')
+            if formatter is None or formatter[0] != columns:
+                # the columns may only change before the first display
+                formatter = columns, self.get_row_formatter(columns)
+                self.__dict__['_formatter'] = formatter
+            format_row = formatter[1]
+        get_field = self.get_field_getter(columns)
+        if getattr(self.get_field_getter, 'im_func',
+                self.get_field_getter) is not DataGrid.get_field_getter:
+            # the field getter has been overridden, so we must use it
+            names = [col.name for col in columns]
+            format_row = lambda row: [get_field(row, name) for name in names]
         d['columns'] = columns
-        d['get_field'] = self.get_field_getter(columns)
+        d['get_field'] = get_field
+        d['format_row'] = format_row
+        # the stream of the rows is only created if the template uses it
+        value, encoding = d['value'], d.get('assume_encoding')
+        batched = d.get('stream') is True
+        d['rows'] = lambda: self.generate_rows(value, columns, format_row,
+            encoding, batched)
         # this is for backward compatibility
         d['headers'] = [col.title for col in columns]
         d['collist'] = [col.name for col in columns]
@@ -128,7 +263,7 @@ class DataGrid(Widget):
         """Parse field specifications into a list of Columns.
 
         A specification can be a DataGrid.Column, an accessor
-        (attribute name or function), a tuple (title, accessor)
+        (attribute name, index or function), a tuple (title, accessor)
         or a tuple (title, accessor, options).
 
         """
@@ -136,7 +271,7 @@ class DataGrid(Widget):
         names = {} # keep track of names to ensure there are no dups
         for n, col in enumerate(fields):
             if not isinstance(col, self.Column):
-                if isinstance(col, str) or callable(col):
+                if isinstance(col, (str, int, long)) or callable(col):
                     name_or_f = col
                     title = options = None
                 else:
@@ -3,6 +3,7 @@ from turbogears import validators, expose
 from turbogears.util import setlike, Bunch, request_available
 from turbogears.widgets.base import Widget, CompoundWidget, WidgetsList, \
                                     CoreWD, RenderOnlyWD
+from turbogears.widgets.meta import param_prefix
 
 try:
     set
@@ -239,6 +240,7 @@ class InputWidget(Widget):
     def display(self, value=None, **params):
         return super(InputWidget, self).display(value, **params)
     display = update_path(display)
+    display.forwards_params = True
 
     def _get_fq_name(self):
         return build_name_from_path(self.name_path)
@@ -727,6 +729,7 @@ class FileField(FormField):
 
     def display(self, value=None, **params):
         return super(FileField, self).display(None, **params)
+    display.forwards_params = True
 
 
 class FileFieldDesc(CoreWD):
@@ -909,6 +912,11 @@ class SelectionField(FormField):
 
     def __init__(self, *args, **kw):
         super(SelectionField, self).__init__(*args, **kw)
+        options = getattr(self, param_prefix + 'options')
+        if hasattr(options, 'next'):
+            # an iterator like a generator can be consumed only once,
+            # use a callable returning the options as lazy option source
+            self.options = list(options)
         if not self.validator:
             try:
                 self.validator = self._guess_validator()
@@ -936,7 +944,15 @@ class SelectionField(FormField):
                 % (sample_option,))
 
     def _get_sample_option(self):
-        options = self._extend_options(self.options)
+        options = self.options
+        if not isinstance(options, (list, tuple)):
+            # take only the first option from a lazy option source
+            for option in options:
+                options = [option]
+                break
+            else:
+                options = []
+        options = self._extend_options(options)
         if options:
             if isinstance(options[0][1], list):
                 sample = options[0][1][0]
@@ -954,37 +970,107 @@ class SelectionField(FormField):
             return new_opts
         return opts
 
-    def update_params(self, d):
-        super(SelectionField, self).update_params(d)
-        grouped_options = []
-        options = []
-        d['options'] = self._extend_options(d['options'])
-        for optgroup in d["options"]:
+    def _normalize_options(self, opts):
+        """Return the flat list of options and the positions of the groups.
+
+        The options in the flat list are (value, desc, attrs) tuples, the
+        groups are (label, start, end) tuples referring to the flat list.
+
+        """
+        flat, groups = [], []
+        for optgroup in self._extend_options(opts):
             if isinstance(optgroup[1], list):
-                group = True
-                optlist = optgroup[1][:]
+                optlist = optgroup[1]
+                groups.append((optgroup[0], len(flat), len(flat) + len(optlist)))
             else:
-                group = False
                 optlist = [optgroup]
-            for i, option in enumerate(optlist):
-                if len(option) is 2:
-                    option_attrs = {}
-                elif len(option) is 3:
+            for option in optlist:
+                if len(option) == 3:
                     option_attrs = dict(option[2])
-                if self._is_option_selected(option[0], d['value']):
-                    option_attrs[self._selected_verb] = self._selected_verb
-                optlist[i] = (option[0], option[1], option_attrs)
-            options.extend(optlist)
-            if group:
-                grouped_options.append((optgroup[0], optlist))
+                else:
+                    option_attrs = {}
+                flat.append((option[0], option[1], option_attrs))
+        return flat, groups
+
+    def _get_normalized_options(self, opts):
+        """Return the normalized options, cached if they are static.
+
+        The options are static if they are the options of the widget itself,
+        not passed to display or created by an options callable. Any other
+        iterable (like a database query, or a generator passed to display)
+        can be used as option source as well; it is iterated only once.
+
+        """
+        if not isinstance(opts, (list, tuple)):
+            return self._normalize_options(list(opts))
+        static = getattr(self, param_prefix + 'options', None)
+        if opts is not static and (not isinstance(static, (list, tuple))
+                or len(opts) != len(static) or [opt
+                    for opt, static_opt in zip(opts, static)
+                    if opt is not static_opt]):
+            return self._normalize_options(opts)
+        cached = self.__dict__.get('_options_cache')
+        if cached is None or cached[0] is not static:
+            cached = static, self._normalize_options(static)
+            self.__dict__['_options_cache'] = cached
+        return cached[1]
+
+    def update_params(self, d):
+        super(SelectionField, self).update_params(d)
+        flat, groups = self._get_normalized_options(d['options'])
+        selected_verb = self._selected_verb
+        options = []
+        if self.__class__._is_option_selected.im_func is \
+                SelectionField._is_option_selected.im_func:
+            selected = self._get_selected_values(d['value'])
+            for option_value, desc, option_attrs in flat:
+                option_attrs = option_attrs.copy()
+                try:
+                    is_selected = option_value in selected
+                except TypeError: # unhashable option value
+                    is_selected = option_value in list(selected)
+                if is_selected:
+                    option_attrs[selected_verb] = selected_verb
+                options.append((option_value, desc, option_attrs))
+        else:
+            # _is_option_selected has been overridden
+            value = d['value']
+            for option_value, desc, option_attrs in flat:
+                option_attrs = option_attrs.copy()
+                if self._is_option_selected(option_value, value):
+                    option_attrs[selected_verb] = selected_verb
+                options.append((option_value, desc, option_attrs))
         # options provides a list of *flat* options leaving out any eventual
         # group, useful for backward compatibility and simpler widgets
         d["options"] = options
-        if grouped_options:
-            d["grouped_options"] = grouped_options
+        if groups:
+            d["grouped_options"] = [(group, options[start:end])
+                for group, start, end in groups]
         else:
             d["grouped_options"] = [(None, options)]
 
+    def _get_selected_values(self, value):
+        """Return the selected option values as a set if possible.
+
+        The value is converted only once, not for every option as done by
+        _is_option_selected, which gives the same result.
+
+        """
+        try:
+            value = self.validator.to_python(value)
+        except validators.Invalid:
+            return ()
+        if value is None:
+            return ()
+        if not self._multiple_selection:
+            value = [value]
+        elif not isinstance(value, (list, tuple)):
+            return value
+        try:
+            return set(value)
+        except TypeError: # unhashable values
+            return value
+
     def _is_option_selected(self, option_value, value):
         try:
             value = self.validator.to_python(value)
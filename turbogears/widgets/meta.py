@@ -17,7 +17,7 @@ try:
 except NameError: # Python 2.3
     from sets import Set as set
 
-__all__ = ["MetaWidget", "load_kid_template"]
+__all__ = ["MetaWidget", "ParamPlan", "load_kid_template"]
 
 param_prefix = '_param_'
 
@@ -72,6 +72,12 @@ class MetaWidget(type):
             params_doc.update(getattr(base, 'params_doc', {}))
         params_doc.update(dct.get('params_doc', {}))
         dct['params_doc'] = params_doc
+        # Remember whether the deprecated update_data needs to be called
+        custom_update_data = 'update_data' in dct and name != "Widget"
+        for base in bases:
+            if getattr(base, '_custom_update_data', False):
+                custom_update_data = True
+        dct['_custom_update_data'] = custom_update_data
         return super(MetaWidget, cls).__new__(cls, name, bases, dct)
 
     def __init__(cls, name, bases, dct):
@@ -84,6 +90,9 @@ class MetaWidget(type):
             (cls.template_c,
              cls.template) = load_kid_template(cls.template, modname)
         cls._locked = False
+        cls._params_set = set(cls.params)
+        cls._descriptor_params = set([param for param in cls.params
+            if isinstance(_class_attribute(cls, param), ParamDescriptor)])
 
 #############################################################################
 # Method decorators and other MetaWidget helpers                            #
@@ -107,6 +116,41 @@ class ParamDescriptor(object):
     def __set__(self, obj, value):
         setattr(obj, self.param_name, value)
 
+def _class_attribute(cls, name):
+    """Get a class attribute without invoking descriptors."""
+    for base in cls.__mro__:
+        if name in base.__dict__:
+            return base.__dict__[name]
+
+
+class ParamPlan(object):
+    """Precomputed handling of the params of a widget instance on display.
+
+    The params are sorted into immutable constants which can be passed to
+    the template as they are, callables which have to be called and mutable
+    values which have to be copied on every display.
+
+    """
+    __slots__ = ['constants', 'callables', 'mutables']
+
+    def __init__(self, widget):
+        cls = widget.__class__
+        self.constants = {}
+        self.callables = []
+        self.mutables = []
+        for param in cls.params:
+            if param in cls._descriptor_params:
+                value = getattr(widget, param_prefix + param)
+                if callable(value):
+                    self.callables.append((param, value))
+                    continue
+            else:
+                value = getattr(widget, param, None)
+            if isinstance(value, (dict, list)):
+                self.mutables.append((param, value))
+            else:
+                self.constants[param] = value
+
 def lockwidget(self, *args, **kw):
     """Set this widget as locked the first time it's displayed."""
     gotlock = self._displaylock.acquire(False)
@@ -112,3 +112,82 @@ class TestDataGrid:
             (44, "Pablo Martelli", "Brazil")]
         output = grid.render(data)
         assert '<td>Joe Doe</td><td>Great Britain</td><td>23</td>' in output
+
+    def test_item_columns(self):
+        """Test accessing the fields of rows by index."""
+        grid = DataGrid(fields=[('Name', 1), DataGrid.Column('age', 0), 2])
+        assert grid['column-0'].getter.index == 1
+        output = grid.render([(33, "Anton Bykov", "Bulgaria")])
+        assert '<td>Anton Bykov</td><td>33</td><td>Bulgaria</td>' in output
+
+    def test_row_formatter(self):
+        """Test the compiled row formatter."""
+        columns = DataGrid(fields=[('Name', 'name'), ('Text', 'excerpt'),
+            ('Sub', lambda row: row.subtype.upper()),
+            ('Len', 'name.__len__')]).columns
+        format_row = DataGrid.get_row_formatter(columns)
+        row = Foo('spa1', 'fact', 'thetext')
+        fields = format_row(row)
+        assert fields[:3] == ['spa1', 'thetext...', 'FACT']
+        assert fields[3]() == 4
+
+    def test_field_getter_override(self):
+        """Test that an overridden field getter is used for the rows."""
+        class UpperGrid(DataGrid):
+            def get_field_getter(self, columns):
+                get_field = DataGrid.get_field_getter(columns)
+                return lambda row, col: get_field(row, col).upper()
+        grid = UpperGrid(fields=[('Name', 1), ('Country', 2)])
+        output = grid.render([(33, "Anton Bykov", "Bulgaria")])
+        assert '<td>ANTON BYKOV</td><td>BULGARIA</td>' in output
+
+    def test_iterator_value(self):
+        """Test that rows can be given as iterator and are not copied."""
+        grid = DataGrid(fields=[('ID', 'userId'), ('Name', 'displayName')])
+        users = [User(1, 'john', 'john@foo.net'),
+            User(2, 'fred', 'fred@foo.net')]
+        output = grid.render(iter(users))
+        assert '<tr class="even">\n    <td>1</td><td>John</td>\n  </tr>' \
+            '<tr class="odd">\n    <td>2</td><td>Fred</td>\n  </tr>' in output
+        class SelectResults(object):
+            def __iter__(self):
+                assert False, "all rows fetched"
+            def lazyIter(self):
+                return iter(users)
+        assert grid.render(SelectResults()) == output
+        assert '<td>' not in grid.render(None)
+
+    def test_stream(self):
+        """Test that the rows are only fetched when the output is streamed."""
+        grid = DataGrid(fields=[('ID', 'userId'), ('Name', 'displayName')])
+        fetched = []
+        def users():
+            for n, name in enumerate(['john', 'fred']):
+                fetched.append(name)
+                yield User(n, name, name + '@foo.net')
+        output = grid.display(users(), stream=True)
+        assert not hasattr(output, 'tag')
+        assert not fetched
+        events = iter(output)
+        for ev, item in events:
+            if getattr(item, 'tag', None) == 'td':
+                break
+        assert fetched == ['john']
+        list(events)
+        assert fetched == ['john', 'fred']
+        assert DataGrid(stream=True).stream
+        assert hasattr(grid.display(users()), 'tag')
+
+    def test_batched_rows(self):
+        """Test that SQLAlchemy queries are only batched if streamed."""
+        class Query(list):
+            batched = False
+            def yield_per(self, count):
+                self.batched = True
+                return self
+        grid = DataGrid(fields=[('ID', 'userId'), ('Name', 'displayName')])
+        query = Query([User(1, 'john', 'john@foo.net')])
+        assert '<td>John</td>' in grid.render(query)
+        assert not query.batched
+        assert '<td>John</td>' in grid.render(query, stream=True)
+        assert query.batched
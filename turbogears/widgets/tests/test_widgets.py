@@ -1,9 +1,12 @@
 # coding=utf-8
 import itertools
+import re
+import threading
+import time
 
 import cherrypy
 
-from turbogears import controllers, expose, widgets, validators, view
+from turbogears import config, controllers, expose, widgets, validators, view
 from turbogears.testutil import call, catch_validation_errors
 
 try:
@@ -694,6 +697,47 @@ def test_selectfield_with_with_non_iterable_option_elements():
     assert '<option value="pascal">' in output
 
 
+def test_grouped_options():
+    options = [("Scripting", [(1, "python"), (2, "ruby", {"class": "new"})]),
+        ("Compiled", [(3, "pascal"), (4, "c")])]
+    w = widgets.MultipleSelectField(options=options)
+    output = w.render(value=[2, 3], format='xhtml')
+    assert output.index('<optgroup label="Scripting">') \
+        < output.index('<option value="1">python</option>') \
+        < output.index('<optgroup label="Compiled">') \
+        < output.index('<option selected="selected" value="3">pascal')
+    assert normalize_attributes('<option class="new" selected="selected"'
+        ' value="2">ruby</option>') in normalize_attributes(output)
+    # the static options are only normalized once
+    cached = w._options_cache
+    assert '<option selected="selected" value="4">' in w.render(
+        value=[4], format='xhtml')
+    assert w._options_cache is cached
+    output = w.render(value=[5], options=options + [("Old", [(5, "cobol")])],
+        format='xhtml')
+    assert '<option selected="selected" value="5">cobol</option>' in output
+    assert w._options_cache is cached
+
+def test_lazy_options():
+    def options():
+        for n, name in enumerate(["python", "java", "pascal"]):
+            yield n, name
+    w = widgets.SingleSelectField(options=options)
+    assert isinstance(w.validator, validators.Int)
+    output = w.render(value="1", format='xhtml')
+    assert '<option value="0">python</option>' in output
+    assert '<option selected="selected" value="1">java</option>' in output
+    output = w.render(value=2, options=options(), format='xhtml')
+    assert '<option selected="selected" value="2">pascal</option>' in output
+    # a generator given as options of the widget can be displayed repeatedly
+    w = widgets.SingleSelectField(options=options())
+    assert isinstance(w.validator, validators.Int)
+    for value in 0, 1:
+        output = w.render(value=value, format='xhtml')
+        assert '<option value="2">pascal</option>' in output
+        assert output.count('<option') == 3
+
+
 def test_widget_with_nonascii_characters():
     class MyWidget(widgets.Widget):
         template = """<div>${my_param}</div>"""
@@ -703,3 +747,192 @@ def test_widget_with_nonascii_characters():
     element = MyWidget().display(my_param=my_param)
     assert element.tag == u'div'
     assert element.text == u'é'
+
+def test_param_plan():
+    counter = itertools.count()
+    class PlanWidget(widgets.Widget):
+        template = """<div xmlns:py="http://purl.org/kid/ns#"
+            py:attrs="attrs">${label} ${number}</div>"""
+        params = ["attrs", "label", "number"]
+        attrs = {}
+        label = "label"
+        number = None
+        def update_params(self, d):
+            super(PlanWidget, self).update_params(d)
+            d["attrs"]["class"] = "plan"
+    w = PlanWidget(number=counter.next)
+    for number in range(3):
+        element = w.display()
+        assert element.text == "label %d" % number
+        assert element.get("class") == "plan"
+    assert w.attrs == {} and PlanWidget.attrs == {}
+    plan = w._display_plan
+    assert plan.constants["label"] == "label"
+    assert [param for param, value in plan.callables] == ["number"]
+    assert [param for param, value in plan.mutables] == ["attrs"]
+    element = w.display(label=lambda: "other", number=7, attrs={"id": "x"})
+    assert element.text == "other 7"
+    assert element.get("id") == "x"
+    assert not PlanWidget._custom_update_data
+
+def test_update_data_still_called():
+    class OldWidget(widgets.Widget):
+        template = """<div>${old}</div>"""
+        def update_data(self, d):
+            d["old"] = "updated"
+    class OlderWidget(OldWidget):
+        pass
+    assert OldWidget._custom_update_data and OlderWidget._custom_update_data
+    assert OlderWidget().display().text == "updated"
+
+def normalize_attributes(markup):
+    """Sort the attributes of all tags in the markup."""
+    def sort_attributes(match):
+        attributes = re.findall(r'\s+[\w:]+="[^"]*"', match.group(2))
+        attributes.sort()
+        return "<%s%s%s>" % (match.group(1), ''.join(attributes),
+            match.group(3))
+    return re.sub(r'<(\w+)((?:\s+[\w:]+="[^"]*")*)\s*(/?)>',
+        sort_attributes, markup)
+
+def test_cacheable_widget():
+    options = [(1, "one"), (2, "two"), (3, "three")]
+    cached = widgets.SingleSelectField("number", options=options,
+        cacheable=True)
+    uncached = widgets.SingleSelectField("number", options=options)
+    for value in 1, 1, 2, None:
+        for format in 'xhtml', 'html':
+            assert normalize_attributes(cached.render(value, format=format)) \
+                == normalize_attributes(uncached.render(value, format=format))
+    fragment = cached.display(2)
+    assert isinstance(fragment, widgets.Fragment)
+    assert fragment is not cached.display(2)
+    assert fragment.events is cached.display(2).events
+    assert '<option selected="selected" value="2">' in \
+        normalize_attributes(fragment.serialize('xhtml'))
+    template = widgets.meta.load_kid_template(
+        '<div xmlns:py="http://purl.org/kid/ns#">${w.display(2)}</div>')[0]
+    output = template(w=cached).serialize(output='xhtml', fragment=True)
+    assert normalize_attributes(output) == normalize_attributes(
+        template(w=uncached).serialize(output='xhtml', fragment=True))
+    assert not isinstance(cached.display(2, cacheable=False),
+        widgets.Fragment)
+
+def test_uncacheable_params():
+    class Thing(object):
+        def __unicode__(self):
+            return u"thing"
+    class ThingWidget(widgets.Widget):
+        template = """<div>${thing}</div>"""
+        params = ['thing']
+    w = ThingWidget(thing=Thing(), cacheable=True)
+    element = w.display()
+    assert not isinstance(element, widgets.Fragment)
+    assert element.text == "thing"
+
+def test_uncacheable_template():
+    class URLWidget(widgets.Widget):
+        template = """<a href="${tg.url('/')}">${value}</a>"""
+    w = URLWidget(cacheable=True)
+    element = w.display("home")
+    assert not isinstance(element, widgets.Fragment)
+    assert element.get('href') == '/'
+    assert isinstance(widgets.Label(cacheable=True).display(),
+        widgets.Fragment)
+
+def test_uncacheable_root_variables():
+    calls = []
+    def provider(root_vars):
+        calls.append(1)
+        root_vars['site_name'] = "Site"
+    class SiteWidget(widgets.Widget):
+        template = """<span>${site_name}: ${value}</span>"""
+    view.root_variable_providers.append(provider)
+    try:
+        w = SiteWidget(cacheable=True)
+        element = w.display("a")
+        assert not isinstance(element, widgets.Fragment)
+        assert element.text == "Site: a"
+        del calls[:]
+        for i in range(3):
+            assert widgets.base.uses_stdvars(w.template_c)
+        assert not calls
+    finally:
+        view.root_variable_providers.remove(provider)
+
+def test_render_overridden_display():
+    class Upper(widgets.Label):
+        def display(self, value=None, **params):
+            element = super(Upper, self).display(value, **params)
+            element.text = element.text.upper()
+            return element
+    class NoParams(widgets.Label):
+        def display(self, value=None):
+            return super(NoParams, self).display(value)
+    assert Upper().render("upper") == \
+        '<label id="widget" class="upper">UPPER</label>'
+    assert NoParams().render("plain") == \
+        '<label id="widget" class="noparams">plain</label>'
+    assert widgets.Label().render("fast") == \
+        '<label id="widget" class="label">fast</label>'
+
+def test_template_filter():
+    # render and cacheable widgets do not go through engine.transform
+    from turbogears.i18n import i18n_filter
+    w = widgets.Label()
+    engine = view.engines['kid']
+    assert i18n_filter not in w._template(engine, {})._filters
+    config.update({'i18n.run_template_filter': True})
+    try:
+        assert i18n_filter in w._template(engine, {})._filters
+    finally:
+        config.update({'i18n.run_template_filter': False})
+
+def test_prefix_index():
+    index = widgets.PrefixIndex(["Alice", "alfred", "Bob", "Albert", "al"],
+        limit=3)
+    assert index.search("al") == ["al", "Albert", "alfred"]
+    assert index.search("AL", limit=0) == ["al", "Albert", "alfred", "Alice"]
+    assert index.search("alf") == ["alfred"]
+    assert index.search("c") == []
+    index.add("Alan")
+    index.remove("alfred")
+    index.remove("Carl")
+    assert index.search("al", limit=0) == ["al", "Alan", "Albert", "Alice"]
+    assert len(index) == 5
+
+def test_prefix_index_refresh():
+    rows = [("Anna", 1), ("Andy", 2), (None, 3)]
+    loads = []
+    def source():
+        loads.append(len(rows))
+        return rows
+    index = widgets.PrefixIndex(source, ttl=60)
+    assert not loads
+    assert index.search("an") == [("Andy", 2), ("Anna", 1)]
+    rows.append(("Anton", 4))
+    assert index.search("an") == [("Andy", 2), ("Anna", 1)]
+    index.refreshed -= 61
+    assert index.search("an") == [("Andy", 2), ("Anna", 1), ("Anton", 4)]
+    assert loads == [3, 4]
+
+def test_prefix_index_concurrent_load():
+    def source():
+        time.sleep(0.1)
+        return ["Anna", "Andy"]
+    index = widgets.PrefixIndex(source)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        index.search("an"))) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [["Andy", "Anna"]] * 4
+
+def test_autocomplete_controller():
+    class Root(controllers.RootController, widgets.AutoCompleteController):
+        completion_index = widgets.PrefixIndex(["Alaska", "Alabama", "Texas"])
+        search_param = "state"
+    output = call(Root().complete, state="ala")
+    assert output == dict(textItems=["Alabama", "Alaska"])